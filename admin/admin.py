@@ -1,7 +1,9 @@
 # coding=utf-8
 from django.contrib import admin
 
-from geosafe.models import Metadata, Analysis, AnalysisTaskInfo
+from geosafe.models import Metadata, Analysis, AnalysisTaskInfo, \
+    FilteredAggregation, AnalysisBatch, AnalysisSweep, AnalysisStageTiming, \
+    AnalysisSummary, AnalysisSummaryBreakdown, HTTPClientCounter
 
 
 # Register your models here.
@@ -24,6 +26,9 @@ class AnalysisAdmin(admin.ModelAdmin):
         'extent_option',
         'keep',
         'task_state',
+        'task_stage',
+        'batch',
+        'sweep',
         'report_map',
         'report_table'
     )
@@ -42,6 +47,91 @@ class AnalysisTaskInfoAdmin(admin.ModelAdmin):
     )
 
 
+class FilteredAggregationAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'id',
+        'aggregation_layer',
+        'path',
+        'size',
+        'ref_count',
+        'last_used'
+    )
+
+
+class AnalysisBatchAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'id',
+        'user_title',
+        'hazard_layer',
+        'aggregation_layer',
+        'user',
+        'start_time'
+    )
+
+
+class AnalysisSweepAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'id',
+        'user_title',
+        'exposure_layer',
+        'aggregation_layer',
+        'user',
+        'start_time'
+    )
+
+
+class AnalysisStageTimingAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'analysis',
+        'stage',
+        'start',
+        'duration',
+        'bytes_written',
+        'success'
+    )
+    list_filter = ('stage', 'success')
+
+
+class AnalysisSummaryBreakdownInline(admin.TabularInline):
+
+    model = AnalysisSummaryBreakdown
+    extra = 0
+
+
+class AnalysisSummaryAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'analysis',
+        'hazard_type',
+        'exposure_type',
+        'total',
+        'total_affected'
+    )
+    list_filter = ('hazard_type', 'exposure_type')
+    inlines = [AnalysisSummaryBreakdownInline]
+
+
+class HTTPClientCounterAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'endpoint',
+        'status',
+        'requests',
+        'seconds',
+        'bytes_received'
+    )
+
+
 admin.site.register(Metadata, MetadataAdmin)
 admin.site.register(Analysis, AnalysisAdmin)
 admin.site.register(AnalysisTaskInfo)
+admin.site.register(AnalysisSummary, AnalysisSummaryAdmin)
+admin.site.register(FilteredAggregation, FilteredAggregationAdmin)
+admin.site.register(AnalysisBatch, AnalysisBatchAdmin)
+admin.site.register(AnalysisSweep, AnalysisSweepAdmin)
+admin.site.register(AnalysisStageTiming, AnalysisStageTimingAdmin)
+admin.site.register(HTTPClientCounter, HTTPClientCounterAdmin)
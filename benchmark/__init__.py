@@ -0,0 +1,29 @@
+# coding=utf-8
+"""Tools to load test the GeoSAFE analysis pipeline.
+
+Used by the geosafe_benchmark management command and benchmark tests.
+"""
+from contextlib import contextmanager
+
+from django.db.models.signals import pre_save, post_save
+
+
+@contextmanager
+def mute_signals(*signals):
+    """Temporarily disconnect all receivers of the given model signals.
+
+    Used to quickly create a lot of fixture rows without triggering GeoNode
+    and GeoSAFE signal handlers.
+    """
+    signals = signals or (pre_save, post_save)
+    receivers = {}
+    for signal in signals:
+        receivers[signal] = signal.receivers
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, signal_receivers in receivers.iteritems():
+            signal.receivers = signal_receivers
+            signal.sender_receivers_cache.clear()
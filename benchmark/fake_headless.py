@@ -0,0 +1,216 @@
+# coding=utf-8
+"""Stand-in InaSAFE Headless worker for benchmarks.
+
+It registers the InaSAFE Headless tasks used by GeoSAFE under the same
+names, and returns canned outputs built from the sample layers in
+tasks/tests/data, so the GeoSAFE side of the analysis pipeline can be
+measured without QGIS and InaSAFE.
+
+Run it as a Celery worker on the InaSAFE Headless queue::
+
+    celery worker -A geosafe.benchmark.fake_headless \\
+        -Q inasafe-headless
+
+The worker is configured with environment variables:
+
+- FAKE_HEADLESS_OUTPUT_DIR: directory of impact layers and reports
+- FAKE_HEADLESS_ANALYSIS_DELAY: seconds spent in each run_analysis
+- FAKE_HEADLESS_REPORT_DELAY: seconds spent in each generate_report
+"""
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import urllib
+import urlparse
+
+import django
+
+# Sample keywords are read with GeoSAFE helpers
+django.setup()
+
+from celery import Celery  # noqa
+
+from geosafe.helpers.http_client import http_client  # noqa
+from geosafe.helpers.inasafe_helper import (  # noqa
+    InaSAFETestData,
+    extract_inasafe_keywords_from_metadata,
+    parse_inasafe_keywords)
+from geosafe.helpers.metadata import inasafe_keywords_xml  # noqa
+from geosafe.tasks.headless.analysis import RESULT_SUCCESS  # noqa
+
+LOGGER = logging.getLogger(__name__)
+
+OUTPUT_DIR = os.environ.get(
+    'FAKE_HEADLESS_OUTPUT_DIR',
+    os.path.join(tempfile.gettempdir(), 'fake_headless'))
+ANALYSIS_DELAY = float(os.environ.get('FAKE_HEADLESS_ANALYSIS_DELAY', 0))
+REPORT_DELAY = float(os.environ.get('FAKE_HEADLESS_REPORT_DELAY', 0))
+
+# Sample layers used as impact layer and analysis summary
+DEFAULT_EXPOSURE = 'buildings.geojson'
+ANALYSIS_SUMMARY = InaSAFETestData.aggregation('small_grid.geojson')
+
+# Smallest valid PDF document, used as every report
+CANNED_PDF = (
+    '%PDF-1.1\n'
+    '1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+    '2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n'
+    '3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n'
+    'trailer<</Root 1 0 R>>\n'
+    '%%EOF\n')
+
+app = Celery('fake_headless')
+app.config_from_object('geosafe.tasks.headless.celeryconfig')
+
+
+def sample_layer(layer_uri, category=None):
+    """Find the sample layer a layer was uploaded from.
+
+    GeoNode names a layer after its file, with a numeric suffix if the
+    name is taken.
+
+    :param layer_uri: path or url of the layer
+    :type layer_uri: basestring
+
+    :param category: sample data directory to search, all if None
+    :type category: str
+
+    :return: path of the sample layer file, or None
+    :rtype: str
+    """
+    path = urllib.unquote_plus(urlparse.urlparse(layer_uri or '').path)
+    basename = os.path.splitext(os.path.basename(path))[0]
+    basename = re.sub(r'_\d+$', '', basename)
+    for category_dir in [category] if category else [
+            'hazard', 'exposure', 'aggregation', 'misc']:
+        directory = InaSAFETestData.path_finder(category_dir)
+        for name in sorted(os.listdir(directory)):
+            name_base, ext = os.path.splitext(name)
+            if name_base == basename and ext not in ['.xml', '.qml', '.prj']:
+                return os.path.join(directory, name)
+    return None
+
+
+def new_output_dir():
+    """Create a directory for the outputs of one task.
+
+    :return: directory path
+    :rtype: str
+    """
+    if not os.path.exists(OUTPUT_DIR):
+        try:
+            os.makedirs(OUTPUT_DIR)
+        except OSError:
+            # Created by another worker process
+            pass
+    return tempfile.mkdtemp(dir=OUTPUT_DIR)
+
+
+@app.task(name='inasafe.headless.tasks.get_keywords', queue='inasafe-headless')
+def get_keywords(layer_uri, keyword=None):
+    """Read keywords from layer metadata, or the sample it came from."""
+    parsed_uri = urlparse.urlparse(layer_uri)
+    if parsed_uri.scheme in ['http', 'https']:
+        metadata_xml = http_client.get(layer_uri).content
+    else:
+        path = os.path.splitext(
+            urllib.unquote_plus(parsed_uri.path))[0] + '.xml'
+        if not os.path.exists(path):
+            path = os.path.splitext(sample_layer(layer_uri))[0] + '.xml'
+        with open(path) as f:
+            metadata_xml = f.read()
+
+    keywords = parse_inasafe_keywords(inasafe_keywords_xml(
+        *extract_inasafe_keywords_from_metadata(metadata_xml)))
+    if keyword:
+        return keywords.get(keyword)
+    return keywords
+
+
+@app.task(name='inasafe.headless.tasks.run_analysis', queue='inasafe-headless')
+def run_analysis(
+        hazard_layer_uri,
+        exposure_layer_uri,
+        aggregation_layer_uri=None,
+        crs=None,
+        locale='en_US'):
+    """Return a copy of the exposure sample as impact layer."""
+    start_time = time.time()
+    exposure_path = (
+        sample_layer(exposure_layer_uri, 'exposure') or
+        InaSAFETestData.exposure(DEFAULT_EXPOSURE))
+    exposure_base, ext = os.path.splitext(exposure_path)
+
+    output_dir = new_output_dir()
+    impact_path = os.path.join(output_dir, 'impact_analysis' + ext)
+    shutil.copy(exposure_path, impact_path)
+    if os.path.exists(exposure_base + '.qml'):
+        shutil.copy(
+            exposure_base + '.qml',
+            os.path.join(output_dir, 'impact_analysis.qml'))
+    with open(exposure_base + '.xml') as f:
+        metadata_xml = f.read()
+    metadata_xml = re.sub(
+        r'(<layer_purpose>\s*<gco:CharacterString>)\w+',
+        r'\1impact_analysis',
+        metadata_xml)
+    with open(os.path.join(output_dir, 'impact_analysis.xml'), 'w') as f:
+        f.write(metadata_xml)
+
+    analysis_summary_path = os.path.join(
+        output_dir, 'analysis_summary.geojson')
+    shutil.copy(ANALYSIS_SUMMARY, analysis_summary_path)
+
+    time.sleep(max(ANALYSIS_DELAY - (time.time() - start_time), 0))
+    return {
+        'status': RESULT_SUCCESS,
+        'message': '',
+        'output': {
+            'impact_analysis': impact_path,
+            'analysis_summary': analysis_summary_path,
+        }
+    }
+
+
+@app.task(
+    name='inasafe.headless.tasks.generate_report', queue='inasafe-headless')
+def generate_report(
+        impact_layer_uri,
+        custom_report_template_uri=None,
+        custom_layer_order=None,
+        custom_legend_layer=None,
+        use_template_extent=False,
+        locale='en_US'):
+    """Return canned PDF reports next to the impact layer."""
+    start_time = time.time()
+    output_dir = os.path.dirname(impact_layer_uri)
+    if not os.path.isdir(output_dir):
+        output_dir = new_output_dir()
+
+    pdf_product_tag = {}
+    for report_key in ['impact-report-pdf', 'inasafe-map-report-portrait']:
+        report_path = os.path.join(output_dir, report_key + '.pdf')
+        with open(report_path, 'wb') as f:
+            f.write(CANNED_PDF)
+        pdf_product_tag[report_key] = report_path
+
+    time.sleep(max(REPORT_DELAY - (time.time() - start_time), 0))
+    return {
+        'status': RESULT_SUCCESS,
+        'message': '',
+        'output': {
+            'pdf_product_tag': pdf_product_tag,
+        }
+    }
+
+
+@app.task(
+    name='inasafe.headless.tasks.check_broker_connection',
+    queue='inasafe-headless')
+def check_broker_connection():
+    """Only returns true if broker is connected."""
+    return True
@@ -113,11 +113,80 @@ USE_LAYER_HTTP_ACCESS = literal_eval(os.environ.get(
     'USE_LAYER_HTTP_ACCESS', 'False'))
 
 
+# Location of layer archives served to InaSAFE Headless Celery workers when
+# using http access. Archive is built once for each version of layer files.
+LAYER_ARCHIVE_CACHE_DIRECTORY = os.environ.get(
+    'LAYER_ARCHIVE_CACHE_DIRECTORY', '/home/geosafe/layer_archive/')
+
+
+# Opt-in to let the web server send the cached layer archive, using
+# X-Accel-Redirect header. The value is the internal location of
+# LAYER_ARCHIVE_CACHE_DIRECTORY in the web server, for example:
+# /layer_archive/
+LAYER_ARCHIVE_X_ACCEL_REDIRECT = os.environ.get(
+    'LAYER_ARCHIVE_X_ACCEL_REDIRECT', '')
+
+
+# Location of vector tiles of layers. Each tile is generated once for each
+# version of layer files.
+VECTOR_TILE_CACHE_DIRECTORY = os.environ.get(
+    'VECTOR_TILE_CACHE_DIRECTORY', '/home/geosafe/vector_tiles/')
+
+# Geometries of vector tiles are simplified with this tolerance, in screen
+# pixels of the zoom level.
+VECTOR_TILE_SIMPLIFY_PIXELS = literal_eval(os.environ.get(
+    'VECTOR_TILE_SIMPLIFY_PIXELS', '0.5'))
+
+# Lowest zoom level of vector tiles. Tiles of lower zoom levels cover too
+# many features to be generated in a request, so they are empty.
+VECTOR_TILE_MIN_ZOOM = literal_eval(os.environ.get(
+    'VECTOR_TILE_MIN_ZOOM', '10'))
+
+# Highest zoom level of vector tiles
+VECTOR_TILE_MAX_ZOOM = literal_eval(os.environ.get(
+    'VECTOR_TILE_MAX_ZOOM', '20'))
+
+
+# HTTP client used for QGIS Server, InaSAFE Headless outputs and remote
+# services. Number of hosts with a connection pool, and number of kept alive
+# connections to each host.
+HTTP_CLIENT_POOL_CONNECTIONS = literal_eval(os.environ.get(
+    'HTTP_CLIENT_POOL_CONNECTIONS', '10'))
+HTTP_CLIENT_POOL_MAXSIZE = literal_eval(os.environ.get(
+    'HTTP_CLIENT_POOL_MAXSIZE', '10'))
+
+# Seconds to wait for a connection, and between bytes of a response
+HTTP_CLIENT_CONNECT_TIMEOUT = literal_eval(os.environ.get(
+    'HTTP_CLIENT_CONNECT_TIMEOUT', '10'))
+HTTP_CLIENT_READ_TIMEOUT = literal_eval(os.environ.get(
+    'HTTP_CLIENT_READ_TIMEOUT', '120'))
+
+# Retries of failed connections and 502, 503 and 504 responses. Retry n
+# waits backoff * 2 ^ (n - 1) seconds.
+HTTP_CLIENT_RETRIES = literal_eval(os.environ.get(
+    'HTTP_CLIENT_RETRIES', '3'))
+HTTP_CLIENT_RETRY_BACKOFF = literal_eval(os.environ.get(
+    'HTTP_CLIENT_RETRY_BACKOFF', '0.5'))
+
+# Seconds between updates of the HTTP client counters shared by all
+# processes. Counters are also updated after each Celery task. None to
+# only count requests in process memory.
+HTTP_CLIENT_COUNTER_FLUSH_INTERVAL = literal_eval(os.environ.get(
+    'HTTP_CLIENT_COUNTER_FLUSH_INTERVAL', '60'))
+
+
 # This base url is needed for InaSAFE worker to be able to find Geonode to
 # fetch layers
 GEONODE_BASE_URL = 'http://localhost:8000/'
 
 
+# Read InaSAFE 4 keywords of standard ISO metadata in GeoSAFE, instead of
+# waiting for InaSAFE Headless get_keywords task. InaSAFE Headless is still
+# used for legacy keywords.
+INASAFE_LOCAL_KEYWORDS_PARSER = literal_eval(os.environ.get(
+    'INASAFE_LOCAL_KEYWORDS_PARSER', 'True'))
+
+
 # Analysis Run Time Limit (in seconds)
 # Task will exit if exceeded this hard limit
 INASAFE_ANALYSIS_RUN_TIME_LIMIT = literal_eval(os.environ.get(
@@ -132,6 +201,38 @@ INASAFE_ANALYSIS_AREA_LIMIT = literal_eval(os.environ.get(
     'INASAFE_ANALYSIS_AREA_LIMIT', '1000000000'))
 
 
+# Time (in seconds) the result of an analysis is reused by later analyses
+# with identical inputs (layer files, aggregation filter, extent and
+# language). Set to 0 to always run the analysis.
+ANALYSIS_RESULT_CACHE_TTL = literal_eval(os.environ.get(
+    'ANALYSIS_RESULT_CACHE_TTL', '86400'))
+
+
+# Maximum total size (in bytes) of cached filtered aggregation layers.
+# Filtered aggregation that is not used by any running analysis is evicted
+# in least recently used order when the cache exceeds this size.
+FILTERED_AGGREGATION_CACHE_SIZE = literal_eval(os.environ.get(
+    'FILTERED_AGGREGATION_CACHE_SIZE', '1073741824'))
+
+
+# Location of copies of aggregation layers with attribute index of the
+# filtered property. A copy is built once for each version of layer files
+# and each property.
+AGGREGATION_INDEX_CACHE_DIRECTORY = os.environ.get(
+    'AGGREGATION_INDEX_CACHE_DIRECTORY', '/home/geosafe/aggregation_index/')
+
+
+# Maximum number of analyses of an analysis sweep that run at the same time,
+# so one sweep doesn't take every InaSAFE Headless worker.
+ANALYSIS_SWEEP_CONCURRENCY = literal_eval(os.environ.get(
+    'ANALYSIS_SWEEP_CONCURRENCY', '4'))
+
+
+# Number of analysis shown in each page of analysis list
+ANALYSIS_LIST_PAGE_SIZE = literal_eval(os.environ.get(
+    'ANALYSIS_LIST_PAGE_SIZE', '50'))
+
+
 # QGIS report template settings
 LOCALIZED_QGIS_REPORT_TEMPLATE = {
     # Below is a sample dict of locale to custom template
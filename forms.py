@@ -7,7 +7,7 @@ from django.utils.translation import ugettext as _
 
 from geonode.layers.models import Layer
 from geonode.people.models import Profile
-from geosafe.models import Analysis
+from geosafe.models import Analysis, AnalysisBatch, AnalysisSweep
 
 __author__ = 'ismailsunni'
 
@@ -153,6 +153,168 @@ class AnalysisCreationForm(models.ModelForm):
         return instance
 
 
+class AnalysisGroupCreationForm(models.ModelForm):
+    """Base form for creating analyses that run together.
+
+    One layer of the group is the same for every analysis, the other one
+    varies. Subclasses set which model field links an analysis to the
+    group, and which layer fields are fixed and varying.
+    """
+
+    # Analysis field of the group
+    group_field = None
+    # Analysis field of the layer shared by every analysis
+    fixed_layer_field = None
+    # Analysis field of the layer of each analysis, and the form field
+    # listing these layers
+    varying_layer_field = None
+    varying_layers_field = None
+
+    user_title = forms.CharField(
+        label='Analysis Title',
+        required=False
+    )
+
+    aggregation_layer = forms.ModelChoiceField(
+        label='Aggregation Layer',
+        required=False,
+        queryset=Layer.objects.filter(
+            inasafe_metadata__layer_purpose='aggregation')
+    )
+
+    aggregation_filter = forms.CharField(
+        required=False
+    )
+    # Filter format is the same as AnalysisCreationForm
+
+    extent_option = forms.TypedChoiceField(
+        choices=Analysis.EXTENT_CHOICES,
+        coerce=int,
+        required=False,
+        empty_value=Analysis.HAZARD_EXPOSURE_CODE
+    )
+
+    keep = forms.BooleanField(
+        label='Save Analysis',
+        required=False,
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user', None)
+        self.language_code = kwargs.pop('language_code', None)
+        super(AnalysisGroupCreationForm, self).__init__(*args, **kwargs)
+
+    def save(self, commit=True):
+        instance = super(AnalysisGroupCreationForm, self).save(commit=False)
+        if self.language_code:
+            instance.language_code = self.language_code
+        if self.user.username:
+            instance.user = self.user
+        else:
+            instance.user = Profile.objects.get(username='AnonymousUser')
+        if not instance.aggregation_layer or not instance.aggregation_filter:
+            # Standardize to empty value
+            instance.aggregation_filter = None
+        instance.save()
+
+        # Analysis of each varying layer. These are run by the group, not
+        # by analysis post save.
+        for layer in self.cleaned_data[self.varying_layers_field]:
+            user_title = None
+            if instance.user_title:
+                user_title = u'{title} - {layer}'.format(
+                    title=instance.user_title, layer=layer.title)
+            Analysis.objects.create(
+                user_title=user_title,
+                aggregation_layer=instance.aggregation_layer,
+                aggregation_filter=instance.aggregation_filter,
+                extent_option=self.cleaned_data['extent_option'],
+                keep=self.cleaned_data['keep'],
+                user=instance.user,
+                language_code=instance.language_code,
+                **{
+                    self.group_field: instance,
+                    self.fixed_layer_field: getattr(
+                        instance, self.fixed_layer_field),
+                    self.varying_layer_field: layer,
+                })
+        return instance
+
+
+class AnalysisBatchCreationForm(AnalysisGroupCreationForm):
+    """A form for creating analyses of one hazard against many exposures."""
+
+    group_field = 'batch'
+    fixed_layer_field = 'hazard_layer'
+    varying_layer_field = 'exposure_layer'
+    varying_layers_field = 'exposure_layers'
+
+    class Meta:
+        model = AnalysisBatch
+        fields = (
+            'user_title',
+            'hazard_layer',
+            'aggregation_layer',
+            'aggregation_filter',
+        )
+
+    hazard_layer = forms.ModelChoiceField(
+        label='Hazard Layer',
+        required=True,
+        queryset=Layer.objects.filter(
+            inasafe_metadata__layer_purpose='hazard')
+    )
+
+    exposure_layers = forms.ModelMultipleChoiceField(
+        label='Exposure Layers',
+        required=True,
+        queryset=Layer.objects.filter(
+            inasafe_metadata__layer_purpose='exposure')
+    )
+
+    def clean_exposure_layers(self):
+        exposure_layers = self.cleaned_data['exposure_layers']
+        # Multi exposure analysis accepts one exposure of each category
+        categories = [
+            l.inasafe_metadata.category for l in exposure_layers]
+        if len(set(categories)) < len(categories):
+            raise forms.ValidationError(
+                _('Only one exposure layer of each category is allowed.'))
+        return exposure_layers
+
+
+class AnalysisSweepCreationForm(AnalysisGroupCreationForm):
+    """A form for creating analyses of many hazards against one exposure."""
+
+    group_field = 'sweep'
+    fixed_layer_field = 'exposure_layer'
+    varying_layer_field = 'hazard_layer'
+    varying_layers_field = 'hazard_layers'
+
+    class Meta:
+        model = AnalysisSweep
+        fields = (
+            'user_title',
+            'exposure_layer',
+            'aggregation_layer',
+            'aggregation_filter',
+        )
+
+    hazard_layers = forms.ModelMultipleChoiceField(
+        label='Hazard Layers',
+        required=True,
+        queryset=Layer.objects.filter(
+            inasafe_metadata__layer_purpose='hazard')
+    )
+
+    exposure_layer = forms.ModelChoiceField(
+        label='Exposure Layer',
+        required=True,
+        queryset=Layer.objects.filter(
+            inasafe_metadata__layer_purpose='exposure')
+    )
+
+
 class MetaSearchForm(forms.Form):
 
     class Meta:
@@ -0,0 +1,318 @@
+# coding=utf-8
+"""Helpers to produce a subset of aggregation layer.
+
+The subset is produced locally by reading the aggregation layer file with
+OGR, using attribute index when the format supports it. The index is built
+on a copy of the layer in AGGREGATION_INDEX_CACHE_DIRECTORY, so uploaded
+layer files are never opened for update. If OGR is not available or the
+layer file can't be read, QGIS Server WFS is used.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from geonode.qgis_server.helpers import qgis_server_endpoint
+from geosafe.app_settings import settings
+from geosafe.helpers.http_client import QGIS_SERVER_ENDPOINT, http_client
+from geosafe.helpers.utils import layer_files_fingerprint
+
+try:
+    from osgeo import ogr
+except ImportError:
+    ogr = None
+
+__author__ = 'lucernae'
+
+LOGGER = logging.getLogger(__name__)
+
+# Formats where OGR can create attribute index
+ATTRIBUTE_INDEX_EXTENSIONS = ['.shp']
+
+
+def escape_ogr_literal(value):
+    """Escape a value as OGR SQL string literal.
+
+    :param value: value to escape
+    :type value: basestring
+
+    :rtype: basestring
+    """
+    if not isinstance(value, basestring):
+        value = str(value)
+    return u"'{0}'".format(value.replace(u"'", u"''"))
+
+
+def create_attribute_index(layer_path, property_name):
+    """Create attribute index of a property, if the format supports it.
+
+    :param layer_path: path of the layer file
+    :type layer_path: basestring
+
+    :param property_name: property to index
+    :type property_name: basestring
+
+    :return: True if the index exists
+    :rtype: bool
+    """
+    basename, ext = os.path.splitext(layer_path)
+    if ext.lower() not in ATTRIBUTE_INDEX_EXTENSIONS:
+        return False
+    data_source = ogr.Open(layer_path, 1)
+    if not data_source:
+        return False
+    layer = data_source.GetLayer(0)
+    if layer.GetLayerDefn().GetFieldIndex(str(property_name)) < 0:
+        return False
+    data_source.ExecuteSQL(
+        'CREATE INDEX ON "{layer}" USING "{field}"'.format(
+            layer=layer.GetName(), field=property_name))
+    data_source = None
+    # OGR stores attribute index of shapefile in .ind and .idm files
+    return os.path.exists(basename + '.idm')
+
+
+def indexed_layer_copy(layer_path, index_dir, property_name):
+    """Copy layer files and create attribute index of a property.
+
+    The copy is prepared in a temporary directory, then renamed to
+    index_dir, so other process never reads a partial copy. If other
+    process created index_dir first, that one is used.
+
+    :param layer_path: path of the layer file
+    :type layer_path: basestring
+
+    :param index_dir: directory of the indexed copy
+    :type index_dir: basestring
+
+    :param property_name: property to index
+    :type property_name: basestring
+
+    :return: path of the indexed layer file, or None if the format has no
+        attribute index
+    :rtype: basestring
+    """
+    indexed_path = os.path.join(index_dir, os.path.basename(layer_path))
+    if os.path.exists(indexed_path):
+        return indexed_path
+
+    cache_dir = os.path.dirname(index_dir)
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Possibly created by other process
+            if not os.path.isdir(cache_dir):
+                raise
+
+    dirname, layer_name = os.path.split(layer_path)
+    basename = os.path.splitext(layer_name)[0]
+    temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    try:
+        for name in os.listdir(dirname):
+            name_base, ext = os.path.splitext(name)
+            if name_base == basename and ext.lower() not in ['.ind', '.idm']:
+                shutil.copy(os.path.join(dirname, name), temp_dir)
+        if not create_attribute_index(
+                os.path.join(temp_dir, layer_name), property_name):
+            return None
+        try:
+            os.rename(temp_dir, index_dir)
+        except OSError:
+            # Created by other process
+            if not os.path.exists(indexed_path):
+                raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return indexed_path
+
+
+def aggregation_index_dir(layer, fingerprint, property_name):
+    """Directory of indexed copy of aggregation layer.
+
+    :param layer: aggregation layer
+    :type layer: geonode.layers.models.Layer
+
+    :param fingerprint: fingerprint of layer files
+    :type fingerprint: str
+
+    :param property_name: indexed property
+    :type property_name: basestring
+
+    :rtype: str
+    """
+    return os.path.join(
+        settings.AGGREGATION_INDEX_CACHE_DIRECTORY,
+        '{layer_id}-{fingerprint}-{field}'.format(
+            layer_id=layer.id,
+            fingerprint=fingerprint,
+            field=hashlib.sha1(
+                property_name.encode('utf-8')).hexdigest()[:12]))
+
+
+def get_indexed_aggregation(layer, property_name):
+    """Get copy of aggregation layer with attribute index of a property.
+
+    Uploaded layer files are never modified. Each version of layer files
+    and each property has its own indexed copy, built once.
+
+    :param layer: aggregation layer
+    :type layer: geonode.layers.models.Layer
+
+    :param property_name: property to index
+    :type property_name: basestring
+
+    :return: path of the indexed layer file, or None if the format has no
+        attribute index
+    :rtype: basestring
+    """
+    layer_path = layer.qgis_layer.base_layer_path
+    ext = os.path.splitext(layer_path)[1]
+    if not ogr or ext.lower() not in ATTRIBUTE_INDEX_EXTENSIONS:
+        return None
+
+    fingerprint = layer_files_fingerprint(layer)
+    index_dir = aggregation_index_dir(layer, fingerprint, property_name)
+    new_version = not os.path.exists(index_dir)
+    indexed_path = indexed_layer_copy(layer_path, index_dir, property_name)
+    if indexed_path and new_version:
+        # Indexed copies of previous version of layer files are not valid
+        invalidate_aggregation_index(layer, keep_fingerprint=fingerprint)
+    return indexed_path
+
+
+def invalidate_aggregation_index(layer, keep_fingerprint=None):
+    """Remove indexed copies of aggregation layer.
+
+    :param layer: aggregation layer
+    :type layer: geonode.layers.models.Layer
+
+    :param keep_fingerprint: Fingerprint of layer files to keep, if it is
+        still valid
+    :type keep_fingerprint: str
+    """
+    pattern = os.path.join(
+        settings.AGGREGATION_INDEX_CACHE_DIRECTORY,
+        '{layer_id}-*'.format(layer_id=layer.id))
+    keep_prefix = '{layer_id}-{fingerprint}-'.format(
+        layer_id=layer.id, fingerprint=keep_fingerprint)
+    for index_dir in glob.glob(pattern):
+        if keep_fingerprint and os.path.basename(index_dir).startswith(
+                keep_prefix):
+            continue
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def filter_aggregation_local(
+        layer_path, output_path, property_name, values):
+    """Write selected features of aggregation layer as GeoJSON using OGR.
+
+    Features are streamed from the layer to the output file, so the layer
+    never needs to fit in memory.
+
+    :param layer_path: path of aggregation layer file
+    :type layer_path: basestring
+
+    :param output_path: path of GeoJSON output
+    :type output_path: basestring
+
+    :param property_name: name of the property to filter
+    :type property_name: basestring
+
+    :param values: selected values of the property
+    :type values: list
+
+    :return: number of features written
+    :rtype: int
+    """
+    if not ogr:
+        raise IOError('OGR is not available')
+
+    data_source = ogr.Open(layer_path)
+    if not data_source:
+        raise IOError('Failed to open {0}'.format(layer_path))
+    layer = data_source.GetLayer(0)
+    if layer.GetLayerDefn().GetFieldIndex(str(property_name)) < 0:
+        raise KeyError('Property {0} not found'.format(property_name))
+
+    attribute_filter = u'"{name}" IN ({values})'.format(
+        name=property_name,
+        values=', '.join(escape_ogr_literal(v) for v in values))
+    if layer.SetAttributeFilter(attribute_filter.encode('utf-8')) != 0:
+        raise ValueError('Invalid filter {0}'.format(attribute_filter))
+
+    # GeoJSON driver can't overwrite existing file
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    output = ogr.GetDriverByName('GeoJSON').CreateDataSource(output_path)
+    if not output:
+        raise IOError('Failed to create {0}'.format(output_path))
+    output_layer = output.CopyLayer(layer, layer.GetName())
+    feature_count = output_layer.GetFeatureCount()
+
+    # Flush to disk
+    output_layer = None
+    output = None
+    data_source = None
+    return feature_count
+
+
+def filter_aggregation_wfs(
+        qgis_layer, output_path, property_name=None, values=None):
+    """Write selected features of aggregation layer using QGIS Server WFS.
+
+    :param qgis_layer: QGIS Server layer of aggregation layer
+    :type qgis_layer: geonode.qgis_server.models.QGISServerLayer
+
+    :param output_path: path of GeoJSON output
+    :type output_path: basestring
+
+    :param property_name: name of the property to filter
+    :type property_name: basestring
+
+    :param values: selected values of the property
+    :type values: list
+
+    :return: True if success
+    :rtype: bool
+    """
+    endpoint = qgis_server_endpoint(internal=True)
+
+    # construct WFS filter query_params
+    query_string = {
+        'MAP': qgis_layer.qgis_project_path,
+        'SERVICE': 'WFS',
+        'REQUEST': 'GetFeature',
+        'TYPENAME': qgis_layer.layer.name,
+        'OUTPUTFORMAT': 'GeoJSON'
+    }
+    if property_name and values:
+        like_statement = []
+        for val in values:
+            like_statement.append(
+                '<PropertyIsLike>'
+                '<PropertyName>{name}</PropertyName>'
+                '<Literal>{value}</Literal>'
+                '</PropertyIsLike>'.format(name=property_name, value=val)
+            )
+        query_string['FILTER'] = '<Filter>{filter}</Filter>'.format(
+            filter=''.join(like_statement))
+
+    response = http_client.get(
+        endpoint, params=query_string, stream=True,
+        endpoint=QGIS_SERVER_ENDPOINT)
+    if not response.ok:
+        return False
+
+    with open(output_path, mode='w+b') as f:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            f.write(chunk)
+
+    # Make sure it is a valid geojson
+    with open(output_path) as f:
+        json.load(f)
+    return True
@@ -0,0 +1,255 @@
+# coding=utf-8
+"""Shared HTTP client of GeoSAFE.
+
+Requests to QGIS Server, InaSAFE Headless outputs and remote OGC services go
+through one requests Session for each process, so connections are kept alive
+and reused from a pool for each host. Requests get a default timeout, and
+idempotent requests are retried with exponential backoff on connection
+errors and on 502, 503 and 504 responses.
+
+Only connections are shared. Cookies are never stored, because requests
+of different users with their own credentials go to the same hosts.
+
+Number of requests, time until response headers, and bytes received are
+counted for each endpoint of the process. An endpoint is a label given by
+the caller, or the host of the url. Counters are added to the
+HTTPClientCounter table shared by all processes every
+HTTP_CLIENT_COUNTER_FLUSH_INTERVAL seconds, and after each Celery task, so
+exported metrics cover web and worker processes.
+"""
+
+import logging
+import os
+import threading
+import time
+import urlparse
+from cookielib import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    from urllib3.util.retry import Retry
+
+from geosafe.app_settings import settings
+
+__author__ = 'lucernae'
+
+LOGGER = logging.getLogger(__name__)
+
+# Status of responses that are worth retrying
+RETRY_STATUS = [502, 503, 504]
+
+# Status label of requests that failed without response
+STATUS_ERROR = 'error'
+
+# Endpoint label of requests to QGIS Server
+QGIS_SERVER_ENDPOINT = 'qgis-server'
+
+
+class EndpointStats(object):
+    """Counters of requests to an endpoint."""
+
+    def __init__(self):
+        # Number of requests for each response status
+        self.requests = {}
+        self.seconds = 0.0
+        self.bytes_received = 0
+
+    @property
+    def count(self):
+        return sum(self.requests.values())
+
+
+class HTTPClient(object):
+    """Pooled HTTP client with timeouts, retries and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self._stats = {}
+        # Counters not added to the shared table yet, for each endpoint and
+        # status
+        self._unflushed = {}
+        self._flushed_time = time.time()
+
+    @property
+    def session(self):
+        """Session of the current process.
+
+        Connections can't be shared with forked worker processes, so a new
+        session is created after fork.
+
+        :rtype: requests.Session
+        """
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self.create_session()
+                    self._pid = pid
+        return self._session
+
+    @staticmethod
+    def create_session():
+        """Create a session with pooled and retried connections.
+
+        :rtype: requests.Session
+        """
+        # The last response is returned when retries are exhausted, so
+        # callers can still check response status.
+        retry = Retry(
+            total=settings.HTTP_CLIENT_RETRIES,
+            backoff_factor=settings.HTTP_CLIENT_RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUS,
+            raise_on_status=False)
+        adapter = HTTPAdapter(
+            pool_connections=settings.HTTP_CLIENT_POOL_CONNECTIONS,
+            pool_maxsize=settings.HTTP_CLIENT_POOL_MAXSIZE,
+            max_retries=retry)
+        session = requests.Session()
+        # Cookies set for one user must not be sent with requests of others
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        """Send a request with the shared session.
+
+        Takes the same arguments as requests.request. If timeout is not
+        given, HTTP_CLIENT_CONNECT_TIMEOUT and HTTP_CLIENT_READ_TIMEOUT are
+        used.
+
+        :param method: HTTP method
+        :type method: str
+
+        :param url: request url
+        :type url: str
+
+        :param endpoint: label of the endpoint in the counters, defaults to
+            the host of the url
+        :type endpoint: str
+
+        :rtype: requests.Response
+        """
+        if not endpoint:
+            endpoint = urlparse.urlparse(url).netloc
+        kwargs.setdefault('timeout', (
+            settings.HTTP_CLIENT_CONNECT_TIMEOUT,
+            settings.HTTP_CLIENT_READ_TIMEOUT))
+
+        start_time = time.time()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.record(endpoint, STATUS_ERROR, time.time() - start_time)
+            raise
+        status = response.status_code
+        self.record(endpoint, status, time.time() - start_time)
+
+        if kwargs.get('stream'):
+            # Body is counted as it is consumed
+            response.iter_content = self._counted_iter_content(
+                response.iter_content, endpoint, status)
+        else:
+            self.record(
+                endpoint, status, bytes_received=len(response.content),
+                requests=0)
+        return response
+
+    def get(self, url, endpoint=None, **kwargs):
+        """Send a GET request with the shared session.
+
+        :rtype: requests.Response
+        """
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def _counted_iter_content(self, iter_content, endpoint, status):
+        def counted_iter_content(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                self.record(
+                    endpoint, status, bytes_received=len(chunk), requests=0)
+                yield chunk
+        return counted_iter_content
+
+    def record(
+            self, endpoint, status, seconds=0.0, bytes_received=0,
+            requests=1):
+        """Update counters of an endpoint.
+
+        :param endpoint: endpoint label
+        :type endpoint: str
+
+        :param status: response status
+        :type status: int, str
+
+        :param seconds: time until response headers
+        :type seconds: float
+
+        :param bytes_received: size of received body
+        :type bytes_received: int
+
+        :param requests: number of new requests, 0 if only body is received
+        :type requests: int
+        """
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            if requests:
+                stats.requests[status] = (
+                    stats.requests.get(status, 0) + requests)
+                stats.seconds += seconds
+            stats.bytes_received += bytes_received
+
+            unflushed = self._unflushed.setdefault(
+                (endpoint, status), [0, 0.0, 0])
+            unflushed[0] += requests
+            unflushed[1] += seconds
+            unflushed[2] += bytes_received
+
+        interval = settings.HTTP_CLIENT_COUNTER_FLUSH_INTERVAL
+        if interval is not None and (
+                time.time() - self._flushed_time >= interval):
+            self.flush()
+
+    def flush(self):
+        """Add counters of this process to the table of all processes."""
+        with self._lock:
+            unflushed = self._unflushed
+            self._unflushed = {}
+            self._flushed_time = time.time()
+        if not unflushed:
+            return
+
+        # geosafe.models imports this module through the tasks
+        from geosafe.models import HTTPClientCounter
+        for (endpoint, status), counters in unflushed.items():
+            try:
+                HTTPClientCounter.add(
+                    endpoint, status, requests=counters[0],
+                    seconds=counters[1], bytes_received=counters[2])
+            except BaseException as e:
+                # Counters should never break the request
+                LOGGER.exception(e)
+
+    def stats(self):
+        """Counters of each endpoint of this process.
+
+        :return: endpoint label and its counters
+        :rtype: dict
+        """
+        with self._lock:
+            stats = {}
+            for endpoint, endpoint_stats in self._stats.items():
+                copy = EndpointStats()
+                copy.requests = dict(endpoint_stats.requests)
+                copy.seconds = endpoint_stats.seconds
+                copy.bytes_received = endpoint_stats.bytes_received
+                stats[endpoint] = copy
+            return stats
+
+
+http_client = HTTPClient()
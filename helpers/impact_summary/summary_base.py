@@ -9,18 +9,51 @@ __author__ = 'Rizky Maulana Nugraha <lana.pcfre@gmail.com>'
 __date__ = '5/17/16'
 
 
+def category_css_class(category, hazard_type=None):
+    """Get css-class from a given category
+
+    :param category: category string
+    :type category: str
+
+    :param hazard_type: hazard of the analysis
+    :type hazard_type: str
+
+    :return:
+    """
+    cleaned_category_name = (
+        category.replace(' ', '-').replace('_', '-').replace(
+            '-hazard-count', ''))
+    # generic classification
+    if 'high' in category.lower():
+        return 'hazard-category-high'
+    elif 'medium' in category.lower() or 'moderate' in category.lower():
+        return 'hazard-category-medium'
+    elif 'low' in category.lower():
+        return 'hazard-category-low'
+    elif 'wet' in category.lower():
+        return 'hazard-category-high'
+    elif 'dry' in category.lower():
+        if hazard_type == 'flood':
+            return 'hazard-category-low'
+        elif hazard_type == 'tsunami':
+            return 'hazard-category-green'
+    # EQ MMI Classes
+    else:
+        return 'hazard-category-%s' % cleaned_category_name
+
+
 class ImpactSummary(object):
 
     def __init__(self, impact_layer):
         self._impact_layer = impact_layer
         self._impact_data = {}
-        if self.read_impact_data_json().get('features'):
-            properties = (
-                self.read_impact_data_json().get('features')[0].get(
-                    'properties'))
-            self._impact_data = properties
+        # Analysis summary has one feature, with the summary as properties
+        features = self.read_impact_data_json().get('features')
+        if features:
+            self._impact_data = features[0].get('properties') or {}
 
         self._impact_keywords = self.read_impact_keywords()
+        self._category_list = None
 
     @property
     def impact_layer(self):
@@ -60,21 +93,44 @@ class ImpactSummary(object):
     @impact_keywords.setter
     def impact_keywords(self, value):
         self._impact_keywords = value
+        self._category_list = None
 
-    def read_impact_data_json(self):
-        """Read impact_data.json file from a given impact layer
+    def read_layer_file_json(self, name):
+        """Read a json layer file of the impact layer
 
-        :return: dictionary of impact data
+        :param name: name of the layer file
+        :type name: str
+
+        :return: parsed json, empty if there is no such file
         :rtype: dict
         """
         try:
             json_file = self.impact_layer.upload_session.layerfile_set.get(
-                name="analysis_summary.geojson")
-            impact_data = json.loads(json_file.file.read())
-            return impact_data
+                name=name)
+            return json.loads(json_file.file.read())
         except LayerFile.DoesNotExist:
             return {}
 
+    def read_impact_data_json(self):
+        """Read impact_data.json file from a given impact layer
+
+        :return: dictionary of impact data
+        :rtype: dict
+        """
+        return self.read_layer_file_json("analysis_summary.geojson")
+
+    def read_aggregation_summary(self):
+        """Read impact summary of each aggregation area
+
+        :return: properties of each aggregation area
+        :rtype: list
+        """
+        aggregation_summary = self.read_layer_file_json(
+            "aggregation_summary.geojson")
+        return [
+            f.get('properties') or {}
+            for f in aggregation_summary.get('features') or []]
+
     def read_impact_keywords(self):
         """Read impact keywords"""
         try:
@@ -100,17 +156,15 @@ class ImpactSummary(object):
         :return: list of dict of category and value
         """
         if self.is_summary_exists():
-            category_list = self.category_list()
             ret_val = []
-            for category in category_list:
-                for key, value in self.impact_data.iteritems():
-                    class_name = (
-                        '{category}_hazard_count').format(category=category)
-                    if class_name == key:
-                        ret_val.append({
-                            "category": category,
-                            "value": value
-                        })
+            for category in self.category_list():
+                class_name = (
+                    '{category}_hazard_count').format(category=category)
+                if class_name in self.impact_data:
+                    ret_val.append({
+                        "category": category,
+                        "value": self.impact_data[class_name]
+                    })
             return ret_val
 
     def summary_dict(self):
@@ -122,6 +176,11 @@ class ImpactSummary(object):
         return ret_val
 
     def category_list(self):
+        if self._category_list is None:
+            self._category_list = self.read_category_list()
+        return self._category_list
+
+    def read_category_list(self):
         if self.is_keywords_exists():
             provenance_data = self.impact_keywords.get('provenance_data', {})
             if provenance_data:
@@ -174,23 +233,4 @@ class ImpactSummary(object):
 
         :return:
         """
-        cleaned_category_name = (
-            category.replace(' ', '-').replace('_', '-').replace(
-                '-hazard-count', ''))
-        # generic classification
-        if 'high' in category.lower():
-            return 'hazard-category-high'
-        elif 'medium' in category.lower() or 'moderate' in category.lower():
-            return 'hazard-category-medium'
-        elif 'low' in category.lower():
-            return 'hazard-category-low'
-        elif 'wet' in category.lower():
-            return 'hazard-category-high'
-        elif 'dry' in category.lower():
-            if self.hazard_type() == 'flood':
-                return 'hazard-category-low'
-            elif self.hazard_type() == 'tsunami':
-                return 'hazard-category-green'
-        # EQ MMI Classes
-        else:
-            return 'hazard-category-%s' % cleaned_category_name
+        return category_css_class(category, self.hazard_type())
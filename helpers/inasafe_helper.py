@@ -1,11 +1,17 @@
 # coding=utf-8
+import json
+import logging
 import os
 from distutils.util import strtobool
+
+from django.utils.dateparse import parse_date, parse_datetime
 from lxml import etree
 
 from geosafe.models import ISO_METADATA_INASAFE_KEYWORD_TAG, \
     ISO_METADATA_INASAFE_PROVENANCE_KEYWORD_TAG, ISO_METADATA_NAMESPACES
 
+LOGGER = logging.getLogger(__name__)
+
 INASAFE_TESTING_ENVIRONMENT = strtobool(
     os.environ.get('INASAFE_TESTING_ENVIRONMENT', 'False'))
 
@@ -98,3 +104,107 @@ def extract_inasafe_keywords_from_metadata(metadata_xml):
         inasafe_provenance_el[0] if inasafe_provenance_el else None
     )
     return ret_val
+
+
+def parse_keyword_value(value_el):
+    """Convert a gco value element of InaSAFE keywords.
+
+    Conversion follows InaSAFE metadata properties, so the value is the same
+    as the one InaSAFE Headless get_keywords returns.
+
+    :param value_el: gco element, for example gco:CharacterString
+    :type value_el: lxml.etree._Element
+
+    :return: keyword value, None for empty element
+    :raises: ValueError if the value can't be converted
+    """
+    value_type = etree.QName(value_el).localname
+    text = value_el.text
+    if text is None or not text.strip():
+        return None
+    text = text.strip()
+
+    if value_type == 'CharacterString':
+        return value_el.text
+    elif value_type == 'Integer':
+        return int(text)
+    elif value_type in ('Real', 'Decimal', 'Float'):
+        return float(text)
+    elif value_type == 'Boolean':
+        if text.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('Invalid boolean {0}'.format(text))
+        return text.lower() in ('true', '1')
+    elif value_type in ('Dictionary', 'List'):
+        return json.loads(text)
+    elif value_type == 'FloatTuple':
+        # Written by InaSAFE as python tuple, e.g. (0.5, 0.5)
+        return tuple(
+            float(v) for v in text.strip('()').split(',') if v.strip())
+    elif value_type == 'Date':
+        value = parse_date(text)
+        if value is None:
+            raise ValueError('Invalid date {0}'.format(text))
+        return value
+    elif value_type == 'DateTime':
+        value = parse_datetime(text)
+        if value is None:
+            raise ValueError('Invalid datetime {0}'.format(text))
+        return value
+    raise ValueError('Unsupported keyword type {0}'.format(value_type))
+
+
+def parse_inasafe_keywords(keywords_xml):
+    """Parse InaSAFE keywords xml into keywords dict.
+
+    Produces the same keywords as InaSAFE Headless get_keywords for InaSAFE
+    4 keywords. Empty keywords are omitted. The inasafe_provenance tag is not
+    part of the keywords, so it is ignored.
+
+    :param keywords_xml: InaSAFE keywords xml, as stored in
+        Metadata.keywords_xml
+    :type keywords_xml: basestring
+
+    :return: keywords dict, or None if the keywords need to be read by
+        InaSAFE Headless, for example legacy keywords format
+    :rtype: dict
+    """
+    if not keywords_xml:
+        return None
+    if isinstance(keywords_xml, unicode):
+        keywords_xml = keywords_xml.encode('utf-8')
+    try:
+        # Keywords xml may contain both inasafe and inasafe_provenance tag
+        root = etree.XML('<keywords>{0}</keywords>'.format(keywords_xml))
+    except etree.XMLSyntaxError:
+        return None
+
+    inasafe_el = root.find('inasafe')
+    if inasafe_el is None:
+        return None
+
+    keywords = {}
+    for keyword_el in inasafe_el:
+        if not isinstance(keyword_el.tag, basestring):
+            # Comments
+            continue
+        value_els = [el for el in keyword_el if (
+            isinstance(el.tag, basestring))]
+        if len(value_els) != 1:
+            return None
+        try:
+            value = parse_keyword_value(value_els[0])
+        except ValueError as e:
+            LOGGER.debug(e)
+            return None
+        if value is not None:
+            keywords[keyword_el.tag] = value
+
+    keyword_version = keywords.get('keyword_version', '')
+    if not isinstance(keyword_version, basestring):
+        # Unexpected type, InaSAFE knows how to read it
+        return None
+    if not keyword_version.split('.')[0].isdigit() or (
+            int(keyword_version.split('.')[0]) < 4):
+        # Legacy keywords are converted by InaSAFE
+        return None
+    return keywords
@@ -0,0 +1,113 @@
+# coding=utf-8
+"""Cache of layer zip archives.
+
+Archives are stored in LAYER_ARCHIVE_CACHE_DIRECTORY, keyed by layer id and
+the fingerprint of layer files, so an archive is only built once for each
+version of layer files.
+"""
+
+import glob
+import logging
+import os
+import tempfile
+
+from geosafe.app_settings import settings
+from geosafe.helpers.utils import layer_files_fingerprint
+from geosafe.helpers.zipstream import ZipStream
+
+__author__ = 'lucernae'
+
+LOGGER = logging.getLogger(__name__)
+
+
+def layer_zip_stream(layer):
+    """Zip stream of layer files.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :rtype: ZipStream
+    """
+    zip_stream = ZipStream()
+    for layer_file in layer.upload_session.layerfile_set.all():
+        base_name = os.path.basename(layer_file.file.name)
+        zip_stream.write(layer_file.file.path, base_name)
+    return zip_stream
+
+
+def layer_archive_path(layer, fingerprint):
+    """Path of cached archive of a layer.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :param fingerprint: fingerprint of layer files
+    :type fingerprint: str
+
+    :rtype: str
+    """
+    return os.path.join(
+        settings.LAYER_ARCHIVE_CACHE_DIRECTORY,
+        '{layer_id}-{fingerprint}.zip'.format(
+            layer_id=layer.id, fingerprint=fingerprint))
+
+
+def get_layer_archive(layer):
+    """Get cached archive of a layer, build it if it doesn't exist yet.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :return: archive path and fingerprint of layer files
+    :rtype: (str, str)
+    """
+    fingerprint = layer_files_fingerprint(layer)
+    archive_path = layer_archive_path(layer, fingerprint)
+    if os.path.exists(archive_path):
+        return archive_path, fingerprint
+
+    cache_dir = settings.LAYER_ARCHIVE_CACHE_DIRECTORY
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Possibly created by other process
+            if not os.path.isdir(cache_dir):
+                raise
+
+    # Write in a temporary file first, so other process will never serve
+    # a partial archive.
+    fd, temp_path = tempfile.mkstemp(suffix='.zip.tmp', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in layer_zip_stream(layer):
+                f.write(chunk)
+        os.rename(temp_path, archive_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    # Previous version of the archive is no longer valid
+    invalidate_layer_archive(layer, keep=archive_path)
+    return archive_path, fingerprint
+
+
+def invalidate_layer_archive(layer, keep=None):
+    """Remove cached archives of a layer.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :param keep: Path of archive to keep, if it is still valid
+    :type keep: str
+    """
+    pattern = os.path.join(
+        settings.LAYER_ARCHIVE_CACHE_DIRECTORY,
+        '{layer_id}-*.zip'.format(layer_id=layer.id))
+    for archive_path in glob.glob(pattern):
+        if archive_path == keep:
+            continue
+        try:
+            os.remove(archive_path)
+        except OSError as e:
+            LOGGER.debug(e)
@@ -0,0 +1,220 @@
+# coding=utf-8
+"""Keep InaSAFE keywords of a layer in sync with its ISO metadata.
+
+The layer xml document is parsed once. Catalogue metadata is only
+regenerated when the keywords changed, and metadata files are only written
+when their content changed.
+
+Regenerated catalogue metadata is repaired so the InaSAFE keywords are kept
+in supplementalInformation, next to its gco:CharacterString.
+"""
+
+import copy
+import logging
+import os
+import tempfile
+
+from lxml import etree
+
+from geonode.base.models import ResourceBase
+from geonode.catalogue.models import catalogue_post_save
+from geonode.layers.models import Layer, LayerFile
+from geosafe.helpers.inasafe_helper import \
+    extract_inasafe_keywords_from_metadata
+from geosafe.models import Metadata, ISO_METADATA_NAMESPACES
+
+__author__ = 'lucernae'
+
+LOGGER = logging.getLogger(__name__)
+
+
+def inasafe_keywords_xml(inasafe_el, inasafe_provenance_el=None):
+    """Serialize InaSAFE keywords as stored in Metadata.keywords_xml.
+
+    :param inasafe_el: inasafe tag
+    :type inasafe_el: lxml.etree._Element
+
+    :param inasafe_provenance_el: inasafe_provenance tag
+    :type inasafe_provenance_el: lxml.etree._Element
+
+    :return: keywords xml, empty string if there is no keywords
+    :rtype: str
+    """
+    keywords_xml = ''
+    if inasafe_el is not None:
+        keywords_xml = etree.tostring(inasafe_el, pretty_print=True)
+
+    if inasafe_provenance_el is not None:
+        keywords_xml += '\n'
+        keywords_xml += etree.tostring(
+            inasafe_provenance_el, pretty_print=True)
+    return keywords_xml
+
+
+def patch_supplemental_information(
+        metadata_xml, inasafe_el, inasafe_provenance_el=None):
+    """Put InaSAFE keywords in supplementalInformation of ISO metadata.
+
+    InaSAFE metadata implement wrong schema type in supplementalInformation,
+    so the rendered catalogue metadata may miss the keywords or the
+    gco:CharacterString value.
+
+    :param metadata_xml: layer ISO metadata xml
+    :type metadata_xml: basestring
+
+    :param inasafe_el: inasafe tag
+    :type inasafe_el: lxml.etree._Element
+
+    :param inasafe_provenance_el: inasafe_provenance tag
+    :type inasafe_provenance_el: lxml.etree._Element
+
+    :return: patched metadata xml, or the same metadata xml if there is no
+        supplementalInformation tag
+    :rtype: basestring
+    """
+    if isinstance(metadata_xml, unicode):
+        root = etree.XML(metadata_xml.encode('utf-8'))
+    else:
+        root = etree.XML(metadata_xml)
+    sup_info_list = root.xpath(
+        '//gmd:supplementalInformation', namespaces=ISO_METADATA_NAMESPACES)
+    if not sup_info_list:
+        return metadata_xml
+    sup_info = sup_info_list[0]
+
+    char_string_tagname = '{{{gco}}}CharacterString'.format(
+        **ISO_METADATA_NAMESPACES)
+    if sup_info.find(char_string_tagname) is None:
+        # Insert gco:CharacterString value
+        sup_info.insert(0, etree.Element(char_string_tagname))
+
+    # Replace existing InaSAFE keywords, put them after CharacterString
+    for tag, el in [
+            ('inasafe', inasafe_el),
+            ('inasafe_provenance', inasafe_provenance_el)]:
+        if el is None:
+            continue
+        existing_el = sup_info.find(tag)
+        if existing_el is not None:
+            sup_info.remove(existing_el)
+        sup_info.insert(1, copy.deepcopy(el))
+
+    return etree.tostring(root, pretty_print=True)
+
+
+def write_file_atomic(path, content):
+    """Replace file content, unless it is already the same.
+
+    Content is written to a temporary file, then renamed, so readers never
+    see a partially written file.
+
+    :param path: file path
+    :type path: str
+
+    :param content: file content
+    :type content: str
+
+    :return: True if the file was written
+    :rtype: bool
+    """
+    try:
+        with open(path, mode='rb') as f:
+            if f.read() == content:
+                return False
+    except IOError:
+        pass
+
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.', suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        if os.path.exists(path):
+            # Keep file permission of the original file
+            os.chmod(temp_path, os.stat(path).st_mode)
+        os.rename(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return True
+
+
+def sync_inasafe_metadata(layer, sender=Layer, force=False, **kwargs):
+    """Extract InaSAFE keywords of a layer xml file and update metadata.
+
+    The InaSAFE metadata is saved, so keywords processing is triggered,
+    only if the keywords changed.
+
+    :param layer: GeoNode layer
+    :type layer: Layer
+
+    :param sender: model class of the layer, passed to catalogue_post_save
+
+    :param force: regenerate and repair catalogue metadata and save InaSAFE
+        metadata even if the keywords didn't change
+    :type force: bool
+
+    :return: True if the keywords changed
+    :rtype: bool
+    """
+    # retrieve metadata_xml from layer original xml file
+    try:
+        xml_file = layer.upload_session.layerfile_set.get(name='xml')
+    except LayerFile.DoesNotExist:
+        # if no xml file, we do nothing
+        return False
+
+    xml_file.file.open(mode='rb')
+    try:
+        metadata_xml = xml_file.file.read()
+    finally:
+        xml_file.file.close()
+    inasafe_el, inasafe_provenance_el = \
+        extract_inasafe_keywords_from_metadata(metadata_xml)
+    keywords_xml = inasafe_keywords_xml(inasafe_el, inasafe_provenance_el)
+
+    metadata, created = Metadata.objects.get_or_create(layer=layer)
+    keywords_changed = created or (
+        (metadata.keywords_xml or '') != keywords_xml)
+
+    update_metadata = keywords_changed or force
+
+    resources = ResourceBase.objects.filter(id=layer.resourcebase_ptr_id)
+    if update_metadata:
+        metadata.keywords_xml = keywords_xml
+        layer.inasafe_metadata = metadata
+
+        # Trigger catalogue metadata xml update, it renders the keywords
+        catalogue_post_save(layer, sender, **kwargs)
+
+    # After this. The new corrected xml file (which contains InaSAFE
+    # metadata) will exists on layer.metadata_xml
+    # In turn, we overwrite xml file in both media folder and QGIS layer
+    # folder, because QGIS will use the actual file.
+    layer.metadata_xml = resources.values_list(
+        'metadata_xml', flat=True).first()
+    if update_metadata and layer.metadata_xml and inasafe_el is not None:
+        patched_xml = patch_supplemental_information(
+            layer.metadata_xml, inasafe_el, inasafe_provenance_el)
+        if patched_xml != layer.metadata_xml:
+            # write back to resource base so the same thing returned by csw
+            resources.update(metadata_xml=patched_xml)
+            layer.metadata_xml = patched_xml
+
+    if layer.metadata_xml:
+        content = layer.metadata_xml
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        write_file_atomic(xml_file.file.path, content)
+        try:
+            write_file_atomic(layer.qgis_layer.xml_path, content)
+        except AttributeError:
+            # Layer is not served by QGIS Server
+            pass
+
+    if update_metadata:
+        # Save metadata and trigger signal handlers
+        # This will process layer purpose from InaSAFE keywords
+        metadata.save()
+    return keywords_changed
@@ -0,0 +1,59 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from geosafe.helpers.aggregation import (
+    filter_aggregation_local, indexed_layer_copy, ogr)
+from geosafe.helpers.inasafe_helper import InaSAFETestData
+
+
+@unittest.skipUnless(ogr, 'OGR is not available')
+class TestAggregationIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.layer_dir = os.path.join(self.temp_dir, 'layer')
+        os.mkdir(self.layer_dir)
+        self.layer_path = os.path.join(self.layer_dir, 'small_grid.shp')
+        source = ogr.Open(InaSAFETestData.aggregation('small_grid.geojson'))
+        ogr.GetDriverByName('ESRI Shapefile').CopyDataSource(
+            source, self.layer_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_indexed_layer_copy(self):
+        """Test that each property is indexed on its own layer copy."""
+        layer_files = sorted(os.listdir(self.layer_dir))
+        cache_dir = os.path.join(self.temp_dir, 'index')
+
+        for property_name in ['area_name', 'area_id']:
+            index_dir = os.path.join(cache_dir, property_name)
+            indexed_path = indexed_layer_copy(
+                self.layer_path, index_dir, property_name)
+            self.assertEqual(
+                indexed_path, os.path.join(index_dir, 'small_grid.shp'))
+            self.assertTrue(
+                os.path.exists(os.path.join(index_dir, 'small_grid.idm')))
+            # Built only once
+            self.assertEqual(
+                indexed_layer_copy(self.layer_path, index_dir, property_name),
+                indexed_path)
+
+        # Uploaded layer files are untouched
+        self.assertEqual(sorted(os.listdir(self.layer_dir)), layer_files)
+        # No temporary directory is left
+        self.assertEqual(
+            sorted(os.listdir(cache_dir)), ['area_id', 'area_name'])
+
+        output_path = os.path.join(self.temp_dir, 'filtered.geojson')
+        self.assertEqual(filter_aggregation_local(
+            os.path.join(cache_dir, 'area_id', 'small_grid.shp'),
+            output_path, 'area_id', [10]), 1)
+
+        # Unknown property can't be indexed
+        self.assertIsNone(indexed_layer_copy(
+            self.layer_path, os.path.join(cache_dir, 'unknown'), 'unknown'))
+        self.assertFalse(os.path.exists(os.path.join(cache_dir, 'unknown')))
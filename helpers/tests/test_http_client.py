@@ -0,0 +1,109 @@
+# coding=utf-8
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from django.test import SimpleTestCase, override_settings
+
+from geosafe.helpers.http_client import HTTPClient
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestRequestHandler(BaseHTTPRequestHandler):
+    # Keep connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.client_ports.add(self.client_address[1])
+        server.paths.append(self.path)
+        server.cookies.append(self.headers.get('Cookie'))
+        if self.path == '/unavailable' and server.paths.count(self.path) < 2:
+            status, body = 503, 'unavailable'
+        elif self.path == '/down':
+            status, body = 503, 'down'
+        else:
+            status, body = 200, 'content of {0}'.format(self.path)
+        self.send_response(status)
+        if self.path == '/login':
+            self.send_header('Set-Cookie', 'JSESSIONID=user-a; Path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# Counters are only kept in memory, these tests don't use the database
+@override_settings(
+    HTTP_CLIENT_RETRIES=2, HTTP_CLIENT_RETRY_BACKOFF=0,
+    HTTP_CLIENT_COUNTER_FLUSH_INTERVAL=None)
+class TestHTTPClient(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), TestRequestHandler)
+        self.server.client_ports = set()
+        self.server.paths = []
+        self.server.cookies = []
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        self.client = HTTPClient()
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reuse(self):
+        """Test that requests to a host share a kept alive connection."""
+        for path in ['/a', '/b', '/c']:
+            response = self.client.get(self.url + path, endpoint='test')
+            self.assertEqual(response.content, 'content of ' + path)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+        stats = self.client.stats()['test']
+        self.assertEqual(stats.requests, {200: 3})
+        self.assertEqual(stats.bytes_received, len('content of /a') * 3)
+
+    def test_retry(self):
+        """Test that unavailable responses are retried."""
+        response = self.client.get(self.url + '/unavailable')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.paths, ['/unavailable'] * 2)
+
+        # Counters are labelled with the host by default
+        stats = self.client.stats()[self.url[len('http://'):]]
+        self.assertEqual(stats.requests, {200: 1})
+
+    def test_retry_exhausted(self):
+        """Test that the last response is returned after retries."""
+        response = self.client.get(self.url + '/down')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.ok)
+        # First request and two retries
+        self.assertEqual(self.server.paths, ['/down'] * 3)
+
+    def test_no_cookies(self):
+        """Test that cookies of a request are not sent by later ones."""
+        self.client.get(self.url + '/login', auth=('user-a', 'password'))
+        self.client.get(self.url + '/data')
+        self.assertEqual(self.server.cookies, [None, None])
+        self.assertEqual(len(self.client.session.cookies), 0)
+
+    def test_stream(self):
+        """Test that streamed body is counted as it is consumed."""
+        response = self.client.get(
+            self.url + '/stream', endpoint='test', stream=True)
+        self.assertEqual(self.client.stats()['test'].bytes_received, 0)
+        content = ''.join(response.iter_content(chunk_size=4))
+        self.assertEqual(content, 'content of /stream')
+        self.assertEqual(
+            self.client.stats()['test'].bytes_received, len(content))
@@ -0,0 +1,195 @@
+# coding=utf-8
+import glob
+import json
+import os
+import unittest
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import SimpleTestCase
+from lxml import etree
+
+from geonode.layers.utils import file_upload
+from geosafe.helpers.inasafe_helper import (
+    InaSAFETestData,
+    INASAFE_TESTING_ENVIRONMENT,
+    INASAFE_TESTING_ENVIRONMENT_NOT_CONFIGURED_MESSAGE,
+    extract_inasafe_keywords_from_metadata,
+    parse_inasafe_keywords)
+from geosafe.helpers.metadata import inasafe_keywords_xml
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase, \
+    wait_metadata
+from geosafe.models import ISO_METADATA_NAMESPACES
+from geosafe.tasks.analysis import get_layer_keywords_url
+from geosafe.tasks.headless.analysis import get_keywords
+
+
+def sample_metadata_files():
+    """List sample layer metadata files of InaSAFE test data.
+
+    :return: list of xml file path
+    :rtype: list
+    """
+    return sorted(glob.glob(InaSAFETestData.path_finder('*', '*.xml')))
+
+
+def sample_keywords_xml(metadata_path):
+    """Read InaSAFE keywords xml from a metadata file.
+
+    The keywords xml is the same as the one stored in Metadata.keywords_xml
+
+    :param metadata_path: path of ISO metadata xml file
+    :type metadata_path: str
+
+    :rtype: str
+    """
+    with open(metadata_path) as f:
+        inasafe_el, inasafe_provenance_el = \
+            extract_inasafe_keywords_from_metadata(f.read())
+    return inasafe_keywords_xml(inasafe_el, inasafe_provenance_el)
+
+
+def keywords_xml_from_values(values):
+    """Generate InaSAFE keywords xml.
+
+    :param values: keyword name, gco type, and text
+    :type values: list
+
+    :rtype: str
+    """
+    keywords = ''.join(
+        '<{name}><gco:{type}>{text}</gco:{type}></{name}>'.format(
+            name=name, type=value_type, text=text)
+        for name, value_type, text in values)
+    return '<inasafe xmlns:gco="{gco}">{keywords}</inasafe>'.format(
+        gco=ISO_METADATA_NAMESPACES['gco'], keywords=keywords)
+
+
+class TestInaSAFEKeywordsParser(SimpleTestCase):
+
+    def test_sample_keywords(self):
+        """Test parsing keywords of every sample metadata."""
+        metadata_files = sample_metadata_files()
+        self.assertTrue(metadata_files)
+
+        for metadata_path in metadata_files:
+            keywords_xml = sample_keywords_xml(metadata_path)
+            keywords = parse_inasafe_keywords(keywords_xml)
+            self.assertTrue(keywords, metadata_path)
+
+            # Every non empty keyword is parsed
+            inasafe_el = etree.XML(keywords_xml)
+            expected_keys = set(
+                el.tag for el in inasafe_el if el[0].text and (
+                    el[0].text.strip()))
+            self.assertEqual(set(keywords.keys()), expected_keys)
+
+            layer_purpose = os.path.basename(os.path.dirname(metadata_path))
+            if layer_purpose in ['hazard', 'exposure', 'aggregation']:
+                self.assertEqual(keywords['layer_purpose'], layer_purpose)
+            self.assertTrue(keywords['keyword_version'].startswith('4.'))
+
+    def test_sample_keyword_values(self):
+        """Test keyword values of sample metadata."""
+        keywords = parse_inasafe_keywords(sample_keywords_xml(
+            InaSAFETestData.hazard('flood_data.xml')))
+        self.assertEqual(keywords['hazard'], 'flood')
+        self.assertEqual(keywords['layer_mode'], 'classified')
+        self.assertEqual(keywords['layer_geometry'], 'polygon')
+        self.assertEqual(
+            keywords['inasafe_fields'], {'hazard_value_field': 'state'})
+        self.assertEqual(
+            keywords['value_map']['structure']['flood_hazard_classes'][
+                'classes']['wet'],
+            [2, 3, 4])
+        # Empty keywords are omitted
+        self.assertNotIn('thresholds', keywords)
+        self.assertNotIn('active_band', keywords)
+
+    def test_keyword_types(self):
+        """Test conversion of each keyword type."""
+        keywords = parse_inasafe_keywords(keywords_xml_from_values([
+            ('keyword_version', 'CharacterString', '4.4'),
+            ('active_band', 'Integer', '1'),
+            ('resolution', 'FloatTuple', '(0.25, 0.5)'),
+            ('scale', 'Real', '0.5'),
+            ('use_population_rounding', 'Boolean', 'false'),
+            ('inasafe_fields', 'Dictionary', '{"exposure_id_field": "id"}'),
+            ('date', 'Date', '2018-01-31'),
+            ('datetime', 'DateTime', '2018-01-31T10:20:30'),
+        ]))
+        self.assertEqual(keywords['active_band'], 1)
+        self.assertEqual(keywords['resolution'], (0.25, 0.5))
+        self.assertEqual(keywords['scale'], 0.5)
+        self.assertIs(keywords['use_population_rounding'], False)
+        self.assertEqual(
+            keywords['inasafe_fields'], {'exposure_id_field': 'id'})
+        self.assertEqual(keywords['date'].isoformat(), '2018-01-31')
+        self.assertEqual(
+            keywords['datetime'].isoformat(), '2018-01-31T10:20:30')
+
+    def test_unsupported_keywords(self):
+        """Test keywords that are left to InaSAFE Headless."""
+        # Legacy keywords
+        self.assertIsNone(parse_inasafe_keywords(keywords_xml_from_values([
+            ('keyword_version', 'CharacterString', '3.5'),
+            ('layer_purpose', 'CharacterString', 'hazard'),
+        ])))
+        # Unknown type
+        self.assertIsNone(parse_inasafe_keywords(keywords_xml_from_values([
+            ('keyword_version', 'CharacterString', '4.4'),
+            ('layer_purpose', 'Polygon', 'hazard'),
+        ])))
+        # Invalid value
+        self.assertIsNone(parse_inasafe_keywords(keywords_xml_from_values([
+            ('keyword_version', 'CharacterString', '4.4'),
+            ('inasafe_fields', 'Dictionary', '{invalid'),
+        ])))
+        # Keyword version that is not a string
+        for value_type, text in [('Integer', '4'), ('Real', '4.4')]:
+            self.assertIsNone(parse_inasafe_keywords(
+                keywords_xml_from_values([
+                    ('keyword_version', value_type, text),
+                    ('layer_purpose', 'CharacterString', 'hazard'),
+                ])))
+        # No keywords
+        self.assertIsNone(parse_inasafe_keywords(''))
+        self.assertIsNone(parse_inasafe_keywords('<inasafe'))
+
+
+class TestInaSAFEKeywordsConformance(GeoSAFEIntegrationLiveServerTestCase):
+
+    @unittest.skipUnless(
+        INASAFE_TESTING_ENVIRONMENT,
+        INASAFE_TESTING_ENVIRONMENT_NOT_CONFIGURED_MESSAGE)
+    def test_keywords_match_headless(self):
+        """Test that parsed keywords are the same as InaSAFE keywords."""
+        layer_files = [
+            self.data_helper.hazard('flood_data.geojson'),
+            self.data_helper.hazard('ash_fall.tif'),
+            self.data_helper.hazard('earthquake.asc'),
+            self.data_helper.hazard('grid-use_ascii.tif'),
+            self.data_helper.exposure('buildings.geojson'),
+            self.data_helper.exposure('landcover.geojson'),
+            self.data_helper.exposure('places.geojson'),
+            self.data_helper.exposure('population_multi_fields.geojson'),
+            self.data_helper.aggregation('small_grid.geojson'),
+            self.data_helper.misc('flood_epsg_23833.geojson'),
+        ]
+        for layer_file in layer_files:
+            layer = file_upload(layer_file)
+            wait_metadata(layer)
+
+            local_keywords = parse_inasafe_keywords(
+                layer.inasafe_metadata.keywords_xml)
+            headless_keywords = get_keywords.delay(
+                get_layer_keywords_url(layer)).get()
+
+            # Compare the keywords as stored in keywords_json
+            self.assertEqual(
+                json.loads(json.dumps(
+                    local_keywords, cls=DjangoJSONEncoder)),
+                json.loads(json.dumps(
+                    headless_keywords, cls=DjangoJSONEncoder)),
+                layer_file)
+
+            layer.delete()
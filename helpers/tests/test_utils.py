@@ -1,19 +1,30 @@
 # coding=utf-8
 import os
+import shutil
+import tempfile
+import threading
+import time
 import urlparse
+from zipfile import ZipFile
 
 from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import LiveServerTestCase
+from django.db import connection
+from django.test import LiveServerTestCase, SimpleTestCase
 
 from geonode.layers.utils import file_upload
 from geosafe.app_settings import settings
 from geosafe.helpers.inasafe_helper import InaSAFETestData
 from geosafe.helpers.utils import (
     download_file,
+    extract_zip_members,
     get_layer_path,
-    get_impact_path, wait_metadata)
-from geosafe.models import Analysis
+    get_impact_path,
+    layer_member_names,
+    link_or_copy_file,
+    wait_metadata)
+from geosafe.models import Analysis, Metadata
+from geosafe.tasks.analysis import set_layer_purpose
 
 
 class TestHelpersUtils(LiveServerTestCase):
@@ -212,3 +223,74 @@ class TestHelpersUtils(LiveServerTestCase):
 
         settings.set(
             'GEOSAFE_IMPACT_OUTPUT_DIRECTORY', geosafe_impact_output_dir)
+
+    def test_wait_metadata(self):
+        """Test that wait_metadata wakes up when metadata is ready."""
+        data_helper = InaSAFETestData()
+        hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+        self.assertTrue(wait_metadata(hazard))
+
+        metadata = Metadata.objects.get(layer=hazard)
+        keywords = metadata.keywords
+        Metadata.objects.filter(layer=hazard).update(layer_purpose='')
+        self.assertFalse(wait_metadata(hazard, wait_time=0.1, retry_count=1))
+
+        timer = threading.Timer(
+            1, set_layer_purpose, [keywords, hazard.id])
+        timer.start()
+        start_time = time.time()
+        self.assertTrue(wait_metadata(hazard, wait_time=30, retry_count=1))
+        elapsed = time.time() - start_time
+        timer.join()
+
+        if connection.vendor == 'postgresql':
+            # Notified, instead of waiting for the next check
+            self.assertLess(elapsed, 10)
+
+        hazard.delete()
+
+
+class TestImpactFiles(SimpleTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_extract_layer_members(self):
+        """Test extracting only the files of one layer."""
+        names = [
+            'impact/impact_analysis.shp',
+            'impact/impact_analysis.shx',
+            'impact/impact_analysis.dbf',
+            'impact/impact_analysis.aux.xml',
+            'impact/analysis_summary.shp',
+            'impact/impact_analysis_2.shp',
+            'impact_analysis.shp',
+        ]
+        self.assertEqual(
+            layer_member_names(names, 'impact/impact_analysis.shp'),
+            names[:4])
+
+        zip_path = os.path.join(self.temp_dir, 'impact.zip')
+        with ZipFile(zip_path, 'w') as zf:
+            for name in names:
+                zf.writestr(name, name)
+        extract_dir = os.path.join(self.temp_dir, 'extract')
+        with ZipFile(zip_path) as zf:
+            bytes_written = extract_zip_members(zf, names[:4], extract_dir)
+        self.assertEqual(bytes_written, sum(len(n) for n in names[:4]))
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(extract_dir, 'impact'))),
+            sorted(os.path.basename(n) for n in names[:4]))
+
+    def test_link_or_copy_file(self):
+        """Test hardlinking a file on the same filesystem."""
+        source = os.path.join(self.temp_dir, 'source.geojson')
+        target = os.path.join(self.temp_dir, 'target.geojson')
+        with open(source, 'w') as f:
+            f.write('{}')
+
+        self.assertEqual(link_or_copy_file(source, target), 0)
+        self.assertTrue(os.path.samefile(source, target))
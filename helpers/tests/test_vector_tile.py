@@ -0,0 +1,66 @@
+# coding=utf-8
+import unittest
+
+from geosafe.helpers.vector_tile import (
+    GEOM_POINT,
+    GEOM_LINESTRING,
+    GEOM_POLYGON,
+    WEB_MERCATOR_ORIGIN,
+    encode_geometry,
+    encode_tile_layer,
+    encode_varint,
+    tile_bounds,
+    zigzag)
+
+
+class TestVectorTile(unittest.TestCase):
+
+    def test_tile_bounds(self):
+        """Test bounds of Web Mercator tiles."""
+        self.assertEqual(
+            tile_bounds(0, 0, 0),
+            (-WEB_MERCATOR_ORIGIN, -WEB_MERCATOR_ORIGIN,
+             WEB_MERCATOR_ORIGIN, WEB_MERCATOR_ORIGIN))
+        # Bottom right quarter of the world
+        self.assertEqual(
+            tile_bounds(1, 1, 1),
+            (0, -WEB_MERCATOR_ORIGIN, WEB_MERCATOR_ORIGIN, 0))
+
+    def test_encoding(self):
+        """Test protobuf varint and zigzag encoding."""
+        self.assertEqual(encode_varint(1), bytearray([1]))
+        self.assertEqual(encode_varint(300), bytearray([0xAC, 0x02]))
+        self.assertEqual(
+            [zigzag(v) for v in [0, -1, 1, -2, 2]], [0, 1, 2, 3, 4])
+
+    def test_geometry_commands(self):
+        """Test geometry encoding with examples of the specification."""
+        self.assertEqual(
+            encode_geometry(GEOM_POINT, [(25, 17)]), [9, 50, 34])
+        self.assertEqual(
+            encode_geometry(GEOM_POINT, [(5, 7), (3, 2)]),
+            [17, 10, 14, 3, 9])
+        self.assertEqual(
+            encode_geometry(GEOM_LINESTRING, [[(2, 2), (2, 10), (10, 10)]]),
+            [9, 4, 4, 18, 0, 16, 16, 0])
+        self.assertEqual(
+            encode_geometry(GEOM_POLYGON, [[[(3, 6), (8, 12), (20, 34)]]]),
+            [9, 6, 12, 18, 10, 12, 24, 44, 15])
+
+    def test_tile_layer(self):
+        """Test that keys and values are shared by features."""
+        features = [
+            (1, [('name', u'Jakarta'), ('count', 1)], GEOM_POINT,
+             encode_geometry(GEOM_POINT, [(25, 17)])),
+            (2, [('name', u'Bogor'), ('count', 1.0)], GEOM_POINT,
+             encode_geometry(GEOM_POINT, [(5, 7)])),
+        ]
+        tile = encode_tile_layer('places', features)
+        self.assertEqual(tile.count('name'), 1)
+        self.assertEqual(tile.count('count'), 1)
+        self.assertIn('Jakarta', tile)
+        self.assertIn('Bogor', tile)
+        # Layer field of the Tile message
+        self.assertEqual(tile[0], chr(3 << 3 | 2))
+
+        self.assertEqual(encode_tile_layer('places', []), b'')
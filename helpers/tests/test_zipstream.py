@@ -0,0 +1,59 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from zipfile import ZipFile, ZIP_STORED
+
+from geosafe.helpers.zipstream import ZipStream
+
+
+class TestZipStream(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_archive(self, zip_stream):
+        archive_path = os.path.join(self.temp_dir, 'archive.zip')
+        with open(archive_path, 'wb') as f:
+            for chunk in zip_stream:
+                f.write(chunk)
+        return archive_path
+
+    def test_zip_stream(self):
+        """Test that streamed archive can be read by zipfile."""
+        layer_path = os.path.join(self.temp_dir, 'layer.tif')
+        layer_content = os.urandom(200 * 1024)
+        with open(layer_path, 'wb') as f:
+            f.write(layer_content)
+
+        zip_stream = ZipStream(chunk_size=4096)
+        zip_stream.write(layer_path)
+        zip_stream.writestr(u'r\xe9sum\xe9.txt', 'summary' * 1000)
+        # Unknown size will be written using ZIP64 extension
+        zip_stream.write_fileobj('stream.txt', lambda: BytesIO('x' * 10000))
+
+        with ZipFile(self.write_archive(zip_stream)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                zf.namelist(),
+                ['layer.tif', u'r\xe9sum\xe9.txt', 'stream.txt'])
+            self.assertEqual(zf.read('layer.tif'), layer_content)
+            self.assertEqual(zf.read(u'r\xe9sum\xe9.txt'), 'summary' * 1000)
+            self.assertEqual(zf.read('stream.txt'), 'x' * 10000)
+
+    def test_zip_stream_stored(self):
+        """Test archive without compression."""
+        zip_stream = ZipStream(compression=ZIP_STORED)
+        zip_stream.writestr('report.pdf', 'content')
+
+        with ZipFile(self.write_archive(zip_stream)) as zf:
+            self.assertIsNone(zf.testzip())
+            info = zf.getinfo('report.pdf')
+            self.assertEqual(info.compress_type, ZIP_STORED)
+            self.assertEqual(info.compress_size, len('content'))
+            self.assertEqual(zf.read('report.pdf'), 'content')
@@ -1,28 +1,40 @@
 # coding=utf-8
+import hashlib
 import logging
 import os
 import re
+import select
 import shutil
 import tempfile
 import time
 import urllib
 import urlparse
 
-import requests
 from django.core.mail import send_mail
 from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.template.loader import render_to_string
 from django.test import LiveServerTestCase
 from django.utils.translation import ugettext as _
 
 from geonode.layers.models import Layer
 from geosafe.app_settings import settings
+from geosafe.helpers.http_client import http_client
 from geosafe.helpers.inasafe_helper import InaSAFETestData
 from geosafe.models import Analysis, Metadata
 
+try:
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+except ImportError:
+    psycopg2 = None
+
 LOGGER = logging.getLogger(__file__)
 
+# PostgreSQL notification channel of processed layer metadata
+METADATA_READY_CHANNEL = 'geosafe_metadata_ready'
+
 
 def download_file(url, direct_access=False, user=None, password=None):
     """Download file using http or file scheme.
@@ -52,10 +64,10 @@ def download_file(url, direct_access=False, user=None, password=None):
                           'Gecko/20071127 Firefox/2.0.0.11'
         }
         if user:
-            r = requests.get(
+            r = http_client.get(
                 url, headers=headers, stream=True, auth=(user, password))
         else:
-            r = requests.get(url, headers=headers, stream=True)
+            r = http_client.get(url, headers=headers, stream=True)
         with open(tmpfile, 'wb') as f:
             for chunk in r.iter_content(chunk_size=1024):
                 if chunk:
@@ -84,6 +96,72 @@ def download_file(url, direct_access=False, user=None, password=None):
     return tmpfile
 
 
+def layer_member_names(names, layer_name):
+    """Names of the files that make up a layer, among archive members.
+
+    These are the files in the same directory with the same base name, like
+    .shp, .shx, .dbf, .prj, .qml, .xml and .aux.xml of a shapefile.
+
+    :param names: archive member names
+    :type names: list
+
+    :param layer_name: member name of the layer file
+    :type layer_name: str
+
+    :return: member names of the layer files
+    :rtype: list
+    """
+    layer_dir, layer_filename = os.path.split(layer_name)
+    layer_base = layer_filename.split('.')[0]
+    return [
+        name for name in names
+        if os.path.dirname(name) == layer_dir and (
+            os.path.basename(name).split('.')[0] == layer_base)]
+
+
+def extract_zip_members(zip_file, names, target_dir):
+    """Extract some members of a zip archive.
+
+    :param zip_file: opened zip archive
+    :type zip_file: zipfile.ZipFile
+
+    :param names: member names to extract
+    :type names: list
+
+    :param target_dir: directory to extract into
+    :type target_dir: str
+
+    :return: number of bytes written
+    :rtype: int
+    """
+    bytes_written = 0
+    for name in set(names):
+        zip_file.extract(name, path=target_dir)
+        bytes_written += zip_file.getinfo(name).file_size
+    return bytes_written
+
+
+def link_or_copy_file(source, target):
+    """Hardlink a file, or copy it if it is on another filesystem.
+
+    :param source: source file path
+    :type source: str
+
+    :param target: target file path
+    :type target: str
+
+    :return: number of bytes written, 0 if the file is linked
+    :rtype: int
+    """
+    try:
+        os.link(source, target)
+        return 0
+    except (OSError, AttributeError):
+        # Cross device link, or hardlink is not supported
+        shutil.copyfile(source, target)
+        return os.path.getsize(target)
+
+
 def send_analysis_result_email(analysis):
     """Helper function to send email about the analysis result.
 
@@ -152,6 +230,31 @@ def get_layer_path(layer, base=None):
     return layer_url
 
 
+def layer_files_fingerprint(layer):
+    """Fingerprint of the files of a layer.
+
+    The fingerprint is calculated from name, size, and modification time of
+    each layer file, so it changes whenever the layer files are updated.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :return: hex digest fingerprint
+    :rtype: str
+    """
+    fingerprint = hashlib.sha1()
+    layer_files = sorted(
+        layer.upload_session.layerfile_set.all(),
+        key=lambda l: l.file.name)
+    for layer_file in layer_files:
+        file_stat = os.stat(layer_file.file.path)
+        fingerprint.update('{name}:{size}:{mtime};'.format(
+            name=os.path.basename(layer_file.file.name),
+            size=file_stat.st_size,
+            mtime=file_stat.st_mtime))
+    return fingerprint.hexdigest()
+
+
 def get_impact_path(impact_url):
     """Helper function to get path for Impact Result.
 
@@ -217,9 +320,68 @@ def copy_inasafe_metadata(inasafe_layer_path, target_dir, filename=None):
     return True
 
 
+def notify_metadata_ready(layer_id):
+    """Wake up processes waiting for layer metadata in wait_metadata.
+
+    Uses PostgreSQL NOTIFY, so it does nothing on other databases. The
+    notification is delivered when the current transaction is committed.
+
+    :param layer_id: layer ID
+    :type layer_id: int
+    """
+    if connection.vendor != 'postgresql':
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            'SELECT pg_notify(%s, %s)',
+            [METADATA_READY_CHANNEL, str(layer_id)])
+    finally:
+        cursor.close()
+
+
+def listen_metadata_ready():
+    """Open a database connection listening to metadata notification.
+
+    :return: psycopg2 connection, or None if notification is not available
+    """
+    if connection.vendor != 'postgresql' or not psycopg2:
+        return None
+    try:
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = listener.cursor()
+        cursor.execute('LISTEN {0}'.format(METADATA_READY_CHANNEL))
+        cursor.close()
+        return listener
+    except psycopg2.Error as e:
+        LOGGER.debug(e)
+        return None
+
+
+def is_metadata_ready(layer):
+    """Check that InaSAFE metadata of a layer is processed.
+
+    :param layer: GeoNode Layer
+    :type layer: geonode.layers.models.Layer
+
+    :rtype: bool
+    """
+    try:
+        metadata = Metadata.objects.get(layer=layer)
+        # Check if metadata is properly populated
+        return bool(metadata.layer_purpose and metadata.keywords_xml)
+    except Metadata.DoesNotExist:
+        return False
+
+
 def wait_metadata(layer, wait_time=1, retry_count=1200):
     """Wait for InaSAFE metadata to be processed.
 
+    On PostgreSQL, it wakes up as soon as set_layer_purpose notifies that
+    metadata is ready. Metadata is checked again every wait_time seconds,
+    in case the notification is not delivered.
+
     :param layer: GeoNode Layer
     :type layer: geonode.layers.models.Layer
 
@@ -228,23 +390,30 @@ def wait_metadata(layer, wait_time=1, retry_count=1200):
 
     :param retry_count: Number of retries
     :type retry_count: int
+
+    :return: True if metadata is ready
+    :rtype: bool
     """
-    metadata_created = False
-    retries = 0
-    while not metadata_created and retries < retry_count:
-        try:
-            metadata = Metadata.objects.get(layer=layer)
-            if metadata.layer_purpose and metadata.keywords_xml:
-                # Check if metadata is properly populated
-                metadata_created = True
-                break
-        except Metadata.DoesNotExist:
-            pass
-        time.sleep(wait_time)
-        retries += 1
-    if not metadata_created:
-        LOGGER.debug('Exit timeout.')
-        LOGGER.debug('For layer: {0}'.format(layer))
+    deadline = time.time() + wait_time * retry_count
+    # Listen before checking, so the notification can't be missed
+    listener = listen_metadata_ready()
+    try:
+        while not is_metadata_ready(layer):
+            timeout = min(wait_time, deadline - time.time())
+            if timeout <= 0:
+                LOGGER.debug('Exit timeout.')
+                LOGGER.debug('For layer: {0}'.format(layer))
+                return False
+            if listener:
+                select.select([listener], [], [], timeout)
+                listener.poll()
+                del listener.notifies[:]
+            else:
+                time.sleep(timeout)
+    finally:
+        if listener:
+            listener.close()
+    return True
 
 
 class GeoSAFEIntegrationLiveServerTestCase(LiveServerTestCase):
@@ -0,0 +1,561 @@
+# coding=utf-8
+"""Mapbox Vector Tiles of vector layers.
+
+Tiles are generated from the layer file with OGR. Features are read with a
+spatial filter on the tile, simplified according to the zoom level, clipped
+to the tile and encoded following the Mapbox Vector Tile specification 2.1.
+
+Tiles are stored in VECTOR_TILE_CACHE_DIRECTORY, keyed by layer id and the
+fingerprint of layer files, so a tile is only generated once for each
+version of layer files.
+"""
+
+import logging
+import os
+import shutil
+import struct
+import tempfile
+
+from geosafe.app_settings import settings
+from geosafe.helpers.utils import layer_files_fingerprint
+
+try:
+    from osgeo import ogr, osr
+except ImportError:
+    ogr = None
+    osr = None
+
+__author__ = 'lucernae'
+
+LOGGER = logging.getLogger(__name__)
+
+VECTOR_TILE_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# Size of tile coordinate space
+TILE_EXTENT = 4096
+
+# Features are clipped to the tile plus this buffer in tile coordinates, so
+# lines and polygon outlines are not drawn at the tile edges.
+TILE_BUFFER = 64
+
+# Half of the width of the world in EPSG:3857
+WEB_MERCATOR_ORIGIN = 20037508.342789244
+
+# Geometry types and commands of the specification
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+
+COMMAND_MOVE_TO = 1
+COMMAND_LINE_TO = 2
+COMMAND_CLOSE_PATH = 7
+
+# Protobuf wire types
+_WIRE_VARINT = 0
+_WIRE_64BIT = 1
+_WIRE_LENGTH_DELIMITED = 2
+
+_DOUBLE = struct.Struct('<d')
+
+
+def tile_bounds(z, x, y):
+    """Bounds of a tile of the Web Mercator tile grid.
+
+    :param z: zoom level
+    :type z: int
+
+    :param x: tile column
+    :type x: int
+
+    :param y: tile row, from the top
+    :type y: int
+
+    :return: minx, miny, maxx, maxy in EPSG:3857
+    :rtype: (float, float, float, float)
+    """
+    size = 2 * WEB_MERCATOR_ORIGIN / (1 << z)
+    minx = -WEB_MERCATOR_ORIGIN + x * size
+    maxy = WEB_MERCATOR_ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def is_valid_tile(z, x, y):
+    """Check that a tile is in the tile grid.
+
+    :rtype: bool
+    """
+    return 0 <= z <= settings.VECTOR_TILE_MAX_ZOOM and (
+        0 <= x < (1 << z) and 0 <= y < (1 << z))
+
+
+def simplify_tolerance(z):
+    """Simplification tolerance of a zoom level.
+
+    :param z: zoom level
+    :type z: int
+
+    :return: tolerance in EPSG:3857 units
+    :rtype: float
+    """
+    # Tiles are displayed at 256 pixels
+    pixel_size = 2 * WEB_MERCATOR_ORIGIN / (1 << z) / 256
+    return pixel_size * settings.VECTOR_TILE_SIMPLIFY_PIXELS
+
+
+def zigzag(value):
+    """ZigZag encoding of a signed integer.
+
+    :type value: int
+
+    :rtype: int
+    """
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def encode_varint(value):
+    """Protobuf varint of an unsigned integer.
+
+    :type value: int
+
+    :rtype: bytearray
+    """
+    data = bytearray()
+    while value > 0x7F:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+    return data
+
+
+def _key(field_number, wire_type):
+    return encode_varint((field_number << 3) | wire_type)
+
+
+def _length_delimited(field_number, data):
+    return _key(field_number, _WIRE_LENGTH_DELIMITED) + (
+        encode_varint(len(data)) + data)
+
+
+def _packed(field_number, values):
+    data = bytearray()
+    for value in values:
+        data += encode_varint(value)
+    return _length_delimited(field_number, data)
+
+
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return bytearray(value.encode('utf-8'))
+    return bytearray(value)
+
+
+def encode_value(value):
+    """Encode a property value as Value message.
+
+    :param value: property value
+    :type value: basestring, int, float, bool
+
+    :rtype: bytearray
+    """
+    if isinstance(value, bool):
+        return _key(7, _WIRE_VARINT) + encode_varint(int(value))
+    if isinstance(value, (int, long)):
+        if value < 0:
+            return _key(6, _WIRE_VARINT) + encode_varint(zigzag(value))
+        return _key(5, _WIRE_VARINT) + encode_varint(value)
+    if isinstance(value, float):
+        return _key(3, _WIRE_64BIT) + bytearray(_DOUBLE.pack(value))
+    if not isinstance(value, basestring):
+        value = str(value)
+    return _length_delimited(1, _to_bytes(value))
+
+
+def _ring_area(ring):
+    """Twice the signed area of a ring in tile coordinates."""
+    area = 0
+    for i in range(len(ring)):
+        x0, y0 = ring[i - 1]
+        x1, y1 = ring[i]
+        area += x0 * y1 - x1 * y0
+    return area
+
+
+def encode_geometry(geom_type, parts):
+    """Encode geometry commands of a feature.
+
+    :param geom_type: GEOM_POINT, GEOM_LINESTRING or GEOM_POLYGON
+    :type geom_type: int
+
+    :param parts: for points, list of points. For lines, list of lines as
+        list of points. For polygons, list of polygons as list of rings,
+        exterior ring first. Points are in tile coordinates.
+    :type parts: list
+
+    :return: list of command integers
+    :rtype: list
+    """
+    commands = []
+    cursor = [0, 0]
+
+    def move(points):
+        for x, y in points:
+            commands.append(zigzag(x - cursor[0]))
+            commands.append(zigzag(y - cursor[1]))
+            cursor[0], cursor[1] = x, y
+
+    def command(command_id, count):
+        commands.append((command_id & 0x7) | (count << 3))
+
+    if geom_type == GEOM_POINT:
+        if parts:
+            command(COMMAND_MOVE_TO, len(parts))
+            move(parts)
+        return commands
+
+    if geom_type == GEOM_LINESTRING:
+        for line in parts:
+            command(COMMAND_MOVE_TO, 1)
+            move(line[:1])
+            command(COMMAND_LINE_TO, len(line) - 1)
+            move(line[1:])
+        return commands
+
+    for rings in parts:
+        for ring in rings:
+            command(COMMAND_MOVE_TO, 1)
+            move(ring[:1])
+            command(COMMAND_LINE_TO, len(ring) - 1)
+            move(ring[1:])
+            command(COMMAND_CLOSE_PATH, 1)
+    return commands
+
+
+def encode_tile_layer(name, features, extent=TILE_EXTENT):
+    """Encode a vector tile with one layer.
+
+    :param name: layer name
+    :type name: basestring
+
+    :param features: list of feature id (or None), list of property name
+        and value, geometry type, and geometry commands
+    :type features: list
+
+    :param extent: size of tile coordinate space
+    :type extent: int
+
+    :return: encoded tile, empty if there is no feature
+    :rtype: bytes
+    """
+    if not features:
+        return b''
+
+    keys = {}
+    values = {}
+    layer = bytearray()
+    layer += _key(15, _WIRE_VARINT) + encode_varint(2)
+    layer += _length_delimited(1, _to_bytes(name))
+    for fid, properties, geom_type, commands in features:
+        tags = []
+        for key, value in properties:
+            tags.append(keys.setdefault(key, len(keys)))
+            # Type is part of the key, so 1, 1.0 and True are distinct
+            tags.append(values.setdefault(
+                (type(value), value), len(values)))
+        feature = bytearray()
+        if fid is not None and fid >= 0:
+            feature += _key(1, _WIRE_VARINT) + encode_varint(fid)
+        if tags:
+            feature += _packed(2, tags)
+        feature += _key(3, _WIRE_VARINT) + encode_varint(geom_type)
+        feature += _packed(4, commands)
+        layer += _length_delimited(2, feature)
+
+    for key in sorted(keys, key=keys.get):
+        layer += _length_delimited(3, _to_bytes(key))
+    for __, value in sorted(values, key=values.get):
+        layer += _length_delimited(4, encode_value(value))
+    layer += _key(5, _WIRE_VARINT) + encode_varint(extent)
+
+    return bytes(_length_delimited(3, layer))
+
+
+def _spatial_reference(epsg=None, wkt=None):
+    srs = osr.SpatialReference()
+    if wkt:
+        srs.ImportFromWkt(wkt)
+    else:
+        srs.ImportFromEPSG(epsg)
+    # GDAL 3 follows the axis order of the authority
+    if hasattr(srs, 'SetAxisMappingStrategy'):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def _collect_parts(geometry, points, lines, polygons, to_tile):
+    """Collect parts of an OGR geometry in tile coordinates."""
+    geom_type = ogr.GT_Flatten(geometry.GetGeometryType())
+    if geom_type == ogr.wkbPoint:
+        points.append(to_tile(geometry.GetX(), geometry.GetY()))
+    elif geom_type in (ogr.wkbLineString, ogr.wkbLinearRing):
+        line = _tile_path(geometry, to_tile)
+        if len(line) >= 2:
+            lines.append(line)
+    elif geom_type == ogr.wkbPolygon:
+        rings = []
+        for i in range(geometry.GetGeometryCount()):
+            ring = _tile_path(geometry.GetGeometryRef(i), to_tile)
+            # Closing point is implied by ClosePath
+            if len(ring) > 1 and ring[0] == ring[-1]:
+                ring.pop()
+            area = _ring_area(ring) if len(ring) >= 3 else 0
+            if not area:
+                if not rings:
+                    # Exterior ring is too small at this zoom level
+                    return
+                continue
+            # Exterior ring is clockwise in tile coordinates, which is a
+            # positive area, interior rings are counter clockwise.
+            if (area > 0) != (not rings):
+                ring.reverse()
+            rings.append(ring)
+        if rings:
+            polygons.append(rings)
+    else:
+        for i in range(geometry.GetGeometryCount()):
+            _collect_parts(
+                geometry.GetGeometryRef(i), points, lines, polygons, to_tile)
+
+
+def _tile_path(geometry, to_tile):
+    """Points of a line in tile coordinates, without repeated points."""
+    path = []
+    for i in range(geometry.GetPointCount()):
+        point = to_tile(geometry.GetX(i), geometry.GetY(i))
+        if not path or path[-1] != point:
+            path.append(point)
+    return path
+
+
+def _feature_properties(feature, layer_definition):
+    properties = []
+    for i in range(layer_definition.GetFieldCount()):
+        if not feature.IsFieldSet(i) or (
+                hasattr(feature, 'IsFieldNull') and feature.IsFieldNull(i)):
+            continue
+        field_type = layer_definition.GetFieldDefn(i).GetType()
+        if field_type == ogr.OFTInteger:
+            value = feature.GetFieldAsInteger(i)
+        elif field_type == getattr(ogr, 'OFTInteger64', None):
+            value = feature.GetFieldAsInteger64(i)
+        elif field_type == ogr.OFTReal:
+            value = feature.GetFieldAsDouble(i)
+        else:
+            value = feature.GetFieldAsString(i)
+        properties.append(
+            (layer_definition.GetFieldDefn(i).GetName(), value))
+    return properties
+
+
+def render_vector_tile(layer_path, name, z, x, y):
+    """Generate a vector tile of a layer file.
+
+    :param layer_path: path of the vector layer file
+    :type layer_path: basestring
+
+    :param name: name of the layer in the tile
+    :type name: basestring
+
+    :param z: zoom level
+    :type z: int
+
+    :param x: tile column
+    :type x: int
+
+    :param y: tile row
+    :type y: int
+
+    :return: encoded tile
+    :rtype: bytes
+    """
+    if not ogr:
+        raise IOError('OGR is not available')
+
+    data_source = ogr.Open(layer_path)
+    if not data_source:
+        raise IOError('Failed to open {0}'.format(layer_path))
+    layer = data_source.GetLayer(0)
+
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    buffer_size = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+    clip_ring = ogr.Geometry(ogr.wkbLinearRing)
+    for point_x, point_y in [
+            (minx - buffer_size, miny - buffer_size),
+            (maxx + buffer_size, miny - buffer_size),
+            (maxx + buffer_size, maxy + buffer_size),
+            (minx - buffer_size, maxy + buffer_size),
+            (minx - buffer_size, miny - buffer_size)]:
+        clip_ring.AddPoint_2D(point_x, point_y)
+    clip_polygon = ogr.Geometry(ogr.wkbPolygon)
+    clip_polygon.AddGeometry(clip_ring)
+
+    web_mercator = _spatial_reference(epsg=3857)
+    layer_srs = layer.GetSpatialRef()
+    if layer_srs:
+        layer_srs = _spatial_reference(wkt=layer_srs.ExportToWkt())
+    else:
+        layer_srs = _spatial_reference(epsg=4326)
+    transform = None
+    if not layer_srs.IsSame(web_mercator):
+        transform = osr.CoordinateTransformation(layer_srs, web_mercator)
+        spatial_filter = clip_polygon.Clone()
+        spatial_filter.Segmentize(buffer_size)
+        spatial_filter.Transform(osr.CoordinateTransformation(
+            web_mercator, layer_srs))
+        filter_minx, filter_maxx, filter_miny, filter_maxy = (
+            spatial_filter.GetEnvelope())
+        layer.SetSpatialFilterRect(
+            filter_minx, filter_miny, filter_maxx, filter_maxy)
+    else:
+        layer.SetSpatialFilter(clip_polygon)
+
+    scale_x = TILE_EXTENT / (maxx - minx)
+    scale_y = TILE_EXTENT / (maxy - miny)
+
+    def to_tile(point_x, point_y):
+        return (
+            int(round((point_x - minx) * scale_x)),
+            int(round((maxy - point_y) * scale_y)))
+
+    tolerance = simplify_tolerance(z)
+    layer_definition = layer.GetLayerDefn()
+    features = []
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if not geometry:
+            continue
+        geometry = geometry.Clone()
+        if transform:
+            try:
+                failed = geometry.Transform(transform) != 0
+            except RuntimeError:
+                failed = True
+            if failed:
+                # Outside of Web Mercator
+                continue
+        geometry = geometry.SimplifyPreserveTopology(tolerance)
+        if geometry:
+            geometry = geometry.Intersection(clip_polygon)
+        if not geometry or geometry.IsEmpty():
+            continue
+
+        points, lines, polygons = [], [], []
+        _collect_parts(geometry, points, lines, polygons, to_tile)
+        properties = None
+        for geom_type, parts in [
+                (GEOM_POINT, points),
+                (GEOM_LINESTRING, lines),
+                (GEOM_POLYGON, polygons)]:
+            if not parts:
+                continue
+            if properties is None:
+                properties = _feature_properties(feature, layer_definition)
+            features.append((
+                feature.GetFID(), properties, geom_type,
+                encode_geometry(geom_type, parts)))
+
+    data_source = None
+    return encode_tile_layer(name, features)
+
+
+def vector_tile_path(layer, fingerprint, z, x, y):
+    """Path of cached vector tile of a layer.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :param fingerprint: fingerprint of layer files
+    :type fingerprint: str
+
+    :rtype: str
+    """
+    return os.path.join(
+        settings.VECTOR_TILE_CACHE_DIRECTORY, str(layer.id), fingerprint,
+        str(z), str(x), '{0}.pbf'.format(y))
+
+
+def get_vector_tile(layer, z, x, y):
+    """Get cached vector tile of a layer, generate it if it doesn't exist.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :param z: zoom level
+    :type z: int
+
+    :param x: tile column
+    :type x: int
+
+    :param y: tile row
+    :type y: int
+
+    :return: tile path and fingerprint of layer files
+    :rtype: (str, str)
+    """
+    fingerprint = layer_files_fingerprint(layer)
+    tile_path = vector_tile_path(layer, fingerprint, z, x, y)
+    if os.path.exists(tile_path):
+        return tile_path, fingerprint
+
+    version_dir = os.path.join(
+        settings.VECTOR_TILE_CACHE_DIRECTORY, str(layer.id), fingerprint)
+    new_version = not os.path.exists(version_dir)
+    tile_dir = os.path.dirname(tile_path)
+    if not os.path.exists(tile_dir):
+        try:
+            os.makedirs(tile_dir)
+        except OSError:
+            # Possibly created by other process
+            if not os.path.isdir(tile_dir):
+                raise
+
+    content = render_vector_tile(
+        layer.qgis_layer.base_layer_path, layer.name, z, x, y)
+
+    # Write in a temporary file first, so other process will never serve
+    # a partial tile.
+    fd, temp_path = tempfile.mkstemp(suffix='.pbf.tmp', dir=tile_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.rename(temp_path, tile_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    if new_version:
+        # Tiles of previous version of layer files are no longer valid
+        invalidate_vector_tiles(layer, keep=version_dir)
+    return tile_path, fingerprint
+
+
+def invalidate_vector_tiles(layer, keep=None):
+    """Remove cached vector tiles of a layer.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :param keep: Directory of tiles to keep, if they are still valid
+    :type keep: str
+    """
+    layer_dir = os.path.join(
+        settings.VECTOR_TILE_CACHE_DIRECTORY, str(layer.id))
+    if not os.path.isdir(layer_dir):
+        return
+    for name in os.listdir(layer_dir):
+        version_dir = os.path.join(layer_dir, name)
+        if version_dir == keep:
+            continue
+        try:
+            shutil.rmtree(version_dir)
+        except OSError as e:
+            LOGGER.debug(e)
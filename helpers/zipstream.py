@@ -0,0 +1,369 @@
+# coding=utf-8
+"""Streaming zip archive writer.
+
+The standard zipfile module seeks back to update each local file header, so
+it can't write into a stream. ZipStream writes each member with a data
+descriptor after the data, so the archive can be generated chunk by chunk,
+for example to be served with StreamingHttpResponse, with bounded memory.
+
+ZIP64 extensions are used when a member or the archive is too large for the
+standard format.
+"""
+
+import os
+import struct
+import time
+import zlib
+from io import BytesIO
+from zipfile import ZIP_STORED, ZIP_DEFLATED, ZIP64_LIMIT, ZIP_MAX_COMMENT
+
+__author__ = 'lucernae'
+
+# Default size of chunk read from member files
+CHUNK_SIZE = 64 * 1024
+
+# Maximum number of entries of central directory without ZIP64
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+# Header structures, see zipfile module and PKWARE APPNOTE
+_LOCAL_FILE_HEADER = struct.Struct('<4s2B4HL2L2H')
+_LOCAL_FILE_HEADER_SIGNATURE = b'PK\003\004'
+
+_DATA_DESCRIPTOR = struct.Struct('<4sL2L')
+_DATA_DESCRIPTOR_64 = struct.Struct('<4sL2Q')
+_DATA_DESCRIPTOR_SIGNATURE = b'PK\007\010'
+
+_CENTRAL_DIRECTORY = struct.Struct('<4s4B4HL2L5H2L')
+_CENTRAL_DIRECTORY_SIGNATURE = b'PK\001\002'
+
+_END_ARCHIVE = struct.Struct('<4s4H2LH')
+_END_ARCHIVE_SIGNATURE = b'PK\005\006'
+
+_END_ARCHIVE_64 = struct.Struct('<4sQ2H2L4Q')
+_END_ARCHIVE_64_SIGNATURE = b'PK\006\006'
+
+_END_ARCHIVE_64_LOCATOR = struct.Struct('<4sLQL')
+_END_ARCHIVE_64_LOCATOR_SIGNATURE = b'PK\006\007'
+
+_ZIP64_EXTRA_HEADER_ID = 0x0001
+
+# General purpose flags
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8_FILENAME = 0x800
+
+# Version needed to extract
+_DEFAULT_VERSION = 20
+_ZIP64_VERSION = 45
+
+# Unix file system, regular file with 0644 permission
+_CREATE_SYSTEM = 3
+_EXTERNAL_ATTR = (0o100644 & 0xFFFF) << 16
+
+
+def _dos_date_time(date_time):
+    """Convert time tuple into MS-DOS date and time.
+
+    :param date_time: time tuple of (year, month, day, hour, min, sec)
+    :type date_time: tuple
+
+    :return: MS-DOS date and time
+    :rtype: (int, int)
+    """
+    year, month, day, hour, minute, second = date_time[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | (second // 2)
+    return dos_date, dos_time
+
+
+def _needs_zip64(size):
+    """Check if a member of a given size may exceed ZIP limit.
+
+    Deflate may produce slightly larger output for incompressible data, so
+    we leave some margin.
+
+    :param size: uncompressed size, None if unknown
+    :type size: int
+
+    :rtype: bool
+    """
+    if size is None:
+        return True
+    return size + size // 1000 + 1024 >= ZIP64_LIMIT
+
+
+class ZipMember(object):
+    """Member file of a ZipStream."""
+
+    def __init__(self, arcname, opener, size=None, date_time=None):
+        """Member file of a ZipStream.
+
+        :param arcname: Name of the file in the archive
+        :type arcname: basestring
+
+        :param opener: Callable that returns file-like object of the content
+        :type opener: callable
+
+        :param size: Size of the file, if known
+        :type size: int
+
+        :param date_time: time tuple of the file modification time
+        :type date_time: tuple
+        """
+        self.arcname = arcname
+        self.opener = opener
+        self.size = size
+        self.date_time = date_time or time.localtime()[:6]
+        self.zip64 = _needs_zip64(size)
+        self.flag_bits = _FLAG_DATA_DESCRIPTOR
+        self.compress_type = ZIP_STORED
+
+        self.encoded_arcname = arcname
+        if isinstance(arcname, unicode):
+            try:
+                self.encoded_arcname = arcname.encode('ascii')
+            except UnicodeEncodeError:
+                self.flag_bits |= _FLAG_UTF8_FILENAME
+                self.encoded_arcname = arcname.encode('utf-8')
+
+        # Populated while writing
+        self.header_offset = 0
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+
+class ZipStream(object):
+    """Zip archive generated as an iterable of byte chunks.
+
+    Usage:
+
+        zip_stream = ZipStream()
+        zip_stream.write('/path/to/layer.tif', 'layer.tif')
+        zip_stream.writestr('readme.txt', 'content')
+        response = StreamingHttpResponse(zip_stream)
+
+    Member files are only opened and read while the archive is iterated.
+    """
+
+    def __init__(self, compression=ZIP_DEFLATED, chunk_size=CHUNK_SIZE):
+        """Zip archive generated as an iterable of byte chunks.
+
+        :param compression: ZIP_DEFLATED or ZIP_STORED
+        :type compression: int
+
+        :param chunk_size: Size of chunk read from member files
+        :type chunk_size: int
+        """
+        if compression not in (ZIP_STORED, ZIP_DEFLATED):
+            raise RuntimeError('Unsupported compression method')
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.members = []
+        self.comment = b''
+
+    def write(self, filename, arcname=None):
+        """Add a file from disk.
+
+        :param filename: Path of the file
+        :type filename: basestring
+
+        :param arcname: Name of the file in the archive, default to the
+            basename of filename
+        :type arcname: basestring
+        """
+        arcname = arcname or os.path.basename(filename)
+        st = os.stat(filename)
+        self.members.append(ZipMember(
+            arcname,
+            lambda: open(filename, 'rb'),
+            size=st.st_size,
+            date_time=time.localtime(st.st_mtime)[:6]))
+
+    def writestr(self, arcname, data):
+        """Add a file from a string.
+
+        :param arcname: Name of the file in the archive
+        :type arcname: basestring
+
+        :param data: Content of the file
+        :type data: str
+        """
+        self.members.append(ZipMember(
+            arcname, lambda: BytesIO(data), size=len(data)))
+
+    def write_fileobj(self, arcname, opener, size=None, date_time=None):
+        """Add a file from a file-like object.
+
+        :param arcname: Name of the file in the archive
+        :type arcname: basestring
+
+        :param opener: Callable that returns file-like object of the content.
+            The file is closed after it is read.
+        :type opener: callable
+
+        :param size: Size of the file, if known. If not, ZIP64 extension
+            will be used for this member.
+        :type size: int
+
+        :param date_time: time tuple of the file modification time
+        :type date_time: tuple
+        """
+        self.members.append(
+            ZipMember(arcname, opener, size=size, date_time=date_time))
+
+    def __iter__(self):
+        offset = 0
+        for member in self.members:
+            member.header_offset = offset
+            for chunk in self._member_chunks(member):
+                offset += len(chunk)
+                yield chunk
+
+        central_directory_offset = offset
+        for member in self.members:
+            chunk = self._central_directory_header(member)
+            offset += len(chunk)
+            yield chunk
+
+        yield self._end_archive(
+            central_directory_offset, offset - central_directory_offset)
+
+    def _member_chunks(self, member):
+        """Generate local file header, data, and data descriptor."""
+        member.compress_type = self.compression
+        arcname = member.encoded_arcname
+        dos_date, dos_time = _dos_date_time(member.date_time)
+
+        if member.zip64:
+            version = _ZIP64_VERSION
+            # Sizes are written in data descriptor
+            extra = struct.pack(
+                '<2H2Q', _ZIP64_EXTRA_HEADER_ID, 16, 0, 0)
+            size_placeholder = 0xFFFFFFFF
+        else:
+            version = _DEFAULT_VERSION
+            extra = b''
+            size_placeholder = 0
+
+        yield _LOCAL_FILE_HEADER.pack(
+            _LOCAL_FILE_HEADER_SIGNATURE, version, 0,
+            member.flag_bits, member.compress_type, dos_time, dos_date,
+            0, size_placeholder, size_placeholder,
+            len(arcname), len(extra)) + arcname + extra
+
+        if member.compress_type == ZIP_DEFLATED:
+            compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        else:
+            compressor = None
+
+        crc = 0
+        file_size = 0
+        compress_size = 0
+        f = member.opener()
+        try:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    break
+                file_size += len(data)
+                crc = zlib.crc32(data, crc)
+                if compressor:
+                    data = compressor.compress(data)
+                    if not data:
+                        continue
+                compress_size += len(data)
+                yield data
+        finally:
+            f.close()
+
+        if compressor:
+            data = compressor.flush()
+            compress_size += len(data)
+            yield data
+
+        member.crc = crc & 0xFFFFFFFF
+        member.file_size = file_size
+        member.compress_size = compress_size
+
+        if not member.zip64 and (
+                file_size >= ZIP64_LIMIT or compress_size >= ZIP64_LIMIT):
+            raise RuntimeError(
+                'File size of {0} changed while writing the archive'.format(
+                    member.arcname))
+
+        if member.zip64:
+            yield _DATA_DESCRIPTOR_64.pack(
+                _DATA_DESCRIPTOR_SIGNATURE, member.crc,
+                compress_size, file_size)
+        else:
+            yield _DATA_DESCRIPTOR.pack(
+                _DATA_DESCRIPTOR_SIGNATURE, member.crc,
+                compress_size, file_size)
+
+    def _central_directory_header(self, member):
+        """Central directory header of a member."""
+        arcname = member.encoded_arcname
+        dos_date, dos_time = _dos_date_time(member.date_time)
+
+        # Values that doesn't fit are moved to ZIP64 extra field, in this
+        # particular order
+        extra_values = []
+        file_size = member.file_size
+        compress_size = member.compress_size
+        header_offset = member.header_offset
+        if member.zip64 or file_size >= ZIP64_LIMIT:
+            extra_values.append(file_size)
+            file_size = 0xFFFFFFFF
+        if member.zip64 or compress_size >= ZIP64_LIMIT:
+            extra_values.append(compress_size)
+            compress_size = 0xFFFFFFFF
+        if header_offset >= ZIP64_LIMIT:
+            extra_values.append(header_offset)
+            header_offset = 0xFFFFFFFF
+
+        if extra_values:
+            version = _ZIP64_VERSION
+            extra = struct.pack(
+                '<2H{0}Q'.format(len(extra_values)),
+                _ZIP64_EXTRA_HEADER_ID, 8 * len(extra_values), *extra_values)
+        else:
+            version = _DEFAULT_VERSION
+            extra = b''
+
+        return _CENTRAL_DIRECTORY.pack(
+            _CENTRAL_DIRECTORY_SIGNATURE, version, _CREATE_SYSTEM,
+            version, 0, member.flag_bits, member.compress_type,
+            dos_time, dos_date, member.crc, compress_size, file_size,
+            len(arcname), len(extra), 0, 0, 0, _EXTERNAL_ATTR,
+            header_offset) + arcname + extra
+
+    def _end_archive(self, central_directory_offset, central_directory_size):
+        """End of central directory record, with ZIP64 record if needed."""
+        count = len(self.members)
+        records = b''
+        if (count >= ZIP_FILECOUNT_LIMIT or
+                central_directory_offset >= ZIP64_LIMIT or
+                central_directory_size >= ZIP64_LIMIT):
+            end_archive_64_offset = (
+                central_directory_offset + central_directory_size)
+            records += _END_ARCHIVE_64.pack(
+                _END_ARCHIVE_64_SIGNATURE, _END_ARCHIVE_64.size - 12,
+                _ZIP64_VERSION, _ZIP64_VERSION, 0, 0, count, count,
+                central_directory_size, central_directory_offset)
+            records += _END_ARCHIVE_64_LOCATOR.pack(
+                _END_ARCHIVE_64_LOCATOR_SIGNATURE, 0,
+                end_archive_64_offset, 1)
+            count = min(count, ZIP_FILECOUNT_LIMIT)
+            central_directory_offset = min(
+                central_directory_offset, 0xFFFFFFFF)
+            central_directory_size = min(central_directory_size, 0xFFFFFFFF)
+
+        comment = self.comment[:ZIP_MAX_COMMENT]
+        records += _END_ARCHIVE.pack(
+            _END_ARCHIVE_SIGNATURE, 0, 0, count, count,
+            central_directory_size, central_directory_offset,
+            len(comment)) + comment
+        return records
@@ -0,0 +1,284 @@
+# coding=utf-8
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.db.models.signals import post_save
+from django.core.management.base import BaseCommand, CommandError
+
+from geonode.layers.utils import file_upload
+from geonode.people.models import Profile
+from geosafe.benchmark import mute_signals
+from geosafe.helpers.inasafe_helper import InaSAFETestData
+from geosafe.helpers.utils import wait_metadata
+from geosafe.models import Analysis, AnalysisStageTiming
+from geosafe.tasks.analysis import dispatch_analysis
+from geosafe.tasks.headless.analysis import check_broker_connection
+
+FAKE_HEADLESS_APP = 'geosafe.benchmark.fake_headless'
+
+
+def percentile(values, percent):
+    """Nearest rank percentile.
+
+    :param values: list of numbers
+    :type values: list
+
+    :param percent: percentile, between 0 and 100
+    :type percent: float
+
+    :return: the percentile, or None if there is no values
+    :rtype: float
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Run concurrent analyses of sample layers and report throughput, '
+        'latency and time spent in each stage')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyses',
+            type=int,
+            default=10,
+            help='Number of analyses dispatched at the same time')
+        parser.add_argument(
+            '--hazard',
+            default='flood_data.geojson',
+            help='Hazard sample layer of tasks/tests/data/hazard')
+        parser.add_argument(
+            '--exposure',
+            default='buildings.geojson',
+            help='Exposure sample layer of tasks/tests/data/exposure')
+        parser.add_argument(
+            '--aggregation',
+            default=None,
+            help='Aggregation sample layer of tasks/tests/data/aggregation')
+        parser.add_argument(
+            '--fake-headless',
+            action='store_true',
+            default=False,
+            help='Start a fake InaSAFE Headless worker returning canned '
+                 'outputs')
+        parser.add_argument(
+            '--headless-concurrency',
+            type=int,
+            default=4,
+            help='Concurrency of the fake InaSAFE Headless worker')
+        parser.add_argument(
+            '--analysis-delay',
+            type=float,
+            default=0,
+            help='Seconds spent by the fake worker in each analysis')
+        parser.add_argument(
+            '--report-delay',
+            type=float,
+            default=0,
+            help='Seconds spent by the fake worker in each report')
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=600,
+            help='Seconds to wait for the analyses to finish')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            default=False,
+            help='Keep the layers and analyses created by the benchmark')
+
+    def handle(self, *args, **options):
+        analysis_count = options['analyses']
+        if analysis_count < 1:
+            raise CommandError('At least one analysis is needed')
+
+        worker = None
+        output_dir = None
+        layers = []
+        analyses = []
+        try:
+            if options['fake_headless']:
+                output_dir = tempfile.mkdtemp(prefix='fake_headless_')
+                worker = self.start_fake_headless(output_dir, options)
+            # The worker is ready when it answers
+            check_broker_connection.apply_async(
+                queue=check_broker_connection.queue).get(
+                timeout=options['timeout'])
+
+            layers = self.upload_layers(options)
+            analyses = self.create_analyses(layers, analysis_count)
+
+            dispatch_times = {}
+            start_time = time.time()
+            for analysis in analyses:
+                dispatch_times[analysis.id] = datetime.now()
+                dispatch_analysis(analysis.id, use_cache=False)
+            finished = self.wait_analyses(analyses, options['timeout'])
+            elapsed = time.time() - start_time
+
+            self.report(analyses, dispatch_times, finished, elapsed)
+        finally:
+            if not options['keep']:
+                for analysis in Analysis.objects.filter(
+                        id__in=[a.id for a in analyses]):
+                    if analysis.impact_layer:
+                        analysis.impact_layer.delete()
+                    analysis.delete()
+                for layer in layers:
+                    if layer:
+                        layer.delete()
+            if worker:
+                worker.terminate()
+                worker.wait()
+            if output_dir:
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+    def start_fake_headless(self, output_dir, options):
+        """Start fake InaSAFE Headless worker in a new process.
+
+        :return: worker process
+        :rtype: subprocess.Popen
+        """
+        env = dict(os.environ)
+        env.update({
+            'FAKE_HEADLESS_OUTPUT_DIR': output_dir,
+            'FAKE_HEADLESS_ANALYSIS_DELAY': str(options['analysis_delay']),
+            'FAKE_HEADLESS_REPORT_DELAY': str(options['report_delay']),
+        })
+        return subprocess.Popen([
+            'celery', 'worker',
+            '-A', FAKE_HEADLESS_APP,
+            '-Q', 'inasafe-headless',
+            '-n', 'fake-headless@%h',
+            '-c', str(max(options['headless_concurrency'], 1)),
+            '-l', 'warning'
+        ], env=env)
+
+    def upload_layers(self, options):
+        """Upload sample layers and wait for their layer purpose.
+
+        :return: hazard, exposure and aggregation layer, which may be None
+        :rtype: list
+        """
+        layer_files = [
+            InaSAFETestData.hazard(options['hazard']),
+            InaSAFETestData.exposure(options['exposure']),
+        ]
+        if options['aggregation']:
+            layer_files.append(
+                InaSAFETestData.aggregation(options['aggregation']))
+
+        layers = []
+        for layer_file in layer_files:
+            if not os.path.exists(layer_file):
+                raise CommandError('{0} does not exist'.format(layer_file))
+            layer = file_upload(layer_file)
+            layers.append(layer)
+            if not wait_metadata(layer):
+                raise CommandError(
+                    'Keywords of {0} were not processed'.format(layer_file))
+        if len(layers) < 3:
+            layers.append(None)
+        return layers
+
+    def create_analyses(self, layers, analysis_count):
+        """Create analyses without dispatching them.
+
+        :return: list of analysis
+        :rtype: list
+        """
+        hazard, exposure, aggregation = layers
+        user = Profile.objects.get(username='AnonymousUser')
+        analyses = []
+        # Analyses are dispatched by the benchmark, without result cache
+        with mute_signals(post_save):
+            for i in range(analysis_count):
+                analyses.append(Analysis.objects.create(
+                    user_title='Benchmark {0}'.format(i + 1),
+                    hazard_layer=hazard,
+                    exposure_layer=exposure,
+                    aggregation_layer=aggregation,
+                    extent_option=Analysis.HAZARD_EXPOSURE_CODE,
+                    keep=False,
+                    user=user))
+        return analyses
+
+    def wait_analyses(self, analyses, timeout):
+        """Wait until the reports of every analysis are assigned.
+
+        :return: id of finished analyses
+        :rtype: set
+        """
+        analysis_ids = [a.id for a in analyses]
+        deadline = time.time() + timeout
+        finished = set()
+        while len(finished) < len(analysis_ids) and time.time() < deadline:
+            time.sleep(0.5)
+            finished.update(AnalysisStageTiming.objects.filter(
+                analysis_id__in=analysis_ids,
+                stage=AnalysisStageTiming.STAGE_REPORT_ASSIGNMENT
+            ).values_list('analysis_id', flat=True))
+            finished.update(Analysis.objects.filter(
+                id__in=analysis_ids,
+                task_state='FAILURE'
+            ).values_list('id', flat=True))
+        return finished
+
+    def report(self, analyses, dispatch_times, finished, elapsed):
+        """Write throughput, latency and stage durations."""
+        analysis_ids = [a.id for a in analyses]
+        succeeded = Analysis.objects.filter(
+            id__in=analysis_ids, task_state='SUCCESS').exclude(
+            report_table='').exclude(report_table__isnull=True).count()
+        timings = list(AnalysisStageTiming.objects.filter(
+            analysis_id__in=analysis_ids))
+
+        # Latency from dispatch to the end of the last recorded stage
+        end_times = {}
+        for timing in timings:
+            end = timing.start + timedelta(seconds=timing.duration)
+            end_times[timing.analysis_id] = max(
+                end, end_times.get(timing.analysis_id, end))
+        latencies = [
+            (end_times[i] - dispatch_times[i]).total_seconds()
+            for i in finished if i in end_times]
+
+        self.stdout.write(
+            'Analyses: {0} dispatched, {1} succeeded, {2} failed, '
+            '{3} timed out'.format(
+                len(analyses), succeeded, len(finished) - succeeded,
+                len(analyses) - len(finished)))
+        self.stdout.write(
+            'Throughput: {0:.2f} analyses per minute in {1:.1f} '
+            'seconds'.format(len(finished) * 60.0 / elapsed, elapsed))
+        if latencies:
+            self.stdout.write(
+                'Latency: p50 {0:.2f}, p95 {1:.2f}, max {2:.2f} '
+                'seconds'.format(
+                    percentile(latencies, 50), percentile(latencies, 95),
+                    max(latencies)))
+
+        self.stdout.write(
+            'Written: {0:.1f} MB per analysis'.format(
+                sum(t.bytes_written for t in timings) / 1048576.0 /
+                len(analyses)))
+        self.stdout.write('Stages (count, mean, p95, total seconds):')
+        for stage, stage_name in AnalysisStageTiming.STAGE_CHOICES:
+            durations = [t.duration for t in timings if t.stage == stage]
+            if not durations:
+                continue
+            self.stdout.write(
+                '  {0:<40} {1:>5} {2:>8.3f} {3:>8.3f} {4:>9.3f}'.format(
+                    stage_name, len(durations),
+                    sum(durations) / len(durations),
+                    percentile(durations, 95), sum(durations)))
@@ -0,0 +1,203 @@
+# coding=utf-8
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+from celery import chain
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+
+from geonode.layers.models import Layer, cov_exts, vec_exts
+from geonode.layers.utils import file_upload
+from geosafe.app_settings import settings
+from geosafe.helpers.inasafe_helper import parse_inasafe_keywords
+from geosafe.helpers.utils import wait_metadata
+from geosafe.models import Metadata
+from geosafe.signals import metadata_post_save
+from geosafe.tasks.analysis import set_layer_purpose, get_layer_keywords_url
+from geosafe.tasks.headless.analysis import get_keywords
+
+
+def find_layer_files(directory):
+    """Find layer files in a directory, recursively.
+
+    :param directory: directory to search
+    :type directory: str
+
+    :return: sorted list of layer file path
+    :rtype: list
+    """
+    layer_files = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            ext = os.path.splitext(name)[1].lower()
+            if ext in cov_exts + vec_exts:
+                layer_files.append(os.path.join(root, name))
+    return sorted(layer_files)
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Upload every layer in a directory and process their InaSAFE '
+        'keywords in bulk')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of layers uploaded at the same time')
+        parser.add_argument(
+            '--user',
+            default=None,
+            help='Username of the owner of the layers')
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            default=False,
+            help='Overwrite existing layers with the same name')
+        parser.add_argument(
+            '--wait',
+            action='store_true',
+            default=False,
+            help='Wait for keywords processed by InaSAFE Headless')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError('{0} is not a directory'.format(directory))
+
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(
+                    username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(
+                    'User {0} does not exist'.format(options['user']))
+
+        layer_files = find_layer_files(directory)
+        self.stdout.write('Found {0} layers in {1}'.format(
+            len(layer_files), directory))
+        if not layer_files:
+            return
+
+        pool = ThreadPool(max(options['workers'], 1))
+        try:
+            # Keywords of the layers are processed together after upload,
+            # instead of one delayed task for each layer.
+            post_save.disconnect(metadata_post_save)
+            try:
+                start_time = time.time()
+                results = pool.map(
+                    lambda f: self.upload_layer(
+                        f, user, options['overwrite']),
+                    layer_files)
+                upload_time = time.time() - start_time
+            finally:
+                post_save.connect(metadata_post_save)
+
+            layer_ids = [r[0] for r in results if r[0]]
+            upload_times = [r[1] for r in results if r[0]]
+            for layer_file, (layer_id, elapsed, error) in zip(
+                    layer_files, results):
+                if error:
+                    self.stderr.write('Failed to upload {0}: {1}'.format(
+                        layer_file, error))
+
+            start_time = time.time()
+            local_count, headless_layer_ids = self.process_keywords(
+                layer_ids, pool)
+            headless_count = len(headless_layer_ids)
+            if options['wait']:
+                # Wakes up on metadata notification, not by polling
+                pool.map(self.wait_layer, headless_layer_ids)
+            keywords_time = time.time() - start_time
+        finally:
+            pool.close()
+            pool.join()
+
+        self.stdout.write(
+            'Upload: {0} of {1} layers in {2:.1f} seconds '
+            '(mean {3:.2f}, max {4:.2f} seconds per layer)'.format(
+                len(layer_ids), len(layer_files), upload_time,
+                sum(upload_times) / max(len(upload_times), 1),
+                max(upload_times or [0])))
+        self.stdout.write(
+            'Keywords: {0} parsed, {1} sent to InaSAFE Headless, '
+            '{2} without keywords in {3:.1f} seconds'.format(
+                local_count, headless_count,
+                len(layer_ids) - local_count - headless_count,
+                keywords_time))
+
+    def upload_layer(self, layer_file, user, overwrite):
+        """Upload a layer, in a worker thread.
+
+        :return: layer id, upload time, and error message
+        :rtype: (int, float, str)
+        """
+        start_time = time.time()
+        try:
+            layer = file_upload(layer_file, user=user, overwrite=overwrite)
+            return layer.id, time.time() - start_time, None
+        except Exception as e:
+            return None, time.time() - start_time, str(e)
+        finally:
+            # Each thread has its own database connection
+            connection.close()
+
+    def wait_layer(self, layer_id):
+        """Wait for layer metadata, in a worker thread."""
+        try:
+            wait_metadata(Layer.objects.get(id=layer_id))
+        finally:
+            connection.close()
+
+    def process_keywords(self, layer_ids, pool):
+        """Set layer purpose of uploaded layers from their keywords.
+
+        Standard keywords are parsed in the worker pool and saved in one
+        transaction. The other layers are sent to InaSAFE Headless right
+        away.
+
+        :return: number of layers parsed locally, and id of layers sent to
+            InaSAFE Headless
+        :rtype: (int, list)
+        """
+        metadatas = list(Metadata.objects.filter(
+            layer_id__in=layer_ids).exclude(
+            keywords_xml='').exclude(
+            keywords_xml__isnull=True).defer(None))
+        metadatas = [m for m in metadatas if m.keywords_changed()]
+        if settings.INASAFE_LOCAL_KEYWORDS_PARSER:
+            keywords_list = pool.map(
+                lambda m: parse_inasafe_keywords(m.keywords_xml), metadatas)
+        else:
+            keywords_list = [None] * len(metadatas)
+
+        headless_metadatas = []
+        with transaction.atomic():
+            for metadata, keywords in zip(metadatas, keywords_list):
+                if keywords:
+                    set_layer_purpose(
+                        keywords, metadata.layer_id,
+                        Metadata.hash_keywords(metadata.keywords_xml))
+                else:
+                    headless_metadatas.append(metadata)
+
+        for metadata in headless_metadatas:
+            chain(
+                get_keywords.s(get_layer_keywords_url(metadata.layer)).set(
+                    queue=get_keywords.queue),
+                set_layer_purpose.s(
+                    metadata.layer_id,
+                    Metadata.hash_keywords(metadata.keywords_xml)).set(
+                    queue=set_layer_purpose.queue)
+            ).delay()
+        return (
+            len(metadatas) - len(headless_metadatas),
+            [m.layer_id for m in headless_metadatas])
@@ -0,0 +1,13 @@
+# coding=utf-8
+from django.core.management.base import BaseCommand
+
+from geosafe.celery_app import app
+from geosafe.tasks.monitor import monitor_task_events
+
+
+class Command(BaseCommand):
+
+    help = 'Record GeoSAFE analysis task state from Celery task events'
+
+    def handle(self, *args, **options):
+        monitor_task_events(app)
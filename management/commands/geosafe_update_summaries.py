@@ -0,0 +1,35 @@
+# coding=utf-8
+from django.core.management.base import BaseCommand
+
+from geosafe.models import Analysis
+from geosafe.tasks.analysis import store_analysis_summary
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Store impact summary of finished analyses, for analysis '
+        'statistics')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            default=False,
+            help='Also update analyses that already have a summary')
+
+    def handle(self, *args, **options):
+        analyses = Analysis.objects.filter(
+            impact_layer__isnull=False).select_related('impact_layer')
+        if not options['all']:
+            analyses = analyses.filter(impact_summary__isnull=True)
+
+        count = 0
+        for analysis in analyses.iterator():
+            try:
+                store_analysis_summary(analysis)
+                count += 1
+            except Exception as e:
+                self.stderr.write('Failed to update {0}: {1}'.format(
+                    analysis, e))
+        self.stdout.write('Updated summary of {0} analyses'.format(count))
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+# Fill footprint of existing layers from layer bbox, reprojected to 4326
+FILL_FOOTPRINT_SQL = """
+UPDATE geosafe_metadata AS m
+SET footprint = ST_Transform(
+    ST_MakeEnvelope(
+        r.bbox_x0, r.bbox_y0, r.bbox_x1, r.bbox_y1,
+        substring(r.srid from 6)::integer),
+    4326)
+FROM base_resourcebase AS r
+WHERE m.layer_id = r.id
+    AND r.srid ~ '^EPSG:[0-9]+$'
+    AND r.bbox_x0 IS NOT NULL
+    AND r.bbox_y0 IS NOT NULL
+    AND r.bbox_x1 IS NOT NULL
+    AND r.bbox_y1 IS NOT NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0013_auto_20190122_0345'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metadata',
+            name='footprint',
+            field=django.contrib.gis.db.models.fields.PolygonField(srid=4326, blank=True, help_text=b'Used to filter layers by bbox using spatial index.', null=True, verbose_name=b'Layer bounding box in EPSG:4326'),
+        ),
+        migrations.RunSQL(FILL_FOOTPRINT_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0014_metadata_footprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='task_stage',
+            field=models.CharField(help_text=b'Current stage of the analysis task chain', max_length=40, null=True, verbose_name=b'Task Stage', blank=True),
+        ),
+    ]
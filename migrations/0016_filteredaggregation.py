@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('layers', '24_to_26'),
+        ('geosafe', '0015_analysis_task_stage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilteredAggregation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(help_text=b'Hash of aggregation layer version and normalized filter', unique=True, max_length=40, verbose_name=b'Cache key')),
+                ('path', models.CharField(max_length=255, verbose_name=b'File location of filtered aggregation')),
+                ('size', models.BigIntegerField(default=0, verbose_name=b'Size of filtered aggregation files in bytes')),
+                ('ref_count', models.IntegerField(default=0, verbose_name=b'Number of analyses using filtered aggregation')),
+                ('last_used', models.DateTimeField(default=datetime.datetime.now)),
+                ('aggregation_layer', models.ForeignKey(related_name='filtered_aggregations', to='layers.Layer', help_text=b'Aggregation layer being filtered.', verbose_name=b'Aggregation Layer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0016_filteredaggregation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='fingerprint',
+            field=models.CharField(help_text=b'Hash of analysis inputs, used to reuse the result of identical analysis', max_length=40, null=True, verbose_name=b'Input Fingerprint', db_index=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('layers', '24_to_26'),
+        ('geosafe', '0017_analysis_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisBatch',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('user_title', models.CharField(max_length=255, null=True, verbose_name=b'User defined title for analysis batch', blank=True)),
+                ('aggregation_filter', models.TextField(null=True, verbose_name=b'Serialized JSON of selected aggregation area name', blank=True)),
+                ('task_id', models.CharField(help_text=b'Task UUID that runs the batch', max_length=40, null=True, verbose_name=b'Task UUID', blank=True)),
+                ('start_time', models.DateTimeField(default=datetime.datetime.now)),
+                ('language_code', models.CharField(default=b'en', max_length=10, verbose_name=b'Language Code')),
+                ('aggregation_layer', models.ForeignKey(related_name='batch_aggregation_layer', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='layers.Layer', help_text=b'Aggregation layer for analyses.', null=True, verbose_name=b'Aggregation Layer')),
+                ('hazard_layer', models.ForeignKey(related_name='batch_hazard_layer', on_delete=django.db.models.deletion.SET_NULL, to='layers.Layer', help_text=b'Hazard layer for analyses.', null=True, verbose_name=b'Hazard Layer')),
+                ('user', models.ForeignKey(blank=True, to=settings.AUTH_USER_MODEL, help_text=b'The author of the analysis batch', null=True, verbose_name=b'Author')),
+            ],
+            options={
+                'verbose_name_plural': 'Analysis Batches',
+            },
+        ),
+        migrations.AddField(
+            model_name='analysis',
+            name='batch',
+            field=models.ForeignKey(related_name='analyses', blank=True, to='geosafe.AnalysisBatch', help_text=b'Batch of analyses this analysis is run with.', null=True, verbose_name=b'Analysis Batch'),
+        ),
+    ]
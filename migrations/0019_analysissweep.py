@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('layers', '24_to_26'),
+        ('geosafe', '0018_analysisbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisSweep',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('user_title', models.CharField(max_length=255, null=True, verbose_name=b'User defined title for analysis sweep', blank=True)),
+                ('aggregation_filter', models.TextField(null=True, verbose_name=b'Serialized JSON of selected aggregation area name', blank=True)),
+                ('task_id', models.CharField(help_text=b'Task UUID that prepares the sweep', max_length=40, null=True, verbose_name=b'Task UUID', blank=True)),
+                ('start_time', models.DateTimeField(default=datetime.datetime.now)),
+                ('language_code', models.CharField(default=b'en', max_length=10, verbose_name=b'Language Code')),
+                ('summary_json', models.TextField(null=True, verbose_name=b'Combined summary of the analyses in json format', blank=True)),
+                ('aggregation_layer', models.ForeignKey(related_name='sweep_aggregation_layer', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='layers.Layer', help_text=b'Aggregation layer for analyses.', null=True, verbose_name=b'Aggregation Layer')),
+                ('exposure_layer', models.ForeignKey(related_name='sweep_exposure_layer', on_delete=django.db.models.deletion.SET_NULL, to='layers.Layer', help_text=b'Exposure layer for analyses.', null=True, verbose_name=b'Exposure Layer')),
+                ('user', models.ForeignKey(blank=True, to=settings.AUTH_USER_MODEL, help_text=b'The author of the analysis sweep', null=True, verbose_name=b'Author')),
+            ],
+            options={
+                'verbose_name_plural': 'Analysis Sweeps',
+            },
+        ),
+        migrations.AddField(
+            model_name='analysis',
+            name='sweep',
+            field=models.ForeignKey(related_name='analyses', blank=True, to='geosafe.AnalysisSweep', help_text=b'Sweep of hazard scenarios this analysis is run with.', null=True, verbose_name=b'Analysis Sweep'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0019_analysissweep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metadata',
+            name='keywords_hash',
+            field=models.CharField(help_text=b'Hash of processed keywords_xml, used to skip processing unchanged keywords.', max_length=40, null=True, verbose_name=b'Hash of keywords xml', blank=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0020_metadata_keywords_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisStageTiming',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('stage', models.CharField(db_index=True, max_length=30, choices=[(b'prepare', b'Prepare analysis'), (b'aggregation_filter', b'Filter aggregation layer'), (b'headless_run', b'Run analysis in InaSAFE Headless'), (b'report_generation', b'Generate report in InaSAFE Headless'), (b'impact_download', b'Download and extract impact layer'), (b'file_upload', b'Upload impact layer'), (b'report_assignment', b'Assign reports'), (b'cleanup', b'Clean up')])),
+                ('start', models.DateTimeField(default=datetime.datetime.now)),
+                ('duration', models.FloatField(verbose_name=b'Duration in seconds')),
+                ('success', models.BooleanField(default=True)),
+                ('analysis', models.ForeignKey(related_name='stage_timings', to='geosafe.Analysis', on_delete=django.db.models.deletion.CASCADE)),
+            ],
+            options={
+                'ordering': ('start', 'id'),
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0021_analysisstagetiming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisstagetiming',
+            name='bytes_written',
+            field=models.BigIntegerField(default=0, verbose_name=b'Bytes written to disk'),
+        ),
+    ]
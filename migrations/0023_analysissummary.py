@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('layers', '24_to_26'),
+        ('geosafe', '0022_analysisstagetiming_bytes_written'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisSummary',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('exposure_type', models.CharField(default=b'', max_length=50, blank=True)),
+                ('hazard_type', models.CharField(default=b'', max_length=50, blank=True)),
+                ('hazard_classification', models.CharField(default=b'', max_length=100, blank=True)),
+                ('analysis_question', models.TextField(default=b'', blank=True)),
+                ('total', models.BigIntegerField(null=True, blank=True)),
+                ('total_affected', models.BigIntegerField(null=True, blank=True)),
+                ('breakdown_json', models.TextField(default=b'[]', help_text=b'List of hazard class and count pairs, in hazard class order.', verbose_name=b'Count of each hazard class in json format')),
+                ('analysis', models.OneToOneField(related_name='impact_summary', to='geosafe.Analysis', on_delete=django.db.models.deletion.CASCADE)),
+                ('impact_layer', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, verbose_name=b'Impact Layer', blank=True, to='layers.Layer', null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0023_analysissummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisSummaryBreakdown',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('hazard_type', models.CharField(default=b'', max_length=50, blank=True)),
+                ('exposure_type', models.CharField(default=b'', max_length=50, blank=True)),
+                ('aggregation_area', models.CharField(default=b'', help_text=b'Empty for the whole analysis extent.', max_length=255, verbose_name=b'Aggregation area name', db_index=True, blank=True)),
+                ('finished', models.DateTimeField(db_index=True, null=True, verbose_name=b'Analysis end time', blank=True)),
+                ('total', models.BigIntegerField(null=True, blank=True)),
+                ('total_affected', models.BigIntegerField(null=True, blank=True)),
+                ('summary', models.ForeignKey(related_name='breakdowns', to='geosafe.AnalysisSummary', on_delete=django.db.models.deletion.CASCADE)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='analysissummarybreakdown',
+            index_together=set([('hazard_type', 'exposure_type', 'finished')]),
+        ),
+    ]
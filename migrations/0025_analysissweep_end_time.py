@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0024_analysissummarybreakdown'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysissweep',
+            name='end_time',
+            field=models.DateTimeField(null=True, verbose_name=b'Time when every analysis of the sweep finished', blank=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0025_analysissweep_end_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysissummary',
+            name='analysis',
+            field=models.OneToOneField(related_name='impact_summary', null=True, on_delete=django.db.models.deletion.SET_NULL, blank=True, to='geosafe.Analysis'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geosafe', '0026_analysissummary_keep_on_analysis_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HTTPClientCounter',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('endpoint', models.CharField(help_text=b'Label given by the caller, or host of the url.', max_length=255)),
+                ('status', models.CharField(help_text=b'Response status, or error if there was no response.', max_length=10)),
+                ('requests', models.BigIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0, verbose_name=b'Total time until response headers')),
+                ('bytes_received', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='httpclientcounter',
+            unique_together=set([('endpoint', 'status')]),
+        ),
+    ]
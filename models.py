@@ -1,20 +1,31 @@
 from __future__ import absolute_import
 
+import glob
+import hashlib
 import json
+import logging
 import os
+import re
+import time
 import urlparse
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
 from celery.result import AsyncResult
-from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.db.models import PolygonField
+from django.contrib.gis.gdal.error import GDALException
+from django.contrib.gis.geos import GEOSGeometry, GEOSException, Polygon
 from django.core.files.base import File
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum
 from django.utils.translation import ugettext as _
 from geonode.utils import bbox_to_wkt
 
 from geonode.layers.models import Layer
 from geosafe.app_settings import settings
+from geosafe.helpers.impact_summary.summary_base import category_css_class
 
 # flat xpath for the keyword container tag
 from geosafe.helpers.suggestions.error_suggestions import AnalysisError
@@ -29,6 +40,8 @@ ISO_METADATA_NAMESPACES = {
     'gco': 'http://www.isotc211.org/2005/gco'
 }
 
+LOGGER = logging.getLogger(__name__)
+
 
 class GeoSAFEException(BaseException):
     pass
@@ -74,9 +87,69 @@ class Metadata(models.Model):
         null=True,
         default='{}'
     )
+    keywords_hash = models.CharField(
+        verbose_name='Hash of keywords xml',
+        help_text='Hash of processed keywords_xml, used to skip processing '
+                  'unchanged keywords.',
+        max_length=40,
+        blank=True,
+        null=True
+    )
+    footprint = PolygonField(
+        verbose_name='Layer bounding box in EPSG:4326',
+        help_text='Used to filter layers by bbox using spatial index.',
+        srid=4326,
+        blank=True,
+        null=True
+    )
 
     objects = MetadataManager()
 
+    @staticmethod
+    def layer_footprint(layer):
+        """Calculate layer bounding box polygon in EPSG:4326.
+
+        :param layer: Layer instance
+        :type layer: Layer
+
+        :return: bounding box polygon, or None if layer bbox or srid is
+            undefined (for example EPSG:None).
+        :rtype: Polygon
+        """
+        bbox = [layer.bbox_x0, layer.bbox_y0, layer.bbox_x1, layer.bbox_y1]
+        srid = re.findall(r'^EPSG:(\d+)$', layer.srid or '')
+        if None in bbox or not srid:
+            return None
+        footprint = Polygon.from_bbox(tuple(float(c) for c in bbox))
+        footprint.srid = int(srid[0])
+        try:
+            footprint.transform(4326)
+        except (GDALException, GEOSException):
+            return None
+        return footprint
+
+    @staticmethod
+    def hash_keywords(keywords_xml):
+        """Calculate hash of keywords xml.
+
+        :param keywords_xml: InaSAFE keywords xml
+        :type keywords_xml: basestring
+
+        :return: sha1 hex digest
+        :rtype: str
+        """
+        if isinstance(keywords_xml, unicode):
+            keywords_xml = keywords_xml.encode('utf-8')
+        return hashlib.sha1(keywords_xml or '').hexdigest()
+
+    def keywords_changed(self):
+        """Check if keywords xml changed since it was last processed.
+
+        :rtype: bool
+        """
+        return self.keywords_hash != Metadata.hash_keywords(
+            self.keywords_xml)
+
     @property
     def keywords(self):
         """Return InaSAFE keywords dict."""
@@ -90,6 +163,7 @@ class Metadata(models.Model):
         Metadata.objects.filter(pk=self.pk).update(
             keywords_xml='',
             keywords_json='',
+            keywords_hash=None,
             layer_purpose='',
             category='')
 
@@ -208,6 +282,42 @@ class Analysis(models.Model):
         null=True
     )
 
+    task_stage = models.CharField(
+        max_length=40,
+        verbose_name='Task Stage',
+        help_text='Current stage of the analysis task chain',
+        blank=True,
+        null=True
+    )
+
+    batch = models.ForeignKey(
+        'AnalysisBatch',
+        verbose_name='Analysis Batch',
+        help_text='Batch of analyses this analysis is run with.',
+        blank=True,
+        null=True,
+        related_name='analyses'
+    )
+
+    sweep = models.ForeignKey(
+        'AnalysisSweep',
+        verbose_name='Analysis Sweep',
+        help_text='Sweep of hazard scenarios this analysis is run with.',
+        blank=True,
+        null=True,
+        related_name='analyses'
+    )
+
+    fingerprint = models.CharField(
+        max_length=40,
+        verbose_name='Input Fingerprint',
+        help_text='Hash of analysis inputs, used to reuse the result of '
+                  'identical analysis',
+        blank=True,
+        null=True,
+        db_index=True
+    )
+
     keep = models.BooleanField(
         verbose_name='Keep impact result',
         help_text='True if the impact will be kept',
@@ -310,10 +420,44 @@ class Analysis(models.Model):
     def get_task_state(self):
         """Check task state
 
-        State need to be evaluated from task result.
+        The state is recorded in the model by the task monitor
+        (geosafe.tasks.monitor) on each task state transition, so this
+        doesn't query the result backend.
+
+        :return: task state string
+        :rtype: str
+        """
+        if not self.task_id:
+            # If no task_id, we don't have any task yet.
+            return 'FAILURE'
+        return self.task_state
+
+    def reconcile_task_state(self):
+        """Update recorded task state from the task result.
+
+        Used to catch up on state transitions that were not recorded by the
+        task monitor.
         However after a certain time, the task result is removed from broker.
         In this case, the state will always return 'PENDING'. For this, we
-        receive the actual result from self.state, which is the cached state
+        keep the recorded state.
+
+        Finished state is kept, because the task chain may succeed while
+        the analysis failed, for example an analysis of a batch without
+        impact layer.
+
+        :return: task state string
+        :rtype: str
+        """
+        if self.task_state in ('SUCCESS', 'FAILURE'):
+            return self.task_state
+        state = self._task_result_state()
+        if state != self.task_state:
+            Analysis.objects.filter(id=self.id).update(task_state=state)
+            self.task_state = state
+        return state
+
+    def _task_result_state(self):
+        """Evaluate task state from task result.
 
         :return: task state string
         :rtype: str
@@ -322,6 +466,14 @@ class Analysis(models.Model):
         if not result.task_id:
             # If no task_id, we don't have any task yet.
             return 'FAILURE'
+        # Analysis chain is dispatched by prepare_analysis task, which
+        # returns the task id of the chain.
+        try:
+            if result.state == 'SUCCESS' and isinstance(
+                    result.result, basestring):
+                result = AsyncResult(result.result)
+        except BaseException:
+            return 'FAILURE'
         # chain state, iterate result
         if result.children:
             for child in result.children:
@@ -426,6 +578,191 @@ class Analysis(models.Model):
         return 'Analysis ID: {}'.format(self.id)
 
 
+class AnalysisBatch(models.Model):
+    """Represent analyses of one hazard against many exposures.
+
+    The batch runs as a single multi exposure analysis in InaSAFE Headless.
+    Each exposure has its own Analysis, holding its impact layer and
+    reports.
+    """
+
+    class Meta:
+        verbose_name_plural = 'Analysis Batches'
+
+    user_title = models.CharField(
+        max_length=255,
+        verbose_name='User defined title for analysis batch',
+        blank=True,
+        null=True,
+    )
+    hazard_layer = models.ForeignKey(
+        Layer,
+        verbose_name='Hazard Layer',
+        help_text='Hazard layer for analyses.',
+        null=True,
+        related_name='batch_hazard_layer',
+        on_delete=models.SET_NULL
+    )
+    aggregation_layer = models.ForeignKey(
+        Layer,
+        verbose_name='Aggregation Layer',
+        help_text='Aggregation layer for analyses.',
+        blank=True,
+        null=True,
+        related_name='batch_aggregation_layer',
+        on_delete=models.SET_NULL
+    )
+    aggregation_filter = models.TextField(
+        verbose_name='Serialized JSON of selected aggregation area name',
+        blank=True,
+        null=True,
+    )
+    task_id = models.CharField(
+        max_length=40,
+        verbose_name='Task UUID',
+        help_text='Task UUID that runs the batch',
+        blank=True,
+        null=True
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Author',
+        help_text='The author of the analysis batch',
+        blank=True,
+        null=True
+    )
+    start_time = models.DateTimeField(
+        default=datetime.now
+    )
+    language_code = models.CharField(
+        max_length=10,
+        verbose_name='Language Code',
+        default='en'
+    )
+
+    def get_task_state(self):
+        """Combined task state of the analyses.
+
+        :return: task state string
+        :rtype: str
+        """
+        return combined_task_state(self.analyses.all())
+
+    def __unicode__(self):
+        return 'Analysis Batch ID: {}'.format(self.id)
+
+
+class AnalysisSweep(models.Model):
+    """Represent analyses of one exposure against a series of hazards.
+
+    For example flood depth of each return period of a forecast ensemble.
+    Each hazard has its own Analysis. At most ANALYSIS_SWEEP_CONCURRENCY
+    analyses of a sweep run at the same time. Once all of them are
+    finished, their summaries are combined in summary_json.
+    """
+
+    class Meta:
+        verbose_name_plural = 'Analysis Sweeps'
+
+    user_title = models.CharField(
+        max_length=255,
+        verbose_name='User defined title for analysis sweep',
+        blank=True,
+        null=True,
+    )
+    exposure_layer = models.ForeignKey(
+        Layer,
+        verbose_name='Exposure Layer',
+        help_text='Exposure layer for analyses.',
+        null=True,
+        related_name='sweep_exposure_layer',
+        on_delete=models.SET_NULL
+    )
+    aggregation_layer = models.ForeignKey(
+        Layer,
+        verbose_name='Aggregation Layer',
+        help_text='Aggregation layer for analyses.',
+        blank=True,
+        null=True,
+        related_name='sweep_aggregation_layer',
+        on_delete=models.SET_NULL
+    )
+    aggregation_filter = models.TextField(
+        verbose_name='Serialized JSON of selected aggregation area name',
+        blank=True,
+        null=True,
+    )
+    task_id = models.CharField(
+        max_length=40,
+        verbose_name='Task UUID',
+        help_text='Task UUID that prepares the sweep',
+        blank=True,
+        null=True
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Author',
+        help_text='The author of the analysis sweep',
+        blank=True,
+        null=True
+    )
+    start_time = models.DateTimeField(
+        default=datetime.now
+    )
+    language_code = models.CharField(
+        max_length=10,
+        verbose_name='Language Code',
+        default='en'
+    )
+    end_time = models.DateTimeField(
+        verbose_name='Time when every analysis of the sweep finished',
+        blank=True,
+        null=True
+    )
+    summary_json = models.TextField(
+        verbose_name='Combined summary of the analyses in json format',
+        blank=True,
+        null=True
+    )
+
+    @property
+    def summary(self):
+        """Return combined summary dict."""
+        try:
+            return json.loads(self.summary_json)
+        except (TypeError, ValueError):
+            return {}
+
+    def get_task_state(self):
+        """Combined task state of the analyses.
+
+        :return: task state string
+        :rtype: str
+        """
+        return combined_task_state(self.analyses.all())
+
+    def __unicode__(self):
+        return 'Analysis Sweep ID: {}'.format(self.id)
+
+
+def combined_task_state(analyses):
+    """Combined task state of a group of analyses.
+
+    :param analyses: analyses
+    :type analyses: list
+
+    :return: task state string
+    :rtype: str
+    """
+    states = set(a.get_task_state() for a in analyses)
+    for state in ['PENDING', 'STARTED']:
+        if state in states:
+            return state
+    if states == set(['SUCCESS']):
+        return 'SUCCESS'
+    return 'FAILURE'
+
+
 class AnalysisTaskInfo(models.Model):
     """Represents Analysis Task information."""
 
@@ -542,6 +879,620 @@ class AnalysisTaskInfo(models.Model):
         return 'Analysis: {0}'.format(self.analysis.id)
 
 
+class AnalysisStageTiming(models.Model):
+    """Time spent in one stage of an analysis pipeline."""
+
+    STAGE_PREPARE = 'prepare'
+    STAGE_AGGREGATION_FILTER = 'aggregation_filter'
+    STAGE_HEADLESS_RUN = 'headless_run'
+    STAGE_REPORT_GENERATION = 'report_generation'
+    STAGE_IMPACT_DOWNLOAD = 'impact_download'
+    STAGE_FILE_UPLOAD = 'file_upload'
+    STAGE_REPORT_ASSIGNMENT = 'report_assignment'
+    STAGE_CLEANUP = 'cleanup'
+
+    STAGE_CHOICES = (
+        (STAGE_PREPARE, 'Prepare analysis'),
+        (STAGE_AGGREGATION_FILTER, 'Filter aggregation layer'),
+        (STAGE_HEADLESS_RUN, 'Run analysis in InaSAFE Headless'),
+        (STAGE_REPORT_GENERATION, 'Generate report in InaSAFE Headless'),
+        (STAGE_IMPACT_DOWNLOAD, 'Download and extract impact layer'),
+        (STAGE_FILE_UPLOAD, 'Upload impact layer'),
+        (STAGE_REPORT_ASSIGNMENT, 'Assign reports'),
+        (STAGE_CLEANUP, 'Clean up'),
+    )
+
+    class Meta:
+        ordering = ('start', 'id')
+
+    analysis = models.ForeignKey(
+        Analysis,
+        related_name='stage_timings',
+        on_delete=models.CASCADE
+    )
+    stage = models.CharField(
+        max_length=30,
+        choices=STAGE_CHOICES,
+        db_index=True
+    )
+    start = models.DateTimeField(
+        default=datetime.now
+    )
+    duration = models.FloatField(
+        verbose_name='Duration in seconds'
+    )
+    success = models.BooleanField(
+        default=True
+    )
+    bytes_written = models.BigIntegerField(
+        verbose_name='Bytes written to disk',
+        default=0
+    )
+
+    @classmethod
+    def record(
+            cls, analysis_ids, stage, start, duration, success=True,
+            bytes_written=0):
+        """Record a stage of one or more analyses.
+
+        Analyses of a batch share the same InaSAFE Headless task, so the
+        stage is recorded for each of them.
+
+        :param analysis_ids: analysis id or list of analysis id
+        :type analysis_ids: int, list
+
+        :param stage: stage name, one of STAGE_CHOICES
+        :type stage: str
+
+        :param start: start time of the stage
+        :type start: datetime
+
+        :param duration: duration in seconds
+        :type duration: float
+
+        :param success: False if the stage raised an exception
+        :type success: bool
+
+        :param bytes_written: bytes written to disk during the stage
+        :type bytes_written: int
+        """
+        if not isinstance(analysis_ids, (list, tuple)):
+            analysis_ids = [analysis_ids]
+        cls.objects.bulk_create([
+            cls(
+                analysis_id=analysis_id,
+                stage=stage,
+                start=start,
+                duration=duration,
+                success=success,
+                bytes_written=bytes_written)
+            for analysis_id in analysis_ids])
+
+    @classmethod
+    @contextmanager
+    def measure(cls, analysis_id, stage):
+        """Record the time spent in a block of code as an analysis stage.
+
+        :param analysis_id: analysis id
+        :type analysis_id: int
+
+        :param stage: stage name, one of STAGE_CHOICES
+        :type stage: str
+
+        :return: stage statistics, the block adds the bytes it writes to
+            disk to its 'bytes_written' key
+        :rtype: dict
+        """
+        start = datetime.now()
+        start_time = time.time()
+        stats = {'bytes_written': 0}
+        success = False
+        try:
+            yield stats
+            success = True
+        finally:
+            try:
+                cls.record(
+                    analysis_id, stage, start, time.time() - start_time,
+                    success=success, bytes_written=stats['bytes_written'])
+            except BaseException as e:
+                # Timing should never break the analysis
+                LOGGER.exception(e)
+
+    def __unicode__(self):
+        return 'Analysis {0}: {1} {2:.3f}s'.format(
+            self.analysis_id, self.stage, self.duration)
+
+
+class HTTPClientCounter(models.Model):
+    """Counters of the HTTP client of every GeoSAFE process.
+
+    Each web and worker process counts its requests in memory, and adds
+    them here from time to time (see geosafe.helpers.http_client), so the
+    exported metrics cover all processes.
+    """
+
+    class Meta:
+        unique_together = ('endpoint', 'status')
+
+    endpoint = models.CharField(
+        max_length=255,
+        help_text='Label given by the caller, or host of the url.'
+    )
+    status = models.CharField(
+        max_length=10,
+        help_text='Response status, or error if there was no response.'
+    )
+    requests = models.BigIntegerField(
+        default=0
+    )
+    seconds = models.FloatField(
+        verbose_name='Total time until response headers',
+        default=0
+    )
+    bytes_received = models.BigIntegerField(
+        default=0
+    )
+
+    @classmethod
+    def add(cls, endpoint, status, requests=0, seconds=0.0,
+            bytes_received=0):
+        """Add to the counters of an endpoint and response status.
+
+        :param endpoint: endpoint label
+        :type endpoint: str
+
+        :param status: response status
+        :type status: int, str
+
+        :param requests: number of requests
+        :type requests: int
+
+        :param seconds: time until response headers
+        :type seconds: float
+
+        :param bytes_received: size of received body
+        :type bytes_received: int
+        """
+        status = str(status)
+        counters = cls.objects.filter(endpoint=endpoint, status=status)
+        values = {
+            'requests': F('requests') + requests,
+            'seconds': F('seconds') + seconds,
+            'bytes_received': F('bytes_received') + bytes_received,
+        }
+        if counters.update(**values):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    endpoint=endpoint, status=status, requests=requests,
+                    seconds=seconds, bytes_received=bytes_received)
+        except IntegrityError:
+            # Created by other process
+            counters.update(**values)
+
+    def __unicode__(self):
+        return 'HTTP client {0} {1}: {2}'.format(
+            self.endpoint, self.status, self.requests)
+
+
+class AnalysisSummary(models.Model):
+    """Impact summary of an analysis.
+
+    The summary is computed once when the impact layer is ingested, instead
+    of reading analysis_summary.geojson and impact keywords on each request.
+
+    Summaries are kept when the analysis is deleted, for example by
+    clean_impact_result, so statistics across analyses don't change.
+    """
+
+    analysis = models.OneToOneField(
+        Analysis,
+        related_name='impact_summary',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL
+    )
+    impact_layer = models.ForeignKey(
+        Layer,
+        verbose_name='Impact Layer',
+        related_name='+',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL
+    )
+    exposure_type = models.CharField(
+        max_length=50,
+        blank=True,
+        default=''
+    )
+    hazard_type = models.CharField(
+        max_length=50,
+        blank=True,
+        default=''
+    )
+    hazard_classification = models.CharField(
+        max_length=100,
+        blank=True,
+        default=''
+    )
+    analysis_question = models.TextField(
+        blank=True,
+        default=''
+    )
+    total = models.BigIntegerField(
+        blank=True,
+        null=True
+    )
+    total_affected = models.BigIntegerField(
+        blank=True,
+        null=True
+    )
+    breakdown_json = models.TextField(
+        verbose_name='Count of each hazard class in json format',
+        help_text='List of hazard class and count pairs, in hazard class '
+                  'order.',
+        default='[]'
+    )
+
+    @classmethod
+    def create_from_impact_summary(cls, analysis, impact_summary):
+        """Store impact summary of an analysis.
+
+        :param analysis: Analysis object
+        :type analysis: Analysis
+
+        :param impact_summary: impact summary of the analysis impact layer
+        :type impact_summary:
+            geosafe.helpers.impact_summary.summary_base.ImpactSummary
+
+        :return: stored summary
+        :rtype: AnalysisSummary
+        """
+        values = {
+            'impact_layer': analysis.impact_layer,
+            'exposure_type': impact_summary.exposure_type() or '',
+            'hazard_type': impact_summary.hazard_type() or '',
+            'hazard_classification': (
+                impact_summary.hazard_classification() or ''),
+            'analysis_question': impact_summary.analysis_question() or '',
+            'total': None,
+            'total_affected': None,
+            'breakdown_json': '[]',
+        }
+        if impact_summary.is_summary_exists():
+            impact_data = impact_summary.impact_data
+            if impact_data.get('total') is not None:
+                values['total'] = impact_summary.total()
+            if impact_data.get('total_affected') is not None:
+                values['total_affected'] = impact_summary.total_affected()
+            values['breakdown_json'] = json.dumps(
+                impact_summary.breakdown_dict().items())
+
+        areas = [
+            {
+                'aggregation_area': properties.get('aggregation_name') or '',
+                'total': cls.parse_count(properties.get('total')),
+                'total_affected': cls.parse_count(
+                    properties.get('total_affected')),
+            } for properties in impact_summary.read_aggregation_summary()]
+        if not areas:
+            # Summary of the analysis extent
+            areas = [{
+                'aggregation_area': '',
+                'total': values['total'],
+                'total_affected': values['total_affected'],
+            }]
+
+        with transaction.atomic():
+            summary, created = cls.objects.update_or_create(
+                analysis=analysis, defaults=values)
+            summary.breakdowns.all().delete()
+            AnalysisSummaryBreakdown.objects.bulk_create([
+                AnalysisSummaryBreakdown(
+                    summary=summary,
+                    hazard_type=summary.hazard_type,
+                    exposure_type=summary.exposure_type,
+                    finished=analysis.end_time,
+                    **area)
+                for area in areas])
+        return summary
+
+    @staticmethod
+    def parse_count(value):
+        """Parse a count of impact summary.
+
+        :return: count, or None if it is not a number
+        :rtype: int
+        """
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+    def is_summary_exists(self):
+        return self.total is not None
+
+    def breakdown_dict(self):
+        """Count of each hazard class.
+
+        :rtype: OrderedDict
+        """
+        return OrderedDict(json.loads(self.breakdown_json))
+
+    def category_css_class(self, category):
+        """Get css-class from a given category."""
+        return category_css_class(category, self.hazard_type)
+
+    def __unicode__(self):
+        return 'Summary of Analysis {0}'.format(self.analysis_id)
+
+
+class AnalysisSummaryBreakdown(models.Model):
+    """Impact summary of an analysis in one aggregation area.
+
+    Hazard type, exposure type and finish time of the analysis are copied
+    here, so statistics across analyses are queried from this table alone.
+    """
+
+    class Meta:
+        index_together = [
+            ('hazard_type', 'exposure_type', 'finished'),
+        ]
+
+    summary = models.ForeignKey(
+        AnalysisSummary,
+        related_name='breakdowns',
+        on_delete=models.CASCADE
+    )
+    hazard_type = models.CharField(
+        max_length=50,
+        blank=True,
+        default=''
+    )
+    exposure_type = models.CharField(
+        max_length=50,
+        blank=True,
+        default=''
+    )
+    aggregation_area = models.CharField(
+        verbose_name='Aggregation area name',
+        help_text='Empty for the whole analysis extent.',
+        max_length=255,
+        blank=True,
+        default='',
+        db_index=True
+    )
+    finished = models.DateTimeField(
+        verbose_name='Analysis end time',
+        blank=True,
+        null=True,
+        db_index=True
+    )
+    total = models.BigIntegerField(
+        blank=True,
+        null=True
+    )
+    total_affected = models.BigIntegerField(
+        blank=True,
+        null=True
+    )
+
+    def __unicode__(self):
+        return 'Analysis summary {0} in {1}'.format(
+            self.summary_id, self.aggregation_area or 'analysis extent')
+
+
+class FilteredAggregation(models.Model):
+    """Subset of aggregation layer, shared by analyses with the same filter.
+
+    Each analysis that uses the subset holds a reference to it. Subsets
+    without reference are kept for later analyses, until they are evicted
+    in least recently used order when the cache exceeds
+    FILTERED_AGGREGATION_CACHE_SIZE.
+    """
+
+    aggregation_layer = models.ForeignKey(
+        Layer,
+        verbose_name='Aggregation Layer',
+        help_text='Aggregation layer being filtered.',
+        related_name='filtered_aggregations'
+    )
+    key = models.CharField(
+        max_length=40,
+        unique=True,
+        verbose_name='Cache key',
+        help_text='Hash of aggregation layer version and normalized filter'
+    )
+    path = models.CharField(
+        max_length=255,
+        verbose_name='File location of filtered aggregation'
+    )
+    size = models.BigIntegerField(
+        default=0,
+        verbose_name='Size of filtered aggregation files in bytes'
+    )
+    ref_count = models.IntegerField(
+        default=0,
+        verbose_name='Number of analyses using filtered aggregation'
+    )
+    last_used = models.DateTimeField(
+        default=datetime.now
+    )
+
+    @classmethod
+    def cache_key(cls, layer, fingerprint, property_name, values):
+        """Cache key of a filtered aggregation.
+
+        Filter values are normalized, so the same selection of areas
+        results in the same key regardless of order or duplicates.
+
+        :param layer: aggregation layer
+        :type layer: Layer
+
+        :param fingerprint: fingerprint of aggregation layer files
+        :type fingerprint: str
+
+        :param property_name: name of the property to filter
+        :type property_name: basestring
+
+        :param values: selected values of the property
+        :type values: list
+
+        :rtype: str
+        """
+        return hashlib.sha1('{layer_id}:{fingerprint}:{filter}'.format(
+            layer_id=layer.id,
+            fingerprint=fingerprint,
+            filter=cls.normalized_filter(
+                property_name, values).encode('utf-8'))).hexdigest()
+
+    @staticmethod
+    def normalized_filter(property_name, values):
+        """Serialize aggregation filter regardless of order or duplicates.
+
+        :param property_name: name of the property to filter
+        :type property_name: basestring
+
+        :param values: selected values of the property
+        :type values: list
+
+        :rtype: basestring
+        """
+        return json.dumps([
+            unicode(property_name),
+            sorted(set(unicode(v) for v in values))])
+
+    @classmethod
+    def acquire(cls, key):
+        """Take a reference of a cached filtered aggregation.
+
+        :param key: cache key
+        :type key: str
+
+        :return: path of filtered aggregation, or None if it is not cached
+        :rtype: str
+        """
+        with transaction.atomic():
+            try:
+                entry = cls.objects.select_for_update().get(key=key)
+            except cls.DoesNotExist:
+                return None
+            if not os.path.exists(entry.path):
+                entry.delete()
+                return None
+            cls.objects.filter(pk=entry.pk).update(
+                ref_count=F('ref_count') + 1,
+                last_used=datetime.now())
+        return entry.path
+
+    @classmethod
+    def store(cls, layer, key, path):
+        """Add a filtered aggregation to the cache, with one reference.
+
+        If the same subset was stored by another analysis in the meantime,
+        a reference of that one is taken instead, and the caller should
+        remove its own files.
+
+        :param layer: aggregation layer
+        :type layer: Layer
+
+        :param key: cache key
+        :type key: str
+
+        :param path: path of filtered aggregation
+        :type path: str
+
+        :return: path of cached filtered aggregation
+        :rtype: str
+        """
+        with transaction.atomic():
+            entry, created = cls.objects.select_for_update().get_or_create(
+                key=key,
+                defaults={
+                    'aggregation_layer': layer,
+                    'path': path,
+                    'size': sum(
+                        os.path.getsize(p) for p in cls.layer_files(path)),
+                    'ref_count': 1,
+                })
+            if not created:
+                cls.objects.filter(pk=entry.pk).update(
+                    ref_count=F('ref_count') + 1,
+                    last_used=datetime.now())
+        return entry.path
+
+    @classmethod
+    def release(cls, path):
+        """Release a reference of a filtered aggregation.
+
+        :param path: path of filtered aggregation
+        :type path: str
+
+        :return: True if the path is a cached filtered aggregation
+        :rtype: bool
+        """
+        entries = cls.objects.filter(path=path)
+        entries.filter(ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1,
+            last_used=datetime.now())
+        return entries.exists()
+
+    @classmethod
+    def evict(cls, max_size=None):
+        """Remove least recently used filtered aggregations without reference.
+
+        :param max_size: maximum total size of the cache in bytes. Default
+            to FILTERED_AGGREGATION_CACHE_SIZE setting.
+        :type max_size: int
+
+        :return: number of evicted filtered aggregations
+        :rtype: int
+        """
+        if max_size is None:
+            max_size = settings.FILTERED_AGGREGATION_CACHE_SIZE
+        evicted = 0
+        with transaction.atomic():
+            total_size = cls.objects.aggregate(
+                total_size=Sum('size'))['total_size'] or 0
+            if total_size <= max_size:
+                return evicted
+            entries = cls.objects.select_for_update().filter(
+                ref_count=0).order_by('last_used')
+            for entry in entries:
+                if total_size <= max_size:
+                    break
+                # Files are removed by post delete signal
+                entry.delete()
+                total_size -= entry.size
+                evicted += 1
+        return evicted
+
+    @staticmethod
+    def layer_files(path):
+        """Files of a filtered aggregation, including its metadata.
+
+        :param path: path of filtered aggregation
+        :type path: str
+
+        :rtype: list
+        """
+        basename, _ = os.path.splitext(path)
+        return glob.glob('{basename}.*'.format(basename=basename))
+
+    def delete_files(self):
+        """Remove files of the filtered aggregation."""
+        for p in self.layer_files(self.path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def __unicode__(self):
+        return 'Filtered Aggregation: {0}'.format(self.path)
+
+
 # needed to load signals
 # noinspection PyUnresolvedReferences
 from geosafe.signals import *  # noqa
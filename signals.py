@@ -1,17 +1,17 @@
 # coding=utf-8
-import codecs
-
-from django.core.files.base import ContentFile
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from lxml import etree
 
-from geonode.catalogue.models import catalogue_post_save
-from geonode.layers.models import Layer, LayerFile
-from geosafe.helpers.inasafe_helper import \
-    extract_inasafe_keywords_from_metadata
-from geosafe.models import Analysis, Metadata
-from geosafe.tasks.analysis import create_metadata_object, prepare_analysis
+from geonode.layers.models import Layer
+from geosafe.app_settings import settings
+from geosafe.helpers.aggregation import invalidate_aggregation_index
+from geosafe.helpers.inasafe_helper import parse_inasafe_keywords
+from geosafe.helpers.layer_archive import invalidate_layer_archive
+from geosafe.helpers.metadata import sync_inasafe_metadata
+from geosafe.helpers.vector_tile import invalidate_vector_tiles
+from geosafe.models import Analysis, Metadata, FilteredAggregation
+from geosafe.tasks.analysis import create_metadata_object, \
+    set_layer_purpose, dispatch_analysis
 
 __author__ = 'Rizky Maulana Nugraha <lana.pcfre@gmail.com>'
 __date__ = '2/3/16'
@@ -19,57 +19,7 @@ __date__ = '2/3/16'
 
 def process_inasafe_metadata(sender, instance, created, **kwargs):
     """Extract and save uploaded InaSAFE metadata."""
-    # retrieve metadata_xml from layer original xml file
-    try:
-        xml_file = instance.upload_session.layerfile_set.get(name='xml')
-    except LayerFile.DoesNotExist:
-        # if no xml file, we do nothing
-        return
-
-    metadata_xml = xml_file.file.read()
-    inasafe_el, inasafe_provenance_el = \
-        extract_inasafe_keywords_from_metadata(metadata_xml)
-
-    # Update metadata instance
-    metadata, created = Metadata.objects.get_or_create(layer=instance)
-
-    inasafe_metadata_xml = ''
-    if inasafe_el:
-        inasafe_metadata_xml = etree.tostring(inasafe_el, pretty_print=True)
-
-    if inasafe_provenance_el:
-        inasafe_metadata_xml += '\n'
-        inasafe_metadata_xml += etree.tostring(
-            inasafe_provenance_el, pretty_print=True)
-
-    metadata.keywords_xml = inasafe_metadata_xml
-
-    instance.refresh_from_db()
-    instance.inasafe_metadata = metadata
-
-    # Trigger catalogue metadata xml update
-    catalogue_post_save(instance, sender, **kwargs)
-
-    # After this. The new corrected xml file (which contains InaSAFE metadata)
-    # will exists on layer.metadata_xml
-    # In turn, we overwrite xml file in both media folder and QGIS layer
-    # folder, because QGIS will use the actual file.
-    instance.refresh_from_db()
-
-    # Update layer xml path
-    xml_file_name = xml_file.file.name
-    xml_file.file.delete(save=False)
-    xml_file.file.save(
-        xml_file_name, ContentFile(instance.metadata_xml), save=True)
-
-    # Update QGIS server xml path
-    with codecs.open(
-            instance.qgis_layer.xml_path, mode='w', encoding='utf-8') as f:
-        f.write(instance.metadata_xml)
-
-    # Save metadata and trigger signal handlers
-    # This will process layer purpose from InaSAFE get_keywords task
-    metadata.save()
+    sync_inasafe_metadata(instance, sender, **kwargs)
 
 
 @receiver(post_save, sender=Layer)
@@ -86,6 +36,28 @@ def layer_post_save(sender, instance, created, **kwargs):
     # to patch this
     process_inasafe_metadata(sender, instance, created, **kwargs)
 
+    # Keep footprint in sync with layer bbox. Use update to avoid triggering
+    # metadata post save handler.
+    Metadata.objects.filter(layer=instance).update(
+        footprint=Metadata.layer_footprint(instance))
+
+    # Cached archives and vector tiles are keyed by fingerprint of layer
+    # files, so they are not invalidated here. Previous versions are
+    # removed when the new version is cached.
+
+
+@receiver(post_delete, sender=Layer)
+def layer_post_delete(sender, instance, **kwargs):
+    """Signal to handle layer deletion.
+
+    :param instance:
+    :type instance: Layer
+    :return:
+    """
+    invalidate_layer_archive(instance)
+    invalidate_vector_tiles(instance)
+    invalidate_aggregation_index(instance)
+
 
 @receiver(post_save)
 def metadata_post_save(sender, instance, created, **kwargs):
@@ -102,13 +74,27 @@ def metadata_post_save(sender, instance, created, **kwargs):
     """
     if not isinstance(instance, Metadata):
         return
-    # execute in a different task to let post_save returns and create metadata
-    # asyncly
-    # set countdown to 5 secs, to make sure it is executed after layer is
-    # saved.
     if instance.keywords_xml:
-        create_metadata_object.apply_async(
-            args=[instance.layer.id], countdown=5)
+        # Layer save also saves its metadata, even if the keywords didn't
+        # change.
+        if not instance.keywords_changed():
+            return
+        # Standard keywords are read right away, without waiting for
+        # InaSAFE Headless.
+        keywords = None
+        if settings.INASAFE_LOCAL_KEYWORDS_PARSER:
+            keywords = parse_inasafe_keywords(instance.keywords_xml)
+        if keywords:
+            set_layer_purpose(
+                keywords, instance.layer_id,
+                Metadata.hash_keywords(instance.keywords_xml))
+        else:
+            # execute in a different task to let post_save returns and create
+            # metadata asyncly
+            # set countdown to 5 secs, to make sure it is executed after layer
+            # is saved.
+            create_metadata_object.apply_async(
+                args=[instance.layer.id], countdown=5)
     else:
         instance.reset_metadata()
 
@@ -124,12 +110,12 @@ def analysis_post_save(sender, instance, created, **kwargs):
     :param kwargs:
     :return:
     """
-    # Used to run impact analysis when analysis object is firstly created
-    if created:
-        async_result = prepare_analysis(instance.id)
-        Analysis.objects.filter(id=instance.id).update(
-            task_id=async_result.task_id,
-            task_state=async_result.state)
+    # Used to run impact analysis when analysis object is firstly created.
+    # Only enqueue the analysis here, so the request returns immediately.
+    # Analyses of a batch are run together, see dispatch_analysis_batch.
+    # Analyses of a sweep are started by dispatch_analysis_sweep.
+    if created and not instance.batch_id and not instance.sweep_id:
+        dispatch_analysis(instance.id)
 
 
 @receiver(post_delete, sender=Analysis)
@@ -161,3 +147,19 @@ def analysis_post_delete(sender, instance, **kwargs):
         instance.impact_layer.delete()
     except BaseException:
         pass
+
+    # Analysis was deleted before its filtered aggregation was released
+    if instance.filtered_aggregation:
+        FilteredAggregation.release(instance.filtered_aggregation)
+
+
+@receiver(post_delete, sender=FilteredAggregation)
+def filtered_aggregation_post_delete(sender, instance, **kwargs):
+    """Remove filtered aggregation files when it is evicted or its
+    aggregation layer is deleted.
+
+    :param instance:
+    :type instance: FilteredAggregation
+    :return:
+    """
+    instance.delete_files()
@@ -2,5 +2,6 @@
 
 from geosafe.tasks.analysis import *  # noqa=F403,F401
 from geosafe.tasks.metasearch import *  # noqa=F403,F401
+from geosafe.tasks.monitor import *  # noqa=F403,F401
 
 __author__ = 'lucernae'
@@ -2,41 +2,46 @@
 
 from __future__ import absolute_import
 
-import glob
+import hashlib
 import json
 import logging
 import os
 import shutil
 import tempfile
-import time
 import urlparse
-from datetime import datetime
+from datetime import datetime, timedelta
 from zipfile import ZipFile
 
-import requests
-from celery import chain
-from celery.result import allow_join_result, AsyncResult
+from celery import chain, group
+from celery.utils import uuid
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import F
 from django.db.models.query_utils import Q
 from django.core.files import File
-from lxml import etree
-from lxml.etree import XML, Element
 
-from geonode.base.models import ResourceBase
-from geonode.layers.models import Layer, cov_exts, vec_exts
+from geonode.layers.models import Layer, LayerFile, cov_exts, vec_exts
 from geonode.layers.utils import file_upload
-from geonode.qgis_server.helpers import qgis_server_endpoint
 from geosafe.app_settings import settings
 from geosafe.celery_app import app
+from geosafe.helpers.impact_summary.summary_base import ImpactSummary
+from geosafe.helpers.inasafe_helper import parse_inasafe_keywords
+from geosafe.helpers.metadata import sync_inasafe_metadata
+from geosafe.helpers.aggregation import (
+    filter_aggregation_local, filter_aggregation_wfs,
+    get_indexed_aggregation)
 from geosafe.helpers.utils import (
     download_file, get_layer_path, get_impact_path,
-    copy_inasafe_metadata, send_analysis_result_email)
-from geosafe.models import Analysis, Metadata, \
-    ISO_METADATA_INASAFE_KEYWORD_TAG, \
-    ISO_METADATA_INASAFE_PROVENANCE_KEYWORD_TAG, AnalysisTaskInfo
+    copy_inasafe_metadata, send_analysis_result_email,
+    layer_files_fingerprint, notify_metadata_ready, layer_member_names,
+    extract_zip_members, link_or_copy_file)
+from geosafe.models import Analysis, Metadata, AnalysisTaskInfo, \
+    FilteredAggregation, AnalysisBatch, AnalysisSweep, AnalysisStageTiming, \
+    AnalysisSummary
 from geosafe.tasks.headless.analysis import (
-    get_keywords, generate_report, run_analysis, RESULT_SUCCESS)
+    get_keywords, generate_report, run_analysis, run_multi_exposure_analysis,
+    RESULT_SUCCESS)
 from geosafe.utils import substitute_layer_order
 
 __author__ = 'lucernae'
@@ -44,6 +49,15 @@ __author__ = 'lucernae'
 
 LOGGER = logging.getLogger(__name__)
 
+# Name of analysis summary layer file of impact layer
+ANALYSIS_SUMMARY_FILENAME = 'analysis_summary.geojson'
+
+# Name of aggregation summary layer file of impact layer
+AGGREGATION_SUMMARY_FILENAME = 'aggregation_summary.geojson'
+
+# Prefix of generate_report task id, followed by the analysis id
+REPORT_TASK_ID_PREFIX = 'geosafe-report-'
+
 
 @app.task(
     name='geosafe.tasks.analysis.inasafe_metadata_fix',
@@ -57,97 +71,41 @@ def inasafe_metadata_fix(layer_id):
     This bug happens because InaSAFE metadata implement wrong schema type in
     supplementalInformation.
 
+    The layer metadata is processed in the same way as layer post save,
+    except that catalogue metadata is always regenerated and repaired.
+
     :param layer_id: layer ID
     :type layer_id: int
     :return:
     """
-
-    # Take InaSAFE keywords from xml metadata *file*
     try:
         instance = Layer.objects.get(id=layer_id)
-        xml_file = instance.upload_session.layerfile_set.get(name='xml')
-
-        # if xml file exists, check supplementalInformation field
-        namespaces = {
-            'gmd': 'http://www.isotc211.org/2005/gmd',
-            'gco': 'http://www.isotc211.org/2005/gco'
-        }
-        content = xml_file.file.read()
-        root = XML(content)
-        # supplemental_info = root.xpath(
-        #     '//gmd:supplementalInformation',
-        #     namespaces=namespaces)[0]
-
-        # Check that it contains InaSAFE metadata
-        inasafe_el = root.xpath(ISO_METADATA_INASAFE_KEYWORD_TAG)
-        inasafe_provenance_el = root.xpath(
-            ISO_METADATA_INASAFE_PROVENANCE_KEYWORD_TAG)
-
-        # Take InaSAFE metadata
-        if not inasafe_el:
-            # Do nothing if InaSAFE tag didn't exists
-            return
-
-        # Take root xml from layer metadata_xml field
-        layer_root_xml = XML(instance.metadata_xml)
-        layer_sup_info = layer_root_xml.xpath(
-            '//gmd:supplementalInformation',
-            namespaces=namespaces)[0]
-
-        char_string_tagname = '{gco}CharacterString'.format(**namespaces)
-
-        layer_sup_info_content = layer_sup_info.find(char_string_tagname)
-        if layer_sup_info_content is None:
-            # Insert gco:CharacterString value
-            el = Element(char_string_tagname)
-            layer_sup_info.insert(0, el)
-
-        # put InaSAFE keywords after CharacterString
-        layer_inasafe_meta_content = layer_sup_info.find('inasafe')
-        if layer_inasafe_meta_content is not None:
-            # Clear existing InaSAFE keywords, replace with new one
-            layer_sup_info.remove(layer_inasafe_meta_content)
-        layer_sup_info.insert(1, inasafe_el)
-
-        # provenance only shows up on impact layers
-        layer_inasafe_meta_provenance = layer_sup_info.find(
-            'inasafe_provenance')
-        if inasafe_provenance_el is not None:
-            if layer_inasafe_meta_provenance is not None:
-                # Clear existing InaSAFE keywords, replace with new one
-                layer_sup_info.remove(layer_inasafe_meta_provenance)
-            layer_sup_info.insert(1, inasafe_provenance_el)
-
-        # write back to resource base so the same thing returned by csw
-        resources = ResourceBase.objects.filter(
-            id=instance.resourcebase_ptr.id)
-        resources.update(
-            metadata_xml=etree.tostring(layer_root_xml, pretty_print=True))
-
-        # update qgis server xml file
-        with open(xml_file.file.path, mode='w') as f:
-            f.write(etree.tostring(layer_root_xml, pretty_print=True))
-
-        qgis_layer = instance.qgis_layer
-        qgis_xml_file = '{prefix}.xml'.format(
-            prefix=qgis_layer.qgis_layer_path_prefix)
-        with open(qgis_xml_file, mode='w') as f:
-            f.write(etree.tostring(layer_root_xml, pretty_print=True))
-
-        # update InaSAFE keywords cache
-
-        metadata, created = Metadata.objects.get_or_create(layer=instance)
-        inasafe_metadata_xml = etree.tostring(inasafe_el, pretty_print=True)
-        if inasafe_provenance_el:
-            inasafe_metadata_xml += '\n'
-            inasafe_metadata_xml += etree.tostring(
-                inasafe_provenance_el, pretty_print=True)
-        metadata.keywords_xml = inasafe_metadata_xml
-        metadata.save()
-
+        sync_inasafe_metadata(instance, force=True)
     except Exception as e:
         LOGGER.debug(e)
-        pass
+
+
+def get_layer_keywords_url(layer):
+    """Layer url that InaSAFE Headless uses to read layer keywords.
+
+    :param layer: Layer object
+    :type layer: Layer
+
+    :return: file url if direct disk access is configured, or layer metadata
+        url
+    :rtype: basestring
+    """
+    using_direct_access = (
+        hasattr(settings, 'INASAFE_LAYER_DIRECTORY') and
+        settings.INASAFE_LAYER_DIRECTORY)
+    if using_direct_access and not layer.remote_service:
+        # If direct disk access were configured, then use it.
+        return urlparse.urljoin('file://', get_layer_path(layer))
+    # InaSAFE Headless celery will download metadata from url
+    layer_url = reverse(
+        'geosafe:layer-metadata',
+        kwargs={'layer_id': layer.id})
+    return urlparse.urljoin(settings.GEONODE_BASE_URL, layer_url)
 
 
 @app.task(
@@ -168,19 +126,20 @@ def create_metadata_object(self, layer_id):
     """
     try:
         layer = Layer.objects.get(id=layer_id)
-        # Now that layer exists, get InaSAFE keywords
-        using_direct_access = (
-            hasattr(settings, 'INASAFE_LAYER_DIRECTORY') and
-            settings.INASAFE_LAYER_DIRECTORY)
-        if using_direct_access and not layer.remote_service:
-            # If direct disk access were configured, then use it.
-            layer_url = urlparse.urljoin('file://', get_layer_path(layer))
-        else:
-            # InaSAFE Headless celery will download metadata from url
-            layer_url = reverse(
-                'geosafe:layer-metadata',
-                kwargs={'layer_id': layer.id})
-            layer_url = urlparse.urljoin(settings.GEONODE_BASE_URL, layer_url)
+        metadata = Metadata.objects.get(layer=layer)
+        keywords_hash = Metadata.hash_keywords(metadata.keywords_xml)
+        if metadata.keywords_hash == keywords_hash:
+            # Keywords were already processed
+            return True
+
+        # Standard keywords can be read without InaSAFE
+        keywords = None
+        if settings.INASAFE_LOCAL_KEYWORDS_PARSER:
+            keywords = parse_inasafe_keywords(metadata.keywords_xml)
+        if keywords:
+            return set_layer_purpose(keywords, layer_id, keywords_hash)
+
+        layer_url = get_layer_keywords_url(layer)
         # Execute in chain:
         # - Get InaSAFE keywords from InaSAFE worker
         # - Set Layer metadata according to InaSAFE keywords
@@ -189,11 +148,11 @@ def create_metadata_object(self, layer_id):
         tasks_chain = chain(
             get_keywords.s(layer_url).set(
                 queue=get_keywords_queue),
-            set_layer_purpose.s(layer_id).set(
+            set_layer_purpose.s(layer_id, keywords_hash).set(
                 queue=set_layer_purpose_queue)
         )
         tasks_chain.delay()
-    except Layer.DoesNotExist as e:
+    except (Layer.DoesNotExist, Metadata.DoesNotExist) as e:
         # Perhaps layer wasn't saved yet.
         # Retry later
         LOGGER.debug('Layer with id: {0} not saved yet'.format(layer_id))
@@ -208,7 +167,7 @@ def create_metadata_object(self, layer_id):
 @app.task(
     name='geosafe.tasks.analysis.set_layer_purpose',
     queue='geosafe')
-def set_layer_purpose(keywords, layer_id):
+def set_layer_purpose(keywords, layer_id, keywords_hash=None):
     """Set layer keywords based on what InaSAFE gave.
 
     :param keywords: Keywords taken from InaSAFE metadata.
@@ -217,6 +176,10 @@ def set_layer_purpose(keywords, layer_id):
     :param layer_id: layer ID
     :type layer_id: int
 
+    :param keywords_hash: hash of the keywords xml the keywords were taken
+        from
+    :type keywords_hash: str
+
     :return: True if success
     :rtype: bool
     """
@@ -229,10 +192,14 @@ def set_layer_purpose(keywords, layer_id):
             'impact_analysis'))
     metadata.category = keywords.get(metadata.layer_purpose, None)
     metadata.keywords_json = json.dumps(keywords, cls=DjangoJSONEncoder)
+    metadata.footprint = Metadata.layer_footprint(metadata.layer)
     Metadata.objects.filter(pk=metadata.pk).update(
         layer_purpose=metadata.layer_purpose,
         keywords_json=metadata.keywords_json,
-        category=metadata.category)
+        keywords_hash=keywords_hash,
+        category=metadata.category,
+        footprint=metadata.footprint)
+    notify_metadata_ready(layer_id)
 
     return True
 
@@ -259,6 +226,9 @@ def clean_impact_result():
 def prepare_aggregation_filter(analysis_id):
     """Filter current aggregation layer.
 
+    Selected aggregation areas are read directly from the aggregation layer
+    file. QGIS Server WFS is only used if the layer file can't be read.
+
     :param analysis_id: analysis id of the object
     :type analysis_id: int
 
@@ -268,110 +238,296 @@ def prepare_aggregation_filter(analysis_id):
     analysis = Analysis.objects.get(id=analysis_id)
     if not analysis.aggregation_layer:
         return None
-    aggregation_layer = analysis.aggregation_layer.qgis_layer
 
-    endpoint = qgis_server_endpoint(internal=True)
+    property_name, property_values = parse_aggregation_filter(analysis)
+    if not property_name or not property_values:
+        # Nothing to filter, use the whole aggregation layer
+        return get_layer_path(analysis.aggregation_layer)
 
-    # construct WFS filter query_params
-    query_string = {
-        'MAP': aggregation_layer.qgis_project_path,
-        'SERVICE': 'WFS',
-        'REQUEST': 'GetFeature',
-        'TYPENAME': aggregation_layer.layer.name,
-        'OUTPUTFORMAT': 'GeoJSON'
-    }
-    filter_string = None
+    filtered_aggregation = acquire_filtered_aggregation(
+        analysis.aggregation_layer, property_name, property_values)
+    if not filtered_aggregation:
+        # when everything fails
+        return get_layer_path(analysis.aggregation_layer)
+
+    # Update filtered aggregation location
+    Analysis.objects.filter(id=analysis_id).update(
+        filtered_aggregation=filtered_aggregation)
+
+    return get_layer_path(filtered_aggregation)
+
+
+def acquire_filtered_aggregation(layer, property_name, property_values):
+    """Take a reference of filtered aggregation layer.
+
+    Filtered aggregation of other analysis with the same filter is reused.
+    Otherwise it is created and stored in the cache.
+
+    :param layer: aggregation layer
+    :type layer: Layer
+
+    :param property_name: name of the property to filter
+    :type property_name: basestring
+
+    :param property_values: selected values of the property
+    :type property_values: list
+
+    :return: path of filtered aggregation, or None if it failed
+    :rtype: str
+    """
+    aggregation_layer = layer.qgis_layer
+    try:
+        cache_key = FilteredAggregation.cache_key(
+            layer, layer_files_fingerprint(layer),
+            property_name, property_values)
+    except BaseException as e:
+        LOGGER.error(e)
+        return None
+
+    # Reuse filtered aggregation of other analysis with the same filter
+    filtered_aggregation = FilteredAggregation.acquire(cache_key)
+    if filtered_aggregation:
+        return filtered_aggregation
+
+    # create temporary inasafe layer
+    prefix_name = '{layer_name}_'.format(
+        layer_name=aggregation_layer.qgis_layer_name)
+    # the files needs to be at the same dir where aggregation layer is
+    dirname = os.path.dirname(aggregation_layer.base_layer_path)
+    fd, temp_aggregation = tempfile.mkstemp(
+        prefix=prefix_name,
+        suffix='.geojson',
+        dir=dirname)
+    os.close(fd)
+
+    layer_path = aggregation_layer.base_layer_path
+    try:
+        layer_path = get_indexed_aggregation(
+            layer, property_name) or layer_path
+    except BaseException as e:
+        # Filter still works without index
+        LOGGER.debug(e)
+
+    success = False
+    try:
+        filter_aggregation_local(
+            layer_path, temp_aggregation, property_name, property_values)
+        success = True
+    except BaseException as e:
+        LOGGER.info('Filter aggregation using WFS. {0}'.format(e))
+
+    if not success:
+        try:
+            success = filter_aggregation_wfs(
+                aggregation_layer, temp_aggregation,
+                property_name, property_values)
+        except BaseException as e:
+            LOGGER.error(e)
+            # Failed to filter aggregation layer somehow
+
+    if not success:
+        if os.path.exists(temp_aggregation):
+            os.remove(temp_aggregation)
+        return None
+
+    filename, _ = os.path.splitext(os.path.basename(temp_aggregation))
+    # copy metadata
+    copy_inasafe_metadata(
+        aggregation_layer.base_layer_path, dirname, filename)
+
+    # Share it with later analyses
+    filtered_aggregation = FilteredAggregation.store(
+        layer, cache_key, temp_aggregation)
+    if not filtered_aggregation == temp_aggregation:
+        # Other analysis stored the same subset first
+        for p in FilteredAggregation.layer_files(temp_aggregation):
+            os.remove(p)
+    FilteredAggregation.evict()
+    return filtered_aggregation
+
+
+def parse_aggregation_filter(analysis):
+    """Parse aggregation filter of an analysis.
+
+    :param analysis: Analysis object
+    :type analysis: Analysis
+
+    :return: property name and selected values, or None if there is no
+        valid filter
+    :rtype: (basestring, list)
+    """
+    property_name = None
+    property_values = None
     if analysis.aggregation_filter:
         try:
             filter_dict = json.loads(analysis.aggregation_filter)
 
             property_name = filter_dict['property_name']
             property_values = filter_dict['values']
-
-            like_statement = []
-            for val in property_values:
-                like_statement.append(
-                    '<PropertyIsLike>'
-                    '<PropertyName>{name}</PropertyName>'
-                    '<Literal>{value}</Literal>'
-                    '</PropertyIsLike>'.format(name=property_name, value=val)
-                )
-            filter_string = '<Filter>{filter}</Filter>'.format(
-                filter=''.join(like_statement))
-
         except BaseException as e:
             LOGGER.error(e)
             # something happened, don't use filter
-            filter_string = None
+    return property_name, property_values
 
-    if filter_string:
-        query_string['FILTER'] = filter_string
 
-    response = requests.get(endpoint, params=query_string)
-    if response.ok:
-        try:
-            # try parse geojson
-            geojson = response.json()
-            # if successful, create temporary inasafe layer
-            prefix_name = '{layer_name}_'.format(
-                layer_name=aggregation_layer.qgis_layer_name)
-            # the files needs to be at the same dir where aggregation layer is
-            dirname = os.path.dirname(aggregation_layer.base_layer_path)
-            temp_aggregation = tempfile.mkstemp(
-                    prefix=prefix_name,
-                    suffix='.geojson',
-                    dir=dirname)[1]
-            with open(temp_aggregation, mode='w+b') as f:
-                # Re dump just to be safe
-                f.write(json.dumps(geojson))
-            filename, _ = os.path.splitext(os.path.basename(temp_aggregation))
-            # copy metadata
-            copy_inasafe_metadata(
-                aggregation_layer.base_layer_path, dirname, filename)
-
-            # Update filtered aggregation location
-            Analysis.objects.filter(id=analysis_id).update(
-                filtered_aggregation=temp_aggregation)
-
-            # Return temporary path
-            return get_layer_path(temp_aggregation)
-        except BaseException as e:
-            LOGGER.error(e)
-            # Failed to filter aggregation layer somehow
+def analysis_fingerprint(analysis):
+    """Fingerprint of analysis inputs.
 
-    # when everything fails
-    return get_layer_path(analysis.aggregation_layer)
+    Analyses with the same fingerprint produce the same result. It changes
+    whenever any of the input layer files is updated.
 
+    :param analysis: Analysis object
+    :type analysis: Analysis
 
-def prepare_analysis(analysis_id):
-    """Prepare and run analysis
+    :return: hex digest fingerprint
+    :rtype: str
+    """
+    fingerprint = hashlib.sha1()
+    layers = [
+        analysis.hazard_layer,
+        analysis.exposure_layer,
+        analysis.aggregation_layer
+    ]
+    for layer in layers:
+        if layer:
+            fingerprint.update('{layer_id}:{files};'.format(
+                layer_id=layer.id, files=layer_files_fingerprint(layer)))
+        else:
+            fingerprint.update('None;')
+
+    aggregation_filter = ''
+    if analysis.aggregation_layer:
+        property_name, property_values = parse_aggregation_filter(analysis)
+        if property_name and property_values:
+            aggregation_filter = FilteredAggregation.normalized_filter(
+                property_name, property_values)
+
+    fingerprint.update(u'{filter};{extent_option};{user_extent};'
+                       u'{language_code}'.format(
+                           filter=aggregation_filter,
+                           extent_option=analysis.extent_option,
+                           user_extent=analysis.user_extent or '',
+                           language_code=analysis.language_code
+                       ).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def find_analysis_result(analysis):
+    """Find a finished analysis with identical inputs.
+
+    :param analysis: Analysis object with fingerprint
+    :type analysis: Analysis
+
+    :return: Analysis with the same fingerprint, finished within
+        ANALYSIS_RESULT_CACHE_TTL, or None
+    :rtype: Analysis
+    """
+    cache_ttl = settings.ANALYSIS_RESULT_CACHE_TTL
+    if not cache_ttl or not analysis.fingerprint:
+        return None
+    return Analysis.objects.filter(
+        fingerprint=analysis.fingerprint,
+        task_state='SUCCESS',
+        impact_layer__isnull=False,
+        end_time__gte=datetime.now() - timedelta(seconds=cache_ttl)
+    ).exclude(
+        id=analysis.id
+    ).exclude(
+        Q(report_map__isnull=True) | Q(report_map='') |
+        Q(report_table__isnull=True) | Q(report_table='')
+    ).order_by('-end_time').first()
+
+
+def dispatch_analysis(analysis_id, use_cache=True):
+    """Enqueue an analysis and record its task in the model.
 
     :param analysis_id: analysis id of the object
     :type analysis_id: int
 
+    :param use_cache: Reuse the result of identical analysis, if any
+    :type use_cache: bool
+
     :return: Celery Async Result
     :rtype: celery.result.AsyncResult
     """
-    analysis = Analysis.objects.get(id=analysis_id)
-
-    # Set analysis start time
+    # Record the task before it is sent, so the task monitor never misses
+    # its state transition.
+    task_id = uuid()
     Analysis.objects.filter(id=analysis_id).update(
-        start_time=datetime.now())
-    analysis.refresh_from_db()
+        task_id=task_id,
+        task_state='PENDING',
+        task_stage=None)
+    return prepare_analysis.apply_async(
+        (analysis_id, ), {'use_cache': use_cache}, task_id=task_id)
+
+
+@app.task(
+    name='geosafe.tasks.analysis.prepare_analysis',
+    queue='geosafe')
+def prepare_analysis(analysis_id, use_cache=True):
+    """Prepare and run analysis
+
+    This is executed in the worker instead of the request that creates the
+    analysis, because resolving layer paths and filtering aggregation layer
+    may take a while.
+
+    The analysis chain is dispatched from this task, so this task id is the
+    root id of every task in the chain.
+
+    If an identical analysis finished recently, its result is cloned
+    instead of running the analysis in InaSAFE Headless.
+
+    :param analysis_id: analysis id of the object
+    :type analysis_id: int
+
+    :param use_cache: Reuse the result of identical analysis, if any
+    :type use_cache: bool
+
+    :return: Task id of the analysis chain
+    :rtype: str
+    """
+    analysis = Analysis.objects.get(id=analysis_id)
 
-    hazard = get_layer_path(analysis.hazard_layer)
-    exposure = get_layer_path(analysis.exposure_layer)
-    aggregation = (
-        get_layer_path(analysis.aggregation_layer) if (
-            analysis.aggregation_layer) else None)
+    with AnalysisStageTiming.measure(
+            analysis_id, AnalysisStageTiming.STAGE_PREPARE):
+        try:
+            fingerprint = analysis_fingerprint(analysis)
+        except BaseException as e:
+            LOGGER.exception(e)
+            fingerprint = None
+
+        # Set analysis start time
+        Analysis.objects.filter(id=analysis_id).update(
+            start_time=datetime.now(),
+            fingerprint=fingerprint)
+        analysis.refresh_from_db()
+
+        cached_analysis = find_analysis_result(analysis) if (
+            use_cache) else None
+        if not cached_analysis:
+            hazard = get_layer_path(analysis.hazard_layer)
+            exposure = get_layer_path(analysis.exposure_layer)
+            aggregation = (
+                get_layer_path(analysis.aggregation_layer) if (
+                    analysis.aggregation_layer) else None)
+
+    if cached_analysis:
+        result = clone_analysis_result.apply_async(
+            (cached_analysis.id, analysis_id),
+            link_error=clean_up_temp_aggregation.si(None, analysis_id).set(
+                queue=clean_up_temp_aggregation.queue))
+        return result.task_id
 
     # Create temporary aggregation layer if aggregation filter exists
     if aggregation:
-        aggregation = prepare_aggregation_filter(analysis_id)
+        with AnalysisStageTiming.measure(
+                analysis_id, AnalysisStageTiming.STAGE_AGGREGATION_FILTER):
+            aggregation = prepare_aggregation_filter(analysis_id)
 
     # Execute analysis in chains:
     # - Run analysis
     # - Process analysis result
+    # - Release filtered aggregation, also if the analysis failed
     tasks_chain = chain(
         run_analysis.s(
             hazard, exposure, aggregation,
@@ -383,13 +539,255 @@ def prepare_analysis(analysis_id):
         clean_up_temp_aggregation.s(analysis_id).set(
             queue=clean_up_temp_aggregation.queue)
     )
-    result = tasks_chain.delay()
-    # Parent information will be lost later.
-    # What we should save is the run_analysis task result as this is the
-    # chain's parent
+    result = tasks_chain.apply_async(
+        link_error=clean_up_temp_aggregation.si(None, analysis_id).set(
+            queue=clean_up_temp_aggregation.queue))
+    # Return the run_analysis task id as this is the chain's parent
     while result.parent:
         result = result.parent
-    return result
+    return result.task_id
+
+
+def dispatch_analysis_batch(batch_id):
+    """Enqueue an analysis batch and record its task in the model.
+
+    :param batch_id: id of the analysis batch
+    :type batch_id: int
+
+    :return: Celery Async Result
+    :rtype: celery.result.AsyncResult
+    """
+    # Record the task before it is sent, so the task monitor never misses
+    # its state transition.
+    task_id = uuid()
+    AnalysisBatch.objects.filter(id=batch_id).update(task_id=task_id)
+    # Analyses of the batch share the task, so the task monitor records
+    # the state of all of them.
+    Analysis.objects.filter(batch_id=batch_id).update(
+        task_id=task_id,
+        task_state='PENDING',
+        task_stage=None)
+    return prepare_analysis_batch.apply_async((batch_id, ), task_id=task_id)
+
+
+@app.task(
+    name='geosafe.tasks.analysis.prepare_analysis_batch',
+    queue='geosafe')
+def prepare_analysis_batch(batch_id):
+    """Prepare and run analyses of a batch as a multi exposure analysis.
+
+    Aggregation layer is filtered once for all exposures. The filtered
+    aggregation is held by the first analysis of the batch.
+
+    :param batch_id: id of the analysis batch
+    :type batch_id: int
+
+    :return: Task id of the analysis chain
+    :rtype: str
+    """
+    batch = AnalysisBatch.objects.get(id=batch_id)
+    analyses = list(batch.analyses.select_related(
+        'exposure_layer').order_by('id'))
+
+    # Set analysis start time
+    start_time = datetime.now()
+    AnalysisBatch.objects.filter(id=batch_id).update(start_time=start_time)
+    batch.analyses.update(start_time=start_time)
+
+    hazard = get_layer_path(batch.hazard_layer)
+    exposures = [get_layer_path(a.exposure_layer) for a in analyses]
+    aggregation = None
+    if batch.aggregation_layer:
+        aggregation = prepare_aggregation_filter(analyses[0].id)
+
+    # Execute analysis in chains:
+    # - Run multi exposure analysis
+    # - Process impact result of each exposure
+    # - Release filtered aggregation, also if the analysis failed
+    tasks_chain = chain(
+        run_multi_exposure_analysis.s(
+            hazard, exposures, aggregation,
+            locale=batch.language_code).set(
+            queue=run_multi_exposure_analysis.queue).set(
+            time_limit=settings.INASAFE_ANALYSIS_RUN_TIME_LIMIT),
+        process_batch_impact_result.s(batch_id).set(
+            queue=process_batch_impact_result.queue),
+        clean_up_temp_aggregation.s(analyses[0].id).set(
+            queue=clean_up_temp_aggregation.queue)
+    )
+    result = tasks_chain.apply_async(
+        link_error=clean_up_temp_aggregation.si(None, analyses[0].id).set(
+            queue=clean_up_temp_aggregation.queue))
+    # Return the run_multi_exposure_analysis task id as this is the chain's
+    # parent
+    while result.parent:
+        result = result.parent
+    return result.task_id
+
+
+def dispatch_analysis_sweep(sweep_id):
+    """Enqueue an analysis sweep and record its tasks in the model.
+
+    Each analysis of the sweep has its own task id, reserved here, so the
+    task monitor records the state of each analysis separately.
+
+    :param sweep_id: id of the analysis sweep
+    :type sweep_id: int
+
+    :return: Celery Async Result
+    :rtype: celery.result.AsyncResult
+    """
+    for analysis_id in Analysis.objects.filter(
+            sweep_id=sweep_id).values_list('id', flat=True):
+        Analysis.objects.filter(id=analysis_id).update(
+            task_id=uuid(),
+            task_state='PENDING',
+            task_stage=None)
+    task_id = uuid()
+    AnalysisSweep.objects.filter(id=sweep_id).update(
+        task_id=task_id,
+        end_time=None)
+    return prepare_analysis_sweep.apply_async((sweep_id, ), task_id=task_id)
+
+
+@app.task(
+    name='geosafe.tasks.analysis.prepare_analysis_sweep',
+    queue='geosafe')
+def prepare_analysis_sweep(sweep_id):
+    """Prepare shared aggregation and start analyses of a sweep.
+
+    The aggregation layer is filtered once here. Analyses of the sweep take
+    it from the filtered aggregation cache.
+
+    :param sweep_id: id of the analysis sweep
+    :type sweep_id: int
+
+    :return: number of started analyses
+    :rtype: int
+    """
+    sweep = AnalysisSweep.objects.get(id=sweep_id)
+    AnalysisSweep.objects.filter(id=sweep_id).update(
+        start_time=datetime.now())
+
+    if sweep.aggregation_layer:
+        property_name, property_values = parse_aggregation_filter(sweep)
+        if property_name and property_values:
+            filtered_aggregation = acquire_filtered_aggregation(
+                sweep.aggregation_layer, property_name, property_values)
+            if filtered_aggregation:
+                # Keep it in the cache, without holding it
+                FilteredAggregation.release(filtered_aggregation)
+
+    return continue_analysis_sweep(sweep_id)
+
+
+@app.task(
+    name='geosafe.tasks.analysis.continue_analysis_sweep',
+    queue='geosafe')
+def continue_analysis_sweep(sweep_id, finished_analysis_id=None):
+    """Start pending analyses of a sweep, up to the concurrency limit.
+
+    Called when the sweep starts and each time an analysis of the sweep
+    finishes. Once every analysis is finished, the summary is combined.
+
+    :param sweep_id: id of the analysis sweep
+    :type sweep_id: int
+
+    :param finished_analysis_id: id of analysis that just finished
+    :type finished_analysis_id: int
+
+    :return: number of started analyses
+    :rtype: int
+    """
+    with transaction.atomic():
+        # Lock the sweep, so concurrent calls don't exceed the limit
+        sweep = AnalysisSweep.objects.select_for_update().get(id=sweep_id)
+        analyses = Analysis.objects.filter(sweep_id=sweep_id)
+        unfinished = analyses.exclude(task_state__in=['SUCCESS', 'FAILURE'])
+        # Analysis that just finished InaSAFE Headless run frees its slot,
+        # even if its report is still being generated.
+        running = unfinished.filter(task_stage__isnull=False).exclude(
+            id=finished_analysis_id).count()
+        slots = max(settings.ANALYSIS_SWEEP_CONCURRENCY - running, 0)
+        pending = list(analyses.filter(task_stage__isnull=True).order_by(
+            'id').values_list('id', 'task_id')[:slots])
+        Analysis.objects.filter(id__in=[p[0] for p in pending]).update(
+            task_stage='prepare_analysis')
+
+        # Only the call that finishes the sweep combines the summary
+        finished = not sweep.end_time and not unfinished.exists()
+        if finished:
+            AnalysisSweep.objects.filter(id=sweep_id).update(
+                end_time=datetime.now())
+
+    if pending:
+        # Analysis task id is the root id of its own task chain
+        group([
+            prepare_analysis.si(analysis_id).set(
+                task_id=task_id,
+                root_id=task_id,
+                queue=prepare_analysis.queue,
+                link_error=clean_up_temp_aggregation.si(
+                    None, analysis_id).set(
+                    queue=clean_up_temp_aggregation.queue))
+            for analysis_id, task_id in pending
+        ]).apply_async()
+    elif finished:
+        summarize_analysis_sweep.delay(sweep_id)
+    return len(pending)
+
+
+@app.task(
+    name='geosafe.tasks.analysis.summarize_analysis_sweep',
+    queue='geosafe')
+def summarize_analysis_sweep(sweep_id):
+    """Combine analysis summary of each hazard of a sweep in one table.
+
+    :param sweep_id: id of the analysis sweep
+    :type sweep_id: int
+
+    :return: combined summary
+    :rtype: dict
+    """
+    analyses = Analysis.objects.filter(sweep_id=sweep_id).select_related(
+        'hazard_layer', 'impact_layer').order_by('id')
+
+    categories = []
+    rows = []
+    for analysis in analyses:
+        row = {
+            'analysis_id': analysis.id,
+            'hazard_layer_id': analysis.hazard_layer_id,
+            'hazard_layer_title': (
+                analysis.hazard_layer.title if (
+                    analysis.hazard_layer) else None),
+            'impact_layer_id': analysis.impact_layer_id,
+            'task_state': analysis.get_task_state(),
+            'total': None,
+            'total_affected': None,
+            'breakdown': {},
+        }
+        if analysis.impact_layer:
+            try:
+                impact_summary = get_analysis_summary(analysis)
+                if impact_summary.is_summary_exists():
+                    row['total'] = impact_summary.total
+                    row['total_affected'] = impact_summary.total_affected
+                    row['breakdown'] = impact_summary.breakdown_dict()
+            except BaseException as e:
+                LOGGER.exception(e)
+        for category in row['breakdown']:
+            if category not in categories:
+                categories.append(category)
+        rows.append(row)
+
+    summary = {
+        'categories': categories,
+        'rows': rows
+    }
+    AnalysisSweep.objects.filter(id=sweep_id).update(
+        summary_json=json.dumps(summary, cls=DjangoJSONEncoder))
+    return summary
 
 
 @app.task(
@@ -399,6 +797,11 @@ def prepare_analysis(analysis_id):
 def process_impact_result(self, impact_result, analysis_id):
     """Extract impact analysis after running it via InaSAFE-Headless celery
 
+    Report generation is not awaited here. Once the impact layer is
+    ingested, the report stage is dispatched as its own chain (see
+    dispatch_report_generation), so this worker is free to pick up the next
+    task while InaSAFE Headless renders the report.
+
     :param self: Task instance
     :type self: celery.task.Task
 
@@ -416,117 +819,447 @@ def process_impact_result(self, impact_result, analysis_id):
     analysis = Analysis.objects.get(id=analysis_id)
 
     success = False
-    report_success = False
     impact_url = None
     impact_path = None
 
     if impact_result['status'] == RESULT_SUCCESS:
-        impact_url = (
-            impact_result['output'].get('impact_analysis') or
-            impact_result['output'].get('hazard_aggregation_summary'))
-        analysis_summary_url = (
-            impact_result['output'].get('analysis_summary'))
+        success, impact_url, impact_path = ingest_impact_output(
+            analysis, impact_result['output'])
 
-        custom_template_path = prepare_custom_template(analysis, impact_url)
+    if not success:
+        LOGGER.info('No impact layer found in {0}'.format(impact_url))
+        Analysis.objects.filter(id=analysis_id).update(task_state='FAILURE')
+        # There will be no report stage, so finish here.
+        clean_up_impact_result(impact_path, analysis_id)
+        return success
 
-        layer_order = prepare_context_layer_order(analysis, impact_url)
+    # generate report when analysis has ran successfully
+    dispatch_report_generation(analysis, impact_url, impact_path)
 
-        # generate report when analysis has ran successfully
-        result = generate_report.delay(
-            impact_url,
-            # If it is None, it will use default headless template
-            custom_report_template_uri=custom_template_path,
-            custom_layer_order=layer_order,
-            locale=analysis.language_code)
+    return success
 
-        retries = 10
-        for r in range(retries):
-            try:
 
-                with allow_join_result():
-                    report_metadata = result.get().get('output', {})
-                break
-            except BaseException as e:
-                if result.state == 'FAILURE':
-                    raise e
-                LOGGER.exception(e)
-                time.sleep(5)
-                result = AsyncResult(result.id)
-                if r >= retries - 1:
-                    # Generate report has failed.
-                    # We need to reraise the error so we know something is
-                    # wrong
-                    raise e
+def ingest_impact_output(analysis, output):
+    """Download impact layer of an analysis output and upload it to GeoNode.
 
-        for product_key, products in report_metadata.iteritems():
-            for report_key, report_url in products.iteritems():
-                report_url = download_file(report_url, direct_access=True)
-                report_metadata[product_key][report_key] = report_url
+    :param analysis: Analysis object
+    :type analysis: Analysis
 
+    :param output: A dictionary of output's layer key and Uri of one
+        analysis, as returned by InaSAFE Headless.
+    :type output: dict
+
+    :return: True if success, the impact URI returned by Headless and the
+        impact path as seen by GeoSAFE
+    :rtype: (bool, basestring, basestring)
+    """
+    success = False
+    impact_url = (
+        output.get('impact_analysis') or
+        output.get('hazard_aggregation_summary'))
+    analysis_summary_url = output.get('analysis_summary')
+    analysis_summary_filename = (
+        os.path.basename(analysis_summary_url) if (
+            analysis_summary_url) else None)
+    aggregation_summary_url = output.get('aggregation_summary')
+    aggregation_summary_filename = (
+        os.path.basename(aggregation_summary_url) if (
+            aggregation_summary_url) else None)
+    if not impact_url:
+        return success, impact_url, None
+
+    with AnalysisStageTiming.measure(
+            analysis.id,
+            AnalysisStageTiming.STAGE_IMPACT_DOWNLOAD) as stage_stats:
         # decide if we are using direct access or not
-        impact_url = get_impact_path(impact_url)
+        impact_path = get_impact_path(impact_url)
+        is_remote = urlparse.urlparse(impact_path).scheme in [
+            'http', 'https']
 
         # download impact layer path
-        impact_path = download_file(impact_url, direct_access=True)
+        impact_path = download_file(impact_path, direct_access=True)
+        if is_remote:
+            stage_stats['bytes_written'] += os.path.getsize(impact_path)
         dir_name = os.path.dirname(impact_path)
         is_zipfile = os.path.splitext(impact_path)[1].lower() == '.zip'
         if is_zipfile:
-            # Extract the layer first
+            # Extract the layer in its own directory, because the report
+            # stage may still need the files next to the archive.
+            # Only the first layer and the summaries are extracted.
+            extract_dir = tempfile.mkdtemp(dir=dir_name)
             with ZipFile(impact_path) as zf:
-                zf.extractall(path=dir_name)
-                for name in zf.namelist():
-                    basename, ext = os.path.splitext(name)
-                    if ext in cov_exts + vec_exts:
-                        # process this in the for loop to make sure it
-                        # works only when we found the layer
-                        success = process_impact_layer(
-                            analysis, dir_name, basename, name)
-                        report_success = process_impact_report(
-                            analysis, report_metadata)
-                        break
-
-                # cleanup
-                for name in zf.namelist():
-                    filepath = os.path.join(dir_name, name)
-                    try:
-                        os.remove(filepath)
-                    except BaseException:
-                        pass
-        else:
-            # It means it is accessing an shp or tif directly
-            analysis_summary_filename = os.path.basename(analysis_summary_url)
-            impact_filename = os.path.basename(impact_path)
-            impact_basename, ext = os.path.splitext(impact_filename)
+                member_names = zf.namelist()
+                layer_names = [
+                    name for name in member_names
+                    if os.path.splitext(name)[1] in cov_exts + vec_exts]
+                extract_names = []
+                if layer_names:
+                    extract_names += layer_member_names(
+                        member_names, layer_names[0])
+                extract_names += [
+                    name for name in member_names
+                    if os.path.basename(name) in [
+                        analysis_summary_filename,
+                        aggregation_summary_filename]]
+                stage_stats['bytes_written'] += extract_zip_members(
+                    zf, extract_names, extract_dir)
+
+    if is_zipfile:
+        if layer_names:
+            # process the first layer found in the archive
+            basename, ext = os.path.splitext(layer_names[0])
             success = process_impact_layer(
-                analysis, dir_name, impact_basename,
-                impact_filename, analysis_summary_filename)
-            report_success = process_impact_report(analysis, report_metadata)
-
-            # cleanup
-            for name in os.listdir(dir_name):
-                filepath = os.path.join(dir_name, name)
-                is_file = os.path.isfile(filepath)
-                should_delete = name.split('.')[0] == impact_basename
-                if is_file and should_delete:
-                    try:
-                        os.remove(filepath)
-                    except BaseException:
-                        pass
-
-    # cleanup
+                analysis, extract_dir, basename, layer_names[0],
+                analysis_summary_filename, aggregation_summary_filename)
+
+        # cleanup
+        shutil.rmtree(extract_dir, ignore_errors=True)
+    else:
+        # It means it is accessing an shp or tif directly
+        impact_filename = os.path.basename(impact_path)
+        impact_basename, ext = os.path.splitext(impact_filename)
+        success = process_impact_layer(
+            analysis, dir_name, impact_basename,
+            impact_filename, analysis_summary_filename,
+            aggregation_summary_filename)
+
+    return success, impact_url, impact_path
+
+
+def match_exposure_outputs(output, analyses):
+    """Match output of each exposure of a multi exposure analysis.
+
+    InaSAFE Headless returns the outputs of each exposure keyed by the
+    impact function name, which contains the exposure name. Each analysis
+    is matched by the category of its exposure layer.
+
+    :param output: Output of multi exposure analysis
+    :type output: dict
+
+    :param analyses: Analyses of the batch
+    :type analyses: list
+
+    :return: Output of each exposure, keyed by analysis id
+    :rtype: dict
+    """
+    def normalize(name):
+        return (name or '').lower().replace('_', ' ')
+
+    exposure_outputs = dict(
+        (normalize(key), value) for key, value in output.iteritems()
+        if isinstance(value, dict))
+
+    matched = {}
+    for analysis in analyses:
+        try:
+            category = normalize(
+                analysis.exposure_layer.inasafe_metadata.category)
+        except (AttributeError, Metadata.DoesNotExist):
+            continue
+        if not category:
+            continue
+        for key in exposure_outputs.keys():
+            if category in key:
+                matched[analysis.id] = exposure_outputs.pop(key)
+                break
+
+    # Unambiguous leftover
+    unmatched = [a for a in analyses if a.id not in matched]
+    if len(unmatched) == 1 and len(exposure_outputs) == 1:
+        matched[unmatched[0].id] = exposure_outputs.values()[0]
+    return matched
+
+
+@app.task(
+    name='geosafe.tasks.analysis.process_batch_impact_result',
+    queue='geosafe')
+def process_batch_impact_result(impact_result, batch_id):
+    """Ingest impact layers of every analysis of a batch.
+
+    Report of each analysis is dispatched as soon as its impact layer is
+    ingested.
+
+    :param impact_result: A dictionary of output's layer key and Uri with
+        status and message, as returned by run_multi_exposure_analysis.
+    :type impact_result: dict
+
+    :param batch_id: id of the analysis batch
+    :type batch_id: int
+
+    :return: True if any impact layer is ingested
+    :rtype: bool
+    """
+    batch = AnalysisBatch.objects.get(id=batch_id)
+    analyses = list(batch.analyses.select_related(
+        'exposure_layer__inasafe_metadata').order_by('id'))
+
+    outputs = {}
+    if impact_result['status'] == RESULT_SUCCESS:
+        outputs = match_exposure_outputs(impact_result['output'], analyses)
+
+    success = False
+    for analysis in analyses:
+        analysis_success = False
+        impact_url = None
+        impact_path = None
+        if analysis.id in outputs:
+            try:
+                analysis_success, impact_url, impact_path = (
+                    ingest_impact_output(analysis, outputs[analysis.id]))
+            except BaseException as e:
+                LOGGER.exception(e)
+
+        if not analysis_success:
+            LOGGER.info('No impact layer found for {0}'.format(analysis))
+            Analysis.objects.filter(id=analysis.id).update(
+                task_state='FAILURE')
+            # There will be no report stage, so finish here.
+            clean_up_impact_result(impact_path, analysis.id)
+            continue
+
+        success = True
+        dispatch_report_generation(analysis, impact_url, impact_path)
+
+    return success
+
+
+def report_task_id(analysis_id):
+    """Celery task id of generate_report task of an analysis.
+
+    Analyses of a batch share the same root task id, so the analysis id is
+    put in the task id. InaSAFE Headless tasks can't receive extra
+    arguments.
+
+    :param analysis_id: analysis id
+    :type analysis_id: int
+
+    :return: unique task id
+    :rtype: str
+    """
+    return '{prefix}{analysis_id}-{uuid}'.format(
+        prefix=REPORT_TASK_ID_PREFIX,
+        analysis_id=analysis_id,
+        uuid=uuid())
+
+
+def report_task_analysis_id(task_id):
+    """Analysis id of a generate_report task id.
+
+    :param task_id: Celery task id
+    :type task_id: str
+
+    :return: analysis id, or None if the task id is not made by
+        report_task_id
+    :rtype: int
+    """
+    if not task_id or not task_id.startswith(REPORT_TASK_ID_PREFIX):
+        return None
+    analysis_id = task_id[len(REPORT_TASK_ID_PREFIX):].split('-', 1)[0]
     try:
-        os.remove(impact_path)
-    except BaseException:
-        pass
+        return int(analysis_id)
+    except ValueError:
+        return None
 
-    if not success:
-        LOGGER.info('No impact layer found in {0}'.format(impact_url))
 
+def dispatch_report_generation(analysis, impact_url, impact_path):
+    """Dispatch report generation of an ingested impact as its own stage.
+
+    Execute in chain:
+    - Generate report in InaSAFE Headless
+    - Process report result
+    - Clean up impact result files and notify the user
+
+    The clean up stage is also linked as errback, so impact result files
+    are removed and the user is notified even if report generation failed.
+
+    :param analysis: Analysis object
+    :type analysis: Analysis
+
+    :param impact_url: The impact URI returned by Headless
+    :type impact_url: basestring
+
+    :param impact_path: The impact path as seen by GeoSAFE
+    :type impact_path: basestring
+
+    :return: Celery Async Result
+    :rtype: celery.result.AsyncResult
+    """
+    custom_template_path = prepare_custom_template(analysis, impact_url)
+
+    layer_order = prepare_context_layer_order(analysis, impact_url)
+
+    clean_up_task = clean_up_impact_result.si(
+        impact_path, analysis.id).set(
+        queue=clean_up_impact_result.queue)
+    tasks_chain = chain(
+        generate_report.s(
+            impact_url,
+            # If it is None, it will use default headless template
+            custom_report_template_uri=custom_template_path,
+            custom_layer_order=layer_order,
+            locale=analysis.language_code).set(
+            queue=generate_report.queue,
+            task_id=report_task_id(analysis.id)),
+        process_report_result.s(analysis.id).set(
+            queue=process_report_result.queue),
+        clean_up_task
+    )
+    return tasks_chain.apply_async(link_error=clean_up_task)
+
+
+@app.task(
+    name='geosafe.tasks.analysis.process_report_result',
+    queue='geosafe')
+def process_report_result(report_result, analysis_id):
+    """Assign reports generated by InaSAFE Headless to the analysis.
+
+    :param report_result: A dictionary of output's report key and Uri with
+        status and message, as returned by generate_report.
+    :type report_result: dict
+
+    :param analysis_id: analysis id of the object
+    :type analysis_id: int
+
+    :return: True if success
+    :rtype: bool
+    """
+    analysis = Analysis.objects.get(id=analysis_id)
+    report_metadata = report_result.get('output', {})
+
+    with AnalysisStageTiming.measure(
+            analysis_id, AnalysisStageTiming.STAGE_REPORT_ASSIGNMENT):
+        for product_key, products in report_metadata.iteritems():
+            for report_key, report_url in products.iteritems():
+                report_url = download_file(report_url, direct_access=True)
+                report_metadata[product_key][report_key] = report_url
+
+        report_success = process_impact_report(analysis, report_metadata)
     if not report_success:
         LOGGER.info('No impact report generated.')
 
+    return report_success
+
+
+@app.task(
+    name='geosafe.tasks.analysis.clean_up_impact_result',
+    queue='geosafe')
+def clean_up_impact_result(impact_path, analysis_id):
+    """Clean up impact result files and notify about the analysis result.
+
+    This is the last stage of an analysis, regardless of report result.
+    The analysis succeeds here if its impact layer was processed, so
+    reports are never offered before they are assigned.
+
+    :param impact_path: The impact path as seen by GeoSAFE
+    :type impact_path: basestring
+
+    :param analysis_id: analysis id of the object
+    :type analysis_id: int
+
+    :return: True
+    :rtype: bool
+    """
+    with AnalysisStageTiming.measure(
+            analysis_id, AnalysisStageTiming.STAGE_CLEANUP):
+        if impact_path:
+            is_zipfile = os.path.splitext(impact_path)[1].lower() == '.zip'
+            if not is_zipfile:
+                # It means it is accessing an shp or tif directly
+                dir_name = os.path.dirname(impact_path)
+                impact_basename, _ = os.path.splitext(
+                    os.path.basename(impact_path))
+                for name in os.listdir(dir_name):
+                    filepath = os.path.join(dir_name, name)
+                    is_file = os.path.isfile(filepath)
+                    should_delete = name.split('.')[0] == impact_basename
+                    if is_file and should_delete:
+                        try:
+                            os.remove(filepath)
+                        except BaseException:
+                            pass
+
+            try:
+                os.remove(impact_path)
+            except BaseException:
+                pass
+
+    # Impact layer processed by this run is still usable, even if report
+    # stage failed.
+    Analysis.objects.filter(
+        id=analysis_id,
+        impact_layer__isnull=False,
+        end_time__gte=F('start_time')).update(task_state='SUCCESS')
+
+    analysis = Analysis.objects.get(id=analysis_id)
+    send_analysis_result_email(analysis)
+
+    if analysis.sweep_id:
+        continue_analysis_sweep.delay(analysis.sweep_id, analysis_id)
+    return True
+
+
+@app.task(
+    name='geosafe.tasks.analysis.clone_analysis_result',
+    queue='geosafe')
+def clone_analysis_result(source_analysis_id, analysis_id):
+    """Copy impact layer and reports of an identical analysis.
+
+    Each analysis owns its impact layer and reports, which are deleted
+    along with the analysis, so they are copied instead of shared.
+
+    :param source_analysis_id: id of finished analysis to copy from
+    :type source_analysis_id: int
+
+    :param analysis_id: analysis id of the object
+    :type analysis_id: int
+
+    :return: True if success
+    :rtype: bool
+    """
+    source_analysis = Analysis.objects.get(id=source_analysis_id)
+    analysis = Analysis.objects.get(id=analysis_id)
+
+    # Copy impact layer files, with analysis summary named as Headless
+    # output, so it is processed the same way.
+    impact_filename = None
+    analysis_summary_filename = None
+    aggregation_summary_filename = None
+    dir_name = tempfile.mkdtemp()
+    try:
+        layer_files = (
+            source_analysis.impact_layer.upload_session.layerfile_set.all())
+        for layer_file in layer_files:
+            filename = os.path.basename(layer_file.file.name)
+            if layer_file.name == ANALYSIS_SUMMARY_FILENAME:
+                filename = analysis_summary_filename = layer_file.name
+            elif layer_file.name == AGGREGATION_SUMMARY_FILENAME:
+                filename = aggregation_summary_filename = layer_file.name
+            elif layer_file.name == 'base':
+                impact_filename = filename
+            shutil.copy(
+                layer_file.file.path, os.path.join(dir_name, filename))
+
+        if not impact_filename:
+            raise IOError('No impact layer found in {0}'.format(
+                source_analysis.impact_layer))
+
+        impact_basename, _ = os.path.splitext(impact_filename)
+        success = process_impact_layer(
+            analysis, dir_name, impact_basename, impact_filename,
+            analysis_summary_filename, aggregation_summary_filename)
+    finally:
+        shutil.rmtree(dir_name, ignore_errors=True)
+
+    analysis.refresh_from_db()
+    analysis.assign_report_map(source_analysis.report_map.path)
+    analysis.assign_report_table(source_analysis.report_table.path)
+    analysis.task_state = 'SUCCESS'
+    analysis.save(update_fields=['report_map', 'report_table', 'task_state'])
+
     send_analysis_result_email(analysis)
 
+    if analysis.sweep_id:
+        continue_analysis_sweep.delay(analysis.sweep_id, analysis_id)
     return success
 
 
@@ -646,19 +1379,47 @@ def prepare_custom_template(analysis, impact_url):
     name='geosafe.tasks.analysis.clean_up_temp_aggregation',
     queue='geosafe')
 def clean_up_temp_aggregation(process_impact_result, analysis_id):
-    """Clean up generated aggregation filter regardless of analysis result.
+    """Release filtered aggregation regardless of analysis result.
+
+    The filtered aggregation is kept in the cache for other analyses, it is
+    only removed when evicted.
+
+    This is the last task of an analysis chain, so the next analysis of a
+    sweep is started from here.
+
+    When it is called as errback, process_impact_result is None and the
+    analysis failed. The failure is recorded here, so a sweep doesn't wait
+    for the task monitor to start its next analysis.
 
     :param process_impact_result:
     :param analysis_id:
     :return:
     """
+    if process_impact_result is None:
+        Analysis.objects.filter(id=analysis_id).exclude(
+            task_state='SUCCESS').update(task_state='FAILURE')
+
     # check does analysis uses aggregation filter
     analysis = Analysis.objects.get(id=analysis_id)
     filtered_aggregation = analysis.filtered_aggregation
-    if filtered_aggregation and os.path.exists(filtered_aggregation):
-        basename, _ = os.path.splitext(filtered_aggregation)
-        for p in glob.glob('{basename}.*'.format(basename=basename)):
-            os.remove(p)
+
+    with AnalysisStageTiming.measure(
+            analysis_id, AnalysisStageTiming.STAGE_CLEANUP):
+        # Only release once, even if this is called again as errback
+        released = filtered_aggregation and Analysis.objects.filter(
+            id=analysis_id,
+            filtered_aggregation=filtered_aggregation).update(
+            filtered_aggregation=None)
+        if released:
+            if FilteredAggregation.release(filtered_aggregation):
+                FilteredAggregation.evict()
+            else:
+                # Temporary file that is not in the cache
+                for p in FilteredAggregation.layer_files(filtered_aggregation):
+                    os.remove(p)
+
+    if analysis.sweep_id:
+        continue_analysis_sweep.delay(analysis.sweep_id, analysis_id)
     return True
 
 
@@ -667,7 +1428,8 @@ def process_impact_layer(
         dir_name,
         impact_basename,
         impact_filename,
-        analysis_summary_filename=None):
+        analysis_summary_filename=None,
+        aggregation_summary_filename=None):
     """Internal function to actually process the layer.
 
     :param analysis: Analysis object
@@ -682,6 +1444,14 @@ def process_impact_layer(
     :param name: the name of the layer path
     :type name: str
 
+    :param analysis_summary_filename: the name of analysis summary file in
+        dir_name, if any
+    :type analysis_summary_filename: str
+
+    :param aggregation_summary_filename: the name of aggregation summary
+        file in dir_name, if any
+    :type aggregation_summary_filename: str
+
     :return: True if success
     """
     # If User is anonymous then let admin upload the impact layer
@@ -695,48 +1465,152 @@ def process_impact_layer(
         # Retain owner to person who initiate the analysis
         upload_user = analysis.user
 
-    # Upload impact layer
-    saved_layer = file_upload(
-        os.path.join(dir_name, impact_filename),
-        user=upload_user)
-
-    # add analysis summary file
-    analysis_summary_basename, type_name = os.path.split(
-        analysis_summary_filename)
-    with open(os.path.join(dir_name, analysis_summary_filename), 'rb') as f:
-        saved_layer.upload_session.layerfile_set.create(
-            name=type_name,
-            base=analysis_summary_basename,
-            file=File(f, name=('%s.%s' % (saved_layer.name, type_name))))
-
-    saved_layer.set_default_permissions()
-    if analysis.user_title:
-        layer_name = analysis.user_title
-    else:
-        layer_name = analysis.get_default_impact_title()
-    saved_layer.title = layer_name
-    saved_layer.save()
+    with AnalysisStageTiming.measure(
+            analysis.id,
+            AnalysisStageTiming.STAGE_FILE_UPLOAD) as stage_stats:
+        # Upload impact layer. GeoNode copies the layer files into its
+        # media storage.
+        impact_path = os.path.join(dir_name, impact_filename)
+        saved_layer = file_upload(impact_path, user=upload_user)
+        layer_dir, layer_filename = os.path.split(impact_path)
+        for name in layer_member_names(
+                os.listdir(layer_dir), layer_filename):
+            stage_stats['bytes_written'] += os.path.getsize(
+                os.path.join(layer_dir, name))
+
+        # add analysis and aggregation summary files
+        for summary_filename in [
+                analysis_summary_filename, aggregation_summary_filename]:
+            summary_path = os.path.join(dir_name, summary_filename or '')
+            if summary_filename and os.path.exists(summary_path):
+                summary_basename, type_name = os.path.split(
+                    summary_filename)
+                stage_stats['bytes_written'] += add_layer_file(
+                    saved_layer, type_name, summary_basename, summary_path)
+
+        saved_layer.set_default_permissions()
+        if analysis.user_title:
+            layer_name = analysis.user_title
+        else:
+            layer_name = analysis.get_default_impact_title()
+        saved_layer.title = layer_name
+        saved_layer.save()
     current_impact = None
     if analysis.impact_layer:
         current_impact = analysis.impact_layer
     analysis.impact_layer = saved_layer
-    analysis.task_state = 'SUCCESS'
-    analysis.end_time = datetime.now().strftime('%Y-%m-%d %H:%M')
+    analysis.end_time = datetime.now()
+    # The analysis succeeds once its reports are processed, see
+    # clean_up_impact_result
     analysis.save(update_fields=[
         'task_id',
-        'task_state',
         'end_time',
         'impact_layer'
     ])
     analysis.refresh_from_db()
     task_info = AnalysisTaskInfo.create_from_analysis(analysis)
     task_info.update_info()
+    try:
+        store_analysis_summary(analysis)
+    except BaseException as e:
+        # The summary is computed again when it is requested
+        LOGGER.exception(e)
     if current_impact:
         current_impact.delete()
     success = True
     return success
 
 
+def store_analysis_summary(analysis):
+    """Compute impact summary of an analysis and store it.
+
+    :param analysis: Analysis object
+    :type analysis: Analysis
+
+    :return: stored summary, or None if there is no impact layer
+    :rtype: AnalysisSummary
+    """
+    if not analysis.impact_layer:
+        return None
+    impact_summary = ImpactSummary(analysis.impact_layer)
+    if not impact_summary.is_keywords_exists():
+        # Keywords may not be processed yet, read them from the metadata
+        try:
+            keywords = parse_inasafe_keywords(
+                analysis.impact_layer.inasafe_metadata.keywords_xml)
+        except Metadata.DoesNotExist:
+            keywords = None
+        impact_summary.impact_keywords = keywords or {}
+    return AnalysisSummary.create_from_impact_summary(
+        analysis, impact_summary)
+
+
+def get_analysis_summary(analysis):
+    """Get stored impact summary of an analysis.
+
+    The summary is computed and stored if it was not stored at ingestion,
+    for example for analyses finished before summaries were stored.
+
+    :param analysis: Analysis object
+    :type analysis: Analysis
+
+    :return: stored summary, or None if there is no impact layer
+    :rtype: AnalysisSummary
+    """
+    try:
+        summary = analysis.impact_summary
+        if summary.impact_layer_id == analysis.impact_layer_id:
+            return summary
+    except AnalysisSummary.DoesNotExist:
+        pass
+    return store_analysis_summary(analysis)
+
+
+def add_layer_file(layer, type_name, base, file_path):
+    """Add a file to the upload session of a layer.
+
+    When the media storage is on the same filesystem, the file is
+    hardlinked into it instead of copied.
+
+    :param layer: GeoNode layer
+    :type layer: Layer
+
+    :param type_name: name of the layer file
+    :type type_name: str
+
+    :param base: base of the layer file
+    :type base: str
+
+    :param file_path: path of the file to add
+    :type file_path: str
+
+    :return: number of bytes written
+    :rtype: int
+    """
+    file_name = '%s.%s' % (layer.name, type_name)
+    layer_file = LayerFile(
+        upload_session=layer.upload_session, name=type_name, base=base)
+    file_field = layer_file._meta.get_field('file')
+    storage = file_field.storage
+    try:
+        storage_name = storage.get_available_name(
+            file_field.generate_filename(layer_file, file_name))
+        storage_path = storage.path(storage_name)
+    except NotImplementedError:
+        # Storage is not on the local filesystem
+        with open(file_path, 'rb') as f:
+            layer_file.file = File(f, name=file_name)
+            layer_file.save()
+        return os.path.getsize(file_path)
+
+    if not os.path.exists(os.path.dirname(storage_path)):
+        os.makedirs(os.path.dirname(storage_path))
+    bytes_written = link_or_copy_file(file_path, storage_path)
+    layer_file.file = storage_name
+    layer_file.save()
+    return bytes_written
+
+
 def process_impact_report(analysis, report_metadata):
     """Internal method to process impact report.
 
@@ -818,6 +1692,8 @@ def check_tasks():
 
     for a in analysis:
 
+        a.reconcile_task_state()
+
         try:
             task_info = a.task_info
         except AnalysisTaskInfo.DoesNotExist:
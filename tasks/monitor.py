@@ -0,0 +1,216 @@
+# coding=utf-8
+"""Record analysis task state transitions in the Analysis model.
+
+Geosafe tasks record their own transitions using Celery signals. Tasks
+executed by InaSAFE Headless workers are recorded from Celery task events,
+consumed by the geosafe_task_monitor management command. The same events
+give the time spent in InaSAFE Headless stages.
+"""
+
+from __future__ import absolute_import
+
+import logging
+from datetime import datetime
+
+from celery.signals import task_prerun, task_failure, task_postrun
+from django.db import close_old_connections
+from django.db.models.query_utils import Q
+
+from geosafe.app_settings import settings
+from geosafe.helpers.http_client import http_client
+from geosafe.models import Analysis, AnalysisStageTiming
+from geosafe.tasks.analysis import (
+    prepare_analysis, clone_analysis_result, process_impact_result,
+    process_report_result, clean_up_impact_result, clean_up_temp_aggregation,
+    prepare_analysis_batch, process_batch_impact_result,
+    report_task_analysis_id)
+from geosafe.tasks.headless.analysis import (
+    run_analysis, run_multi_exposure_analysis, generate_report)
+
+__author__ = 'lucernae'
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Tasks of analysis chain, mapped to the stage name recorded in the model
+ANALYSIS_TASK_STAGES = {
+    prepare_analysis.name: 'prepare_analysis',
+    clone_analysis_result.name: 'clone_analysis_result',
+    run_analysis.name: 'run_analysis',
+    process_impact_result.name: 'process_impact_result',
+    generate_report.name: 'generate_report',
+    process_report_result.name: 'process_report_result',
+    clean_up_impact_result.name: 'clean_up_impact_result',
+    clean_up_temp_aggregation.name: 'clean_up_temp_aggregation',
+    prepare_analysis_batch.name: 'prepare_analysis_batch',
+    run_multi_exposure_analysis.name: 'run_multi_exposure_analysis',
+    process_batch_impact_result.name: 'process_batch_impact_result',
+}
+
+# Celery task events that we record, mapped to task state
+TASK_EVENT_STATES = {
+    'task-started': 'STARTED',
+    'task-failed': 'FAILURE',
+}
+
+# InaSAFE Headless tasks, mapped to the timing stage. Stages executed by
+# GeoSAFE workers are measured by the tasks themselves.
+HEADLESS_TASK_TIMING_STAGES = {
+    run_analysis.name: AnalysisStageTiming.STAGE_HEADLESS_RUN,
+    run_multi_exposure_analysis.name: AnalysisStageTiming.STAGE_HEADLESS_RUN,
+    generate_report.name: AnalysisStageTiming.STAGE_REPORT_GENERATION,
+}
+
+# Celery task events that finish a task, mapped to task success
+TASK_FINISHED_EVENTS = {
+    'task-succeeded': True,
+    'task-failed': False,
+}
+
+
+def update_analysis_task_state(root_id, task_name, state):
+    """Record task state transition of an analysis task chain.
+
+    Analysis task_id is the id of prepare_analysis task, which is the root
+    id of every task in the chain, including the report stage.
+
+    :param root_id: Root task id of the task
+    :type root_id: str
+
+    :param task_name: Celery task name
+    :type task_name: str
+
+    :param state: Task state, either 'STARTED' or 'FAILURE'
+    :type state: str
+
+    :return: number of updated analysis
+    :rtype: int
+    """
+    stage = ANALYSIS_TASK_STAGES.get(task_name)
+    if not root_id or not stage:
+        return 0
+
+    analyses = Analysis.objects.filter(task_id=root_id)
+    if state == 'STARTED':
+        # Only the first stage marks the analysis as started
+        analyses.filter(
+            Q(task_state='PENDING') | Q(task_state__isnull=True)).update(
+            task_state=state)
+    elif state == 'FAILURE':
+        # Impact layer that were already processed is still usable, even if
+        # report stage failed.
+        analyses.exclude(task_state='SUCCESS').update(task_state=state)
+    return analyses.update(task_stage=stage)
+
+
+def record_headless_stage_timing(
+        root_id, task_id, task_name, started, finished, success):
+    """Record time spent by InaSAFE Headless in an analysis task.
+
+    Analyses of a batch share the same root id. The multi exposure analysis
+    is run once for all of them, so it is recorded for every analysis.
+    Reports are generated for each analysis, so report generation is only
+    recorded for the analysis in the task id.
+
+    :param root_id: Root task id of the task
+    :type root_id: str
+
+    :param task_id: Celery task id
+    :type task_id: str
+
+    :param task_name: Celery task name
+    :type task_name: str
+
+    :param started: task started timestamp
+    :type started: float
+
+    :param finished: task succeeded or failed timestamp
+    :type finished: float
+
+    :param success: True if the task succeeded
+    :type success: bool
+
+    :return: number of analyses recorded
+    :rtype: int
+    """
+    stage = HEADLESS_TASK_TIMING_STAGES.get(task_name)
+    if not root_id or not stage or not started or not finished:
+        return 0
+
+    analyses = Analysis.objects.filter(task_id=root_id)
+    if stage != AnalysisStageTiming.STAGE_HEADLESS_RUN:
+        analysis_id = report_task_analysis_id(task_id)
+        if not analysis_id:
+            return 0
+        analyses = analyses.filter(id=analysis_id)
+    analysis_ids = list(analyses.values_list('id', flat=True))
+    AnalysisStageTiming.record(
+        analysis_ids, stage,
+        datetime.fromtimestamp(started), finished - started,
+        success=success)
+    return len(analysis_ids)
+
+
+@task_prerun.connect
+def analysis_task_prerun(sender=None, task=None, **kwargs):
+    """Record the start of analysis task executed by this worker."""
+    update_analysis_task_state(task.request.root_id, task.name, 'STARTED')
+
+
+@task_failure.connect
+def analysis_task_failure(sender=None, **kwargs):
+    """Record the failure of analysis task executed by this worker."""
+    update_analysis_task_state(
+        sender.request.root_id, sender.name, 'FAILURE')
+
+
+@task_postrun.connect
+def flush_http_client_counters(**kwargs):
+    """Add HTTP client counters of this worker to the shared counters.
+
+    Workers may be idle for a long time after their requests, so counters
+    are not left in memory until the next flush interval.
+    """
+    if settings.HTTP_CLIENT_COUNTER_FLUSH_INTERVAL is not None:
+        http_client.flush()
+
+
+def monitor_task_events(app):
+    """Consume Celery task events and record analysis task state.
+
+    This blocks forever, so it is meant to run in its own process.
+
+    :param app: Celery app
+    :type app: celery.Celery
+    """
+    state = app.events.State()
+
+    def on_task_event(event):
+        state.event(event)
+        # Task name and root id are only sent on task-received event, so
+        # we need to take it from the tracked state.
+        task = state.tasks.get(event['uuid'])
+        if not task:
+            return
+        close_old_connections()
+        try:
+            if event['type'] in TASK_EVENT_STATES:
+                update_analysis_task_state(
+                    task.root_id, task.name,
+                    TASK_EVENT_STATES[event['type']])
+            if event['type'] in TASK_FINISHED_EVENTS:
+                record_headless_stage_timing(
+                    task.root_id, task.uuid, task.name, task.started,
+                    event['timestamp'], TASK_FINISHED_EVENTS[event['type']])
+        except BaseException as e:
+            LOGGER.exception(e)
+
+    handlers = {
+        '*': state.event,
+    }
+    for event_type in set(TASK_EVENT_STATES) | set(TASK_FINISHED_EVENTS):
+        handlers[event_type] = on_task_event
+
+    with app.connection() as connection:
+        receiver = app.events.Receiver(connection, handlers=handlers)
+        receiver.capture(limit=None, timeout=None, wakeup=True)
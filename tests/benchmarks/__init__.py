@@ -0,0 +1,60 @@
+# coding=utf-8
+import math
+import os
+from distutils.util import strtobool
+
+try:
+    from osgeo import ogr, osr
+except ImportError:
+    ogr = None
+    osr = None
+
+
+def benchmark_flag_ready():
+    """Flag to tell that benchmark test should run."""
+    benchmark_test_flag = os.environ.get('BENCHMARK_TEST_FLAG', 'False')
+    return strtobool(benchmark_test_flag)
+
+
+def generate_admin_boundary(layer_path, area_count, vertex_count):
+    """Generate admin boundary shapefile with detailed polygons.
+
+    :param layer_path: path of the shapefile
+    :type layer_path: str
+
+    :param area_count: number of areas
+    :type area_count: int
+
+    :param vertex_count: number of vertices of each area
+    :type vertex_count: int
+
+    :return: name of the area name property and a sample of area names
+    :rtype: (str, list)
+    """
+    driver = ogr.GetDriverByName('ESRI Shapefile')
+    data_source = driver.CreateDataSource(layer_path)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    layer = data_source.CreateLayer(
+        os.path.splitext(os.path.basename(layer_path))[0], srs,
+        ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn('area_name', ogr.OFTString))
+    columns = int(math.sqrt(area_count)) + 1
+    for i in range(area_count):
+        center_x = 95 + (i % columns) * 0.5
+        center_y = -10 + (i / columns) * 0.5
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for v in range(vertex_count + 1):
+            angle = 2 * math.pi * v / vertex_count
+            ring.AddPoint_2D(
+                center_x + 0.2 * math.cos(angle),
+                center_y + 0.2 * math.sin(angle))
+        polygon = ogr.Geometry(ogr.wkbPolygon)
+        polygon.AddGeometry(ring)
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField('area_name', 'area {0}'.format(i))
+        feature.SetGeometry(polygon)
+        layer.CreateFeature(feature)
+    data_source = None
+    values = ['area {0}'.format(i) for i in range(0, area_count, 500)]
+    return 'area_name', values
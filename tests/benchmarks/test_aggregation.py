@@ -0,0 +1,78 @@
+# coding=utf-8
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from geonode.layers.utils import file_upload
+from geosafe.helpers.aggregation import (
+    filter_aggregation_local, filter_aggregation_wfs, ogr)
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase
+from geosafe.tests.benchmarks import benchmark_flag_ready, \
+    generate_admin_boundary
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AggregationFilterBenchmark(GeoSAFEIntegrationLiveServerTestCase):
+    """Compare local aggregation filter with QGIS Server WFS.
+
+    By default it uses generated admin boundary layer. Set
+    BENCHMARK_AGGREGATION_LAYER, BENCHMARK_AGGREGATION_PROPERTY and
+    BENCHMARK_AGGREGATION_VALUES (comma separated) to use a real
+    country-level admin boundary layer.
+    """
+
+    # Generated admin boundaries
+    area_count = 5000
+    vertex_count = 200
+
+    def setUp(self):
+        super(AggregationFilterBenchmark, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @unittest.skipUnless(
+        benchmark_flag_ready() and ogr,
+        'Benchmark test was not enabled')
+    def test_filter_aggregation(self):
+        """Benchmark local aggregation filter against WFS."""
+        layer_path = os.environ.get('BENCHMARK_AGGREGATION_LAYER')
+        if layer_path:
+            property_name = os.environ['BENCHMARK_AGGREGATION_PROPERTY']
+            values = os.environ['BENCHMARK_AGGREGATION_VALUES'].split(',')
+        else:
+            layer_path = os.path.join(self.temp_dir, 'admin_boundary.shp')
+            property_name, values = generate_admin_boundary(
+                layer_path, self.area_count, self.vertex_count)
+
+        layer = file_upload(layer_path)
+        qgis_layer = layer.qgis_layer
+
+        wfs_output = os.path.join(self.temp_dir, 'wfs.geojson')
+        start_time = time.time()
+        self.assertTrue(filter_aggregation_wfs(
+            qgis_layer, wfs_output, property_name, values))
+        wfs_elapsed = time.time() - start_time
+
+        local_output = os.path.join(self.temp_dir, 'local.geojson')
+        start_time = time.time()
+        feature_count = filter_aggregation_local(
+            qgis_layer.base_layer_path, local_output, property_name, values)
+        local_elapsed = time.time() - start_time
+
+        self.assertEqual(feature_count, len(values))
+        wfs_features = ogr.Open(wfs_output).GetLayer(0).GetFeatureCount()
+        self.assertEqual(feature_count, wfs_features)
+
+        LOGGER.info(
+            'Filter {0} areas. WFS: {1:.3f} seconds. '
+            'Local: {2:.3f} seconds.'.format(
+                len(values), wfs_elapsed, local_elapsed))
+        self.assertLess(local_elapsed, wfs_elapsed)
+
+        layer.delete()
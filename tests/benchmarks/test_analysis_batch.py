@@ -0,0 +1,90 @@
+# coding=utf-8
+import logging
+import time
+import unittest
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import override_settings
+
+from geonode.layers.utils import file_upload
+from geosafe.forms import AnalysisCreationForm, AnalysisBatchCreationForm
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase, \
+    wait_metadata
+from geosafe.models import Analysis
+from geosafe.tasks.analysis import dispatch_analysis_batch
+from geosafe.tests.benchmarks import benchmark_flag_ready
+
+LOGGER = logging.getLogger(__name__)
+
+
+@override_settings(ANALYSIS_RESULT_CACHE_TTL=0)
+class AnalysisBatchBenchmark(GeoSAFEIntegrationLiveServerTestCase):
+    """Compare analysis batch with sequential analyses of each exposure."""
+
+    exposure_files = [
+        'buildings.geojson',
+        'population_multi_fields.geojson',
+        'landcover.geojson',
+        'places.geojson',
+    ]
+
+    def wait_analyses(self, analyses):
+        """Wait until the impact layer of every analysis is ingested."""
+        pending = list(analyses)
+        while pending:
+            time.sleep(1)
+            for analysis in list(pending):
+                analysis.refresh_from_db()
+                state = analysis.get_task_state()
+                if state in ('SUCCESS', 'FAILURE'):
+                    self.assertEqual(state, 'SUCCESS')
+                    pending.remove(analysis)
+
+    @unittest.skipUnless(
+        benchmark_flag_ready(),
+        'Benchmark test was not enabled')
+    def test_analysis_batch_throughput(self):
+        """Benchmark one hazard against many exposures."""
+        data_helper = self.data_helper
+        hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+        exposures = [
+            file_upload(data_helper.exposure(f)) for f in self.exposure_files]
+        for layer in [hazard] + exposures:
+            wait_metadata(layer)
+
+        # Sequential analyses
+        start_time = time.time()
+        for exposure in exposures:
+            form = AnalysisCreationForm({
+                'hazard_layer': hazard.id,
+                'exposure_layer': exposure.id,
+                'aggregation_layer': '',
+                'keep': False,
+                'extent_option': Analysis.HAZARD_EXPOSURE_CODE
+            }, user=AnonymousUser())
+            self.assertTrue(form.is_valid())
+            self.wait_analyses([form.save()])
+        sequential_elapsed = time.time() - start_time
+
+        # Analysis batch
+        start_time = time.time()
+        form = AnalysisBatchCreationForm({
+            'hazard_layer': hazard.id,
+            'exposure_layers': [l.id for l in exposures],
+        }, user=AnonymousUser())
+        self.assertTrue(form.is_valid())
+        batch = form.save()
+        dispatch_analysis_batch(batch.id)
+        self.wait_analyses(batch.analyses.all())
+        batch_elapsed = time.time() - start_time
+
+        LOGGER.info(
+            'Analysis of {0} exposures. Sequential: {1:.3f} seconds. '
+            'Batch: {2:.3f} seconds.'.format(
+                len(exposures), sequential_elapsed, batch_elapsed))
+        self.assertLess(batch_elapsed, sequential_elapsed)
+
+        Analysis.objects.all().delete()
+        batch.delete()
+        for layer in [hazard] + exposures:
+            layer.delete()
@@ -0,0 +1,116 @@
+# coding=utf-8
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from django.core.urlresolvers import reverse
+
+from geonode.layers.utils import file_upload
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase, \
+    wait_metadata
+from geosafe.models import Analysis, Metadata
+from geosafe.tests.benchmarks import benchmark_flag_ready, \
+    generate_admin_boundary, ogr
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AnalysisCreateBenchmark(GeoSAFEIntegrationLiveServerTestCase):
+    """Measure latency of analysis create endpoint.
+
+    The analysis is only enqueued by the request, so the latency should not
+    depend on the size of aggregation layer.
+    """
+
+    # Generated admin boundaries
+    area_count = 5000
+    vertex_count = 200
+
+    # Number of requests for each case
+    request_count = 10
+
+    def setUp(self):
+        super(AnalysisCreateBenchmark, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def post_latency(self, post_data):
+        """Median latency of create requests.
+
+        :param post_data: analysis form data
+        :type post_data: dict
+
+        :return: median latency in seconds
+        :rtype: float
+        """
+        url = reverse('geosafe:analysis-create')
+        latencies = []
+        for i in range(self.request_count):
+            start_time = time.time()
+            response = self.client.post(url, post_data)
+            latencies.append(time.time() - start_time)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(json.loads(response.content)['success'])
+        latencies.sort()
+        return latencies[len(latencies) / 2]
+
+    @unittest.skipUnless(
+        benchmark_flag_ready() and ogr,
+        'Benchmark test was not enabled')
+    def test_create_latency(self):
+        """Benchmark create endpoint with a large aggregation layer."""
+        data_helper = self.data_helper
+        hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+        exposure = file_upload(data_helper.exposure('buildings.geojson'))
+        wait_metadata(hazard)
+        wait_metadata(exposure)
+
+        layer_path = os.path.join(self.temp_dir, 'admin_boundary.shp')
+        property_name, values = generate_admin_boundary(
+            layer_path, self.area_count, self.vertex_count)
+        aggregation = file_upload(layer_path)
+        # Use bulk_create so it doesn't trigger metadata post save
+        Metadata.objects.filter(layer=aggregation).delete()
+        Metadata.objects.bulk_create([
+            Metadata(layer=aggregation, layer_purpose='aggregation')])
+
+        self.assertTrue(self.client.login(username='admin', password='admin'))
+        post_data = {
+            'hazard_layer': hazard.id,
+            'exposure_layer': exposure.id,
+            'extent_option': Analysis.HAZARD_EXPOSURE_CODE,
+            'keep': False,
+        }
+        base_latency = self.post_latency(post_data)
+
+        post_data.update({
+            'aggregation_layer': aggregation.id,
+            'aggregation_filter': json.dumps({
+                'property_name': property_name,
+                'values': values
+            })
+        })
+        aggregation_latency = self.post_latency(post_data)
+
+        LOGGER.info(
+            'Median create latency. Without aggregation: {0:.3f} seconds. '
+            'With filtered aggregation of {1} areas: {2:.3f} seconds.'.format(
+                base_latency, self.area_count, aggregation_latency))
+        self.assertLess(
+            aggregation_latency, max(2 * base_latency, base_latency + 0.1))
+
+        for analysis in Analysis.objects.all():
+            try:
+                analysis.get_task_result().revoke(terminate=True)
+            except BaseException:
+                pass
+        Analysis.objects.update(impact_layer=None)
+        Analysis.objects.all().delete()
+        for layer in [hazard, exposure, aggregation]:
+            layer.delete()
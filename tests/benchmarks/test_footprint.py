@@ -0,0 +1,90 @@
+# coding=utf-8
+import json
+import logging
+import time
+import unittest
+import uuid
+
+from django.db import connection
+
+from geonode.layers.models import Layer
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase
+from geosafe.models import Metadata
+from geosafe.benchmark import mute_signals
+from geosafe.tests.benchmarks import benchmark_flag_ready
+from geosafe.views.analysis import LayerGroups, parse_bbox
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FootprintBenchmark(GeoSAFEIntegrationLiveServerTestCase):
+
+    # Number of generated layers
+    layer_count = 5000
+
+    # Grid of layers, each layer is 0.1 degree square
+    grid_size = 0.1
+
+    def create_layers(self):
+        """Create a grid of hazard layers with InaSAFE metadata."""
+        columns = int(self.layer_count ** 0.5) + 1
+        metadatas = []
+        with mute_signals():
+            for i in range(self.layer_count):
+                x0 = 100 + (i % columns) * self.grid_size
+                y0 = -10 + (i / columns) * self.grid_size
+                name = 'benchmark_{0}'.format(i)
+                layer = Layer.objects.create(
+                    name=name,
+                    title=name,
+                    typename='geonode:{0}'.format(name),
+                    uuid=str(uuid.uuid4()),
+                    srid='EPSG:4326',
+                    bbox_x0=x0,
+                    bbox_y0=y0,
+                    bbox_x1=x0 + self.grid_size,
+                    bbox_y1=y0 + self.grid_size)
+                metadatas.append(Metadata(
+                    layer=layer,
+                    layer_purpose='hazard',
+                    category='flood',
+                    footprint=Metadata.layer_footprint(layer)))
+        Metadata.objects.bulk_create(metadatas)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE geosafe_metadata')
+
+    @unittest.skipUnless(
+        benchmark_flag_ready(),
+        'Benchmark test was not enabled')
+    def test_bbox_filter(self):
+        """Benchmark bbox filter of layer panel with thousands of layers."""
+        self.create_layers()
+
+        # Bbox covering 4 layers
+        bbox = [100.05, -9.95, 100.15, -9.85]
+        authorized_objects = Layer.objects.all().values('id')
+
+        start_time = time.time()
+        layer_groups = LayerGroups(
+            ['hazard'],
+            bbox=json.dumps(bbox),
+            authorized_objects=authorized_objects)
+        elapsed = time.time() - start_time
+
+        layers, is_filtered = layer_groups.layers('hazard', 'flood')
+        self.assertEqual(len(layers), 4)
+        self.assertTrue(is_filtered)
+
+        LOGGER.info(
+            'Bbox filter of {0} layers took {1:.3f} seconds'.format(
+                self.layer_count, elapsed))
+
+        # Spatial index should be used by the filter
+        metadatas = Metadata.objects.filter(
+            footprint__intersects=parse_bbox(json.dumps(bbox)))
+        sql, params = metadatas.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            query_plan = '\n'.join(row[0] for row in cursor.fetchall())
+        LOGGER.info(query_plan)
+        self.assertIn('Index', query_plan)
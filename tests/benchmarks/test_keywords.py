@@ -0,0 +1,64 @@
+# coding=utf-8
+import logging
+import time
+import unittest
+
+from django.test import override_settings
+
+from geonode.layers.utils import file_upload
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase, \
+    wait_metadata
+from geosafe.models import Metadata
+from geosafe.tests.benchmarks import benchmark_flag_ready
+
+LOGGER = logging.getLogger(__name__)
+
+
+class KeywordsBenchmark(GeoSAFEIntegrationLiveServerTestCase):
+    """Compare upload to ready latency of local keywords parser and
+    InaSAFE Headless get_keywords.
+
+    A layer is ready when its layer purpose is set from the keywords.
+    """
+
+    def upload_latency(self):
+        """Latency of uploading sample layers until they are ready.
+
+        :return: latency of each layer in seconds
+        :rtype: list
+        """
+        layer_files = [
+            self.data_helper.hazard('flood_data.geojson'),
+            self.data_helper.hazard('ash_fall.tif'),
+            self.data_helper.exposure('buildings.geojson'),
+            self.data_helper.exposure('population_multi_fields.geojson'),
+            self.data_helper.aggregation('small_grid.geojson'),
+        ]
+        latencies = []
+        for layer_file in layer_files:
+            start_time = time.time()
+            layer = file_upload(layer_file)
+            wait_metadata(layer, wait_time=0.1, retry_count=12000)
+            latencies.append(time.time() - start_time)
+            self.assertTrue(
+                Metadata.objects.get(layer=layer).layer_purpose)
+            layer.delete()
+        return latencies
+
+    @unittest.skipUnless(
+        benchmark_flag_ready(),
+        'Benchmark test was not enabled')
+    def test_upload_latency(self):
+        """Benchmark upload to ready latency."""
+        with override_settings(INASAFE_LOCAL_KEYWORDS_PARSER=False):
+            headless_latencies = self.upload_latency()
+        local_latencies = self.upload_latency()
+
+        LOGGER.info(
+            'Upload to ready latency of {0} layers. '
+            'InaSAFE Headless: {1:.3f} seconds. '
+            'Local parser: {2:.3f} seconds.'.format(
+                len(local_latencies),
+                sum(headless_latencies),
+                sum(local_latencies)))
+        self.assertLess(sum(local_latencies), sum(headless_latencies))
@@ -0,0 +1,46 @@
+# coding=utf-8
+import logging
+import unittest
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase
+from geosafe.management.commands.geosafe_benchmark import percentile
+from geosafe.models import Analysis
+from geosafe.tests.benchmarks import benchmark_flag_ready
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TestPercentile(SimpleTestCase):
+
+    def test_percentile(self):
+        """Test nearest rank percentile."""
+        values = [15, 20, 35, 40, 50]
+        self.assertEqual(percentile(values, 50), 35)
+        self.assertEqual(percentile(values, 95), 50)
+        self.assertEqual(percentile(values, 0), 15)
+        self.assertIsNone(percentile([], 50))
+
+
+class AnalysisPipelineBenchmark(GeoSAFEIntegrationLiveServerTestCase):
+    """Benchmark GeoSAFE analysis pipeline with fake InaSAFE Headless."""
+
+    @unittest.skipUnless(
+        benchmark_flag_ready(),
+        'Benchmark test was not enabled')
+    def test_pipeline_throughput(self):
+        """Benchmark concurrent analyses."""
+        stdout = StringIO()
+        call_command(
+            'geosafe_benchmark', analyses=8, fake_headless=True,
+            timeout=300, stdout=stdout)
+        output = stdout.getvalue()
+        LOGGER.info(output)
+
+        self.assertIn('8 dispatched, 8 succeeded', output)
+        self.assertIn('p95', output)
+        self.assertIn('Upload impact layer', output)
+        self.assertFalse(Analysis.objects.exists())
@@ -0,0 +1,65 @@
+# coding=utf-8
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import time
+import unittest
+
+from django.http.response import StreamingHttpResponse
+
+from geosafe.helpers.zipstream import ZipStream
+from geosafe.tests.benchmarks import benchmark_flag_ready
+
+LOGGER = logging.getLogger(__name__)
+
+
+def max_rss():
+    """Peak resident set size of current process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ZipStreamBenchmark(unittest.TestCase):
+
+    # Size of generated impact layer, large enough to use ZIP64
+    layer_size = 3 * 1024 * 1024 * 1024
+
+    # Allowed increase of peak memory while serving the archive
+    memory_limit = 64 * 1024
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @unittest.skipUnless(
+        benchmark_flag_ready(),
+        'Benchmark test was not enabled')
+    def test_serve_large_layer(self):
+        """Benchmark memory usage of serving multi-GB layer archive."""
+        layer_path = os.path.join(self.temp_dir, 'impact.tif')
+        with open(layer_path, 'wb') as f:
+            # Sparse file, so it doesn't take disk space
+            f.truncate(self.layer_size)
+
+        zip_stream = ZipStream()
+        zip_stream.write(layer_path)
+        zip_stream.writestr('impact.xml', '<inasafe></inasafe>')
+        response = StreamingHttpResponse(
+            zip_stream, content_type='application/zip')
+
+        rss_before = max_rss()
+        start_time = time.time()
+        archive_size = 0
+        for chunk in response.streaming_content:
+            archive_size += len(chunk)
+        elapsed = time.time() - start_time
+        rss_increase = max_rss() - rss_before
+
+        LOGGER.info(
+            'Served {0} bytes layer as {1} bytes archive in {2:.1f} seconds. '
+            'Peak RSS increased by {3} KB'.format(
+                self.layer_size, archive_size, elapsed, rss_increase))
+        self.assertLess(rss_increase, self.memory_limit)
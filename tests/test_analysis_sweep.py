@@ -0,0 +1,51 @@
+# coding=utf-8
+import time
+
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase
+from geosafe.models import Analysis, AnalysisSweep
+from geosafe.tasks.analysis import clean_up_temp_aggregation, \
+    continue_analysis_sweep
+
+
+class AnalysisSweepTest(GeoSAFEIntegrationLiveServerTestCase):
+
+    def test_sweep_with_failed_analysis(self):
+        """Test that a failed analysis doesn't stall the sweep."""
+        sweep = AnalysisSweep.objects.create(user_title='Scenario')
+        # Use bulk_create so it doesn't trigger analysis post save
+        Analysis.objects.bulk_create([
+            Analysis(
+                sweep=sweep, task_id='succeeded-task-id',
+                task_state='SUCCESS', task_stage='clean_up_impact_result'),
+            Analysis(
+                sweep=sweep, task_id='failed-task-id',
+                task_state='STARTED', task_stage='run_analysis'),
+        ])
+        failed = Analysis.objects.get(task_id='failed-task-id')
+
+        # Failed analysis is still considered running
+        self.assertEqual(continue_analysis_sweep(sweep.id), 0)
+        sweep.refresh_from_db()
+        self.assertIsNone(sweep.end_time)
+
+        # The errback records the failure
+        clean_up_temp_aggregation(None, failed.id)
+        failed.refresh_from_db()
+        self.assertEqual(failed.get_task_state(), 'FAILURE')
+
+        continue_analysis_sweep(sweep.id, failed.id)
+        sweep.refresh_from_db()
+        self.assertTrue(sweep.end_time)
+
+        # The summary is dispatched only once
+        end_time = sweep.end_time
+        continue_analysis_sweep(sweep.id, failed.id)
+        sweep.refresh_from_db()
+        self.assertEqual(sweep.end_time, end_time)
+
+        while not sweep.summary:
+            time.sleep(1)
+            sweep.refresh_from_db()
+        self.assertEqual(
+            [row['task_state'] for row in sweep.summary['rows']],
+            ['SUCCESS', 'FAILURE'])
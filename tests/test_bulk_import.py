@@ -0,0 +1,50 @@
+# coding=utf-8
+import glob
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+
+from geonode.layers.models import Layer
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase
+from geosafe.models import Metadata
+
+
+class BulkImportTest(GeoSAFEIntegrationLiveServerTestCase):
+
+    def setUp(self):
+        super(BulkImportTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_bulk_import(self):
+        """Test importing a directory of layers."""
+        sample_layers = [
+            self.data_helper.hazard('flood_data'),
+            self.data_helper.exposure('buildings'),
+            self.data_helper.aggregation('small_grid'),
+        ]
+        for basename in sample_layers:
+            # Copy layer file together with its xml and qml
+            for path in glob.glob(basename + '.*'):
+                shutil.copy(path, self.temp_dir)
+
+        stdout = StringIO()
+        call_command(
+            'geosafe_bulk_import', self.temp_dir, workers=2, stdout=stdout)
+        self.assertIn('3 parsed', stdout.getvalue())
+
+        # Layer purpose is set without waiting for delayed tasks
+        metadatas = Metadata.objects.filter(
+            layer__in=Layer.objects.all()).order_by('layer_purpose')
+        self.assertEqual(
+            [m.layer_purpose for m in metadatas],
+            ['aggregation', 'exposure', 'hazard'])
+        for metadata in metadatas:
+            self.assertFalse(metadata.keywords_changed())
+
+        for layer in Layer.objects.all():
+            layer.delete()
@@ -0,0 +1,63 @@
+# coding=utf-8
+import json
+import os
+
+from geonode.layers.utils import file_upload
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase, \
+    wait_metadata
+from geosafe.models import Analysis, FilteredAggregation
+from geosafe.tasks.analysis import prepare_aggregation_filter, \
+    clean_up_temp_aggregation
+
+
+class FilteredAggregationTest(GeoSAFEIntegrationLiveServerTestCase):
+
+    def test_filtered_aggregation_cache(self):
+        """Test sharing filtered aggregation between analyses."""
+        aggregation = file_upload(
+            self.data_helper.aggregation('small_grid.geojson'))
+        wait_metadata(aggregation)
+
+        # Same filter, in different order
+        aggregation_filters = [
+            {'property_name': 'area_name', 'values': ['area 1', 'area 2']},
+            {'property_name': 'area_name', 'values': ['area 2', 'area 1']},
+        ]
+        # Use bulk_create so it doesn't trigger analysis post save
+        Analysis.objects.bulk_create([
+            Analysis(
+                aggregation_layer=aggregation,
+                aggregation_filter=json.dumps(f))
+            for f in aggregation_filters])
+        analyses = list(Analysis.objects.order_by('id'))
+
+        for analysis in analyses:
+            prepare_aggregation_filter(analysis.id)
+            analysis.refresh_from_db()
+
+        # Filtered only once
+        entry = FilteredAggregation.objects.get()
+        self.assertEqual(entry.ref_count, 2)
+        self.assertTrue(os.path.exists(entry.path))
+        self.assertEqual(
+            [a.filtered_aggregation for a in analyses],
+            [entry.path, entry.path])
+
+        # Referenced files are never evicted
+        self.assertEqual(FilteredAggregation.evict(max_size=0), 0)
+
+        for analysis in analyses:
+            clean_up_temp_aggregation(True, analysis.id)
+        # Releasing twice doesn't release other analysis reference
+        clean_up_temp_aggregation(True, analyses[0].id)
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.ref_count, 0)
+        self.assertTrue(os.path.exists(entry.path))
+
+        # Evict unused files
+        self.assertEqual(FilteredAggregation.evict(max_size=0), 1)
+        self.assertFalse(FilteredAggregation.layer_files(entry.path))
+
+        Analysis.objects.all().delete()
+        aggregation.delete()
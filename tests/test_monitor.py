@@ -0,0 +1,87 @@
+# coding=utf-8
+
+from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase
+from geosafe.models import Analysis, AnalysisStageTiming
+from geosafe.tasks.analysis import process_impact_result, report_task_id
+from geosafe.tasks.headless.analysis import (
+    run_analysis, run_multi_exposure_analysis, generate_report)
+from geosafe.tasks.monitor import (
+    update_analysis_task_state, record_headless_stage_timing)
+
+
+class TaskMonitorTest(GeoSAFEIntegrationLiveServerTestCase):
+
+    def test_update_analysis_task_state(self):
+        """Test recording task state transition of analysis."""
+        # Use bulk_create so it doesn't trigger analysis post save
+        Analysis.objects.bulk_create([
+            Analysis(task_id='root-task-id', task_state='PENDING')])
+        analysis = Analysis.objects.get(task_id='root-task-id')
+
+        # Unrelated task is not recorded
+        updated = update_analysis_task_state(
+            'root-task-id', 'geosafe.tasks.analysis.check_tasks', 'STARTED')
+        self.assertEqual(updated, 0)
+
+        update_analysis_task_state(
+            'root-task-id', run_analysis.name, 'STARTED')
+        analysis.refresh_from_db()
+        self.assertEqual(analysis.get_task_state(), 'STARTED')
+        self.assertEqual(analysis.task_stage, 'run_analysis')
+
+        # Impact processed
+        update_analysis_task_state(
+            'root-task-id', process_impact_result.name, 'STARTED')
+        Analysis.objects.filter(id=analysis.id).update(task_state='SUCCESS')
+
+        # Report failure doesn't override successful impact processing
+        update_analysis_task_state(
+            'root-task-id', generate_report.name, 'STARTED')
+        update_analysis_task_state(
+            'root-task-id', generate_report.name, 'FAILURE')
+        analysis.refresh_from_db()
+        self.assertEqual(analysis.get_task_state(), 'SUCCESS')
+        self.assertEqual(analysis.task_stage, 'generate_report')
+
+        # Failure of the analysis
+        Analysis.objects.filter(id=analysis.id).update(task_state='STARTED')
+        update_analysis_task_state(
+            'root-task-id', run_analysis.name, 'FAILURE')
+        analysis.refresh_from_db()
+        self.assertEqual(analysis.get_task_state(), 'FAILURE')
+        self.assertEqual(analysis.get_label_class(), 'danger')
+
+    def test_record_headless_stage_timing(self):
+        """Test recording InaSAFE Headless stages of a batch."""
+        # Analyses of a batch share the same root task id
+        Analysis.objects.bulk_create([
+            Analysis(task_id='batch-root-task-id', task_state='PENDING'),
+            Analysis(task_id='batch-root-task-id', task_state='PENDING')])
+        first, second = Analysis.objects.filter(
+            task_id='batch-root-task-id').order_by('id')
+
+        # Multi exposure analysis is recorded for every analysis
+        recorded = record_headless_stage_timing(
+            'batch-root-task-id', 'run-task-id',
+            run_multi_exposure_analysis.name, 100.0, 110.0, True)
+        self.assertEqual(recorded, 2)
+
+        # Report generation is only recorded for its own analysis
+        recorded = record_headless_stage_timing(
+            'batch-root-task-id', report_task_id(second.id),
+            generate_report.name, 110.0, 115.0, True)
+        self.assertEqual(recorded, 1)
+
+        # Report task that is not dispatched by GeoSAFE is not recorded
+        recorded = record_headless_stage_timing(
+            'batch-root-task-id', 'report-task-id',
+            generate_report.name, 110.0, 115.0, True)
+        self.assertEqual(recorded, 0)
+
+        self.assertEqual(
+            list(first.stage_timings.values_list('stage', flat=True)),
+            [AnalysisStageTiming.STAGE_HEADLESS_RUN])
+        self.assertEqual(
+            list(second.stage_timings.values_list('stage', flat=True)),
+            [AnalysisStageTiming.STAGE_HEADLESS_RUN,
+             AnalysisStageTiming.STAGE_REPORT_GENERATION])
@@ -5,15 +5,20 @@ import logging
 import os
 import re
 import tempfile
+import time
 
+from geonode.base.models import ResourceBase
 from geonode.layers.models import Layer
 from lxml import etree
 
 from geonode.layers.utils import file_upload
+from geosafe.helpers.inasafe_helper import parse_inasafe_keywords
+from geosafe.helpers.metadata import sync_inasafe_metadata
 from geosafe.helpers.utils import GeoSAFEIntegrationLiveServerTestCase, \
     wait_metadata
 from geosafe.models import ISO_METADATA_NAMESPACES, \
-    ISO_METADATA_INASAFE_KEYWORD_TAG
+    ISO_METADATA_INASAFE_KEYWORD_TAG, Metadata
+from geosafe.tasks.analysis import inasafe_metadata_fix
 
 LOGGER = logging.getLogger(__file__)
 
@@ -260,3 +265,69 @@ class SignalsTest(GeoSAFEIntegrationLiveServerTestCase):
         os.remove(metadata_filename)
         ash_fall_only_layer.delete()
         ash_fall_layer.delete()
+
+    def test_unchanged_keywords(self):
+        """Test that unchanged keywords are not processed again."""
+        flood_layer = file_upload(
+            self.data_helper.hazard('flood_data.geojson'))
+        wait_metadata(flood_layer)
+
+        metadata = Metadata.objects.get(layer=flood_layer)
+        self.assertEqual(
+            metadata.keywords_hash,
+            Metadata.hash_keywords(metadata.keywords_xml))
+        self.assertFalse(metadata.keywords_changed())
+
+        # InaSAFE 4 keywords are parsed by GeoSAFE
+        keywords = parse_inasafe_keywords(metadata.keywords_xml)
+        self.assertEqual(keywords['layer_purpose'], 'hazard')
+        self.assertEqual(keywords['hazard'], 'flood')
+        self.assertEqual(
+            keywords['inasafe_fields'], {'hazard_value_field': 'state'})
+        self.assertEqual(metadata.keywords, keywords)
+
+        # Editing layer title doesn't change the keywords
+        Metadata.objects.filter(layer=flood_layer).update(
+            keywords_json='{}')
+        flood_layer.title = 'Flood'
+        flood_layer.save()
+
+        metadata = Metadata.objects.get(layer=flood_layer)
+        self.assertFalse(metadata.keywords_changed())
+        self.assertEqual(metadata.keywords, {})
+
+        # Metadata files are not written again if they are the same
+        flood_layer = Layer.objects.get(id=flood_layer.id)
+        xml_path = flood_layer.upload_session.layerfile_set.get(
+            name='xml').file.path
+        qgis_xml_path = flood_layer.qgis_layer.xml_path
+        mtimes = [os.stat(p).st_mtime for p in [xml_path, qgis_xml_path]]
+        time.sleep(1)
+        self.assertFalse(sync_inasafe_metadata(flood_layer))
+        self.assertEqual(
+            [os.stat(p).st_mtime for p in [xml_path, qgis_xml_path]],
+            mtimes)
+        with codecs.open(qgis_xml_path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), flood_layer.metadata_xml)
+
+        # InaSAFE metadata fix repairs catalogue metadata even if the
+        # keywords didn't change
+        root = etree.XML(flood_layer.metadata_xml.encode('utf-8'))
+        for el in root.xpath(
+                ISO_METADATA_INASAFE_KEYWORD_TAG,
+                namespaces=ISO_METADATA_NAMESPACES):
+            el.getparent().remove(el)
+        ResourceBase.objects.filter(id=flood_layer.id).update(
+            metadata_xml=etree.tostring(root, pretty_print=True))
+
+        inasafe_metadata_fix(flood_layer.id)
+
+        flood_layer = Layer.objects.get(id=flood_layer.id)
+        root = etree.XML(flood_layer.metadata_xml.encode('utf-8'))
+        self.assertTrue(root.xpath(
+            ISO_METADATA_INASAFE_KEYWORD_TAG,
+            namespaces=ISO_METADATA_NAMESPACES))
+        with codecs.open(qgis_xml_path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), flood_layer.metadata_xml)
+
+        flood_layer.delete()
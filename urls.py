@@ -11,8 +11,13 @@ from geosafe.views.analysis import (
     layer_metadata,
     layer_keywords,
     layer_archive,
+    layer_vector_tile,
     layer_list, rerun_analysis,
-    analysis_json, toggle_analysis_saved, download_report, layer_panel,
+    analysis_json, analysis_list_json, toggle_analysis_saved,
+    analysis_batch_create, analysis_batch_json,
+    analysis_sweep_create, analysis_sweep_json, analysis_metrics,
+    analysis_statistics,
+    download_report, layer_panel,
     analysis_summary, cancel_analysis, validate_analysis_extent,
     impact_json, layer_geojson)
 
@@ -28,6 +33,41 @@ urlpatterns = patterns(
         AnalysisListView.as_view(),
         name='analysis-list'
     ),
+    url(
+        r'^analysis/list\.json$',
+        analysis_list_json,
+        name='analysis-list-json'
+    ),
+    url(
+        r'^analysis/statistics$',
+        analysis_statistics,
+        name='analysis-statistics'
+    ),
+    url(
+        r'^analysis/metrics$',
+        analysis_metrics,
+        name='analysis-metrics'
+    ),
+    url(
+        r'^analysis/batch/create$',
+        analysis_batch_create,
+        name='analysis-batch-create'
+    ),
+    url(
+        r'^analysis/batch/(?P<batch_id>\d+)\.json$',
+        analysis_batch_json,
+        name='analysis-batch-json'
+    ),
+    url(
+        r'^analysis/sweep/create$',
+        analysis_sweep_create,
+        name='analysis-sweep-create'
+    ),
+    url(
+        r'^analysis/sweep/(?P<sweep_id>\d+)\.json$',
+        analysis_sweep_json,
+        name='analysis-sweep-json'
+    ),
     url(
         r'^analysis/(?P<pk>\d+)$',
         AnalysisDetailView.as_view(),
@@ -58,6 +98,12 @@ urlpatterns = patterns(
         layer_archive,
         name='layer-archive'
     ),
+    url(
+        r'^analysis/layer-vector-tile/(?P<layer_id>\d+)/'
+        r'(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$',
+        layer_vector_tile,
+        name='layer-vector-tile'
+    ),
     url(
         r'^analysis/layer-list/'
         r'(?P<layer_purpose>(hazard|exposure|aggregation|impact))'
@@ -2,28 +2,30 @@ import json
 import logging
 import os
 import re
-import tempfile
+from collections import OrderedDict
+from datetime import datetime, time
 from functools import wraps
-from zipfile import ZipFile
 
-import requests
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import AnonymousUser
-from django.contrib.gis.db.models import GeometryField
 from django.contrib.gis.geos import Polygon
 from django.contrib.gis.geos.geometry import GEOSGeometry
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
-from django.db.models import Func, Value, IntegerField, CharField
-from django.db.models.expressions import F
-from django.db.models.functions import Concat, Substr
+from django.db.models import Count, Sum
 from django.db.models.query_utils import Q
 from django.http.response import HttpResponseServerError, HttpResponse, \
-    HttpResponseBadRequest, HttpResponseRedirect
+    HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse, \
+    HttpResponseNotModified, FileResponse
 from django.shortcuts import render, get_object_or_404
 from django.template.response import TemplateResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, parse_etags, quote_etag
 from django.utils.translation import ugettext as _
 from django.views.generic import (
     ListView, CreateView, DetailView)
+from django.views.static import was_modified_since
 from guardian.shortcuts import get_objects_for_user
 
 from geonode.layers.models import Layer
@@ -33,19 +35,89 @@ from geonode.qgis_server.helpers import (
 from geonode.qgis_server.models import QGISServerLayer
 from geonode.utils import bbox_to_wkt
 from geosafe.app_settings import settings
-from geosafe.forms import (AnalysisCreationForm)
-from geosafe.helpers.impact_summary.summary_base import ImpactSummary
-from geosafe.models import Analysis, Metadata
-from geosafe.signals import analysis_post_save
+from geosafe.forms import (
+    AnalysisCreationForm, AnalysisBatchCreationForm,
+    AnalysisSweepCreationForm)
+from geosafe.helpers.http_client import QGIS_SERVER_ENDPOINT, http_client
+from geosafe.helpers.layer_archive import (
+    get_layer_archive, layer_zip_stream)
+from geosafe.helpers.vector_tile import (
+    VECTOR_TILE_CONTENT_TYPE, get_vector_tile, is_valid_tile)
+from geosafe.helpers.zipstream import ZipStream, CHUNK_SIZE
+from geosafe.models import Analysis, AnalysisBatch, AnalysisSweep, \
+    AnalysisStageTiming, AnalysisSummaryBreakdown, HTTPClientCounter, \
+    Metadata
+from geosafe.tasks.analysis import dispatch_analysis, \
+    dispatch_analysis_batch, dispatch_analysis_sweep, get_analysis_summary
 
 LOGGER = logging.getLogger("geosafe")
 
+# Fields that analysis statistics can be grouped by
+STATISTICS_GROUP_FIELDS = [
+    'hazard_type', 'exposure_type', 'aggregation_area', 'period']
+
+# Time windows of analysis statistics period
+STATISTICS_PERIODS = ['day', 'week', 'month', 'year']
+
 
 logger = logging.getLogger("geonode.geosafe.analysis")
 # refer to base.models.ResourceBase.Meta.permissions
 _VIEW_PERMS = 'base.view_resourcebase'
 
 
+def parse_bbox(bbox):
+    """Parse bbox json string into a polygon.
+
+    :param bbox: Layer bbox to filter in json string [x0,y0,x1,y1]
+    :type bbox: str
+
+    :return: normalized bbox polygon in EPSG:4326
+    :rtype: Polygon
+    """
+    bbox = json.loads(bbox)
+    # normalize bbox
+    if bbox[2] < bbox[0]:
+        temp = bbox[0]
+        bbox[0] = bbox[2]
+        bbox[2] = temp
+    if bbox[3] < bbox[1]:
+        temp = bbox[1]
+        bbox[1] = bbox[3]
+        bbox[3] = temp
+
+    bbox_poly = Polygon.from_bbox(tuple(bbox))
+    bbox_poly.set_srid(4326)
+    return bbox_poly
+
+
+def filter_metadata_by_bbox(metadatas, bbox_poly):
+    """Filter metadata queryset by intersection of layer footprint.
+
+    Layer footprint is stored in EPSG:4326 with a spatial index, so the
+    filter doesn't need to reproject each layer bbox.
+
+    :param metadatas: Metadata queryset
+    :type metadatas: django.db.models.query.QuerySet
+
+    :param bbox_poly: bbox polygon in EPSG:4326
+    :type bbox_poly: Polygon
+
+    :return: filtered metadata queryset
+    :rtype: django.db.models.query.QuerySet
+    """
+    return metadatas.filter(footprint__intersects=bbox_poly)
+
+
+def default_authorized_objects():
+    """Authorized objects of anonymous user.
+
+    :return: queryset of authorized objects (list of dict of id)
+    :rtype: django.db.models.query.QuerySet
+    """
+    user = AnonymousUser()
+    return get_objects_for_user(user, _VIEW_PERMS).values('id')
+
+
 def retrieve_layers(
         purpose, category=None, bbox=None, authorized_objects=None):
     """List all required layers.
@@ -73,66 +145,16 @@ def retrieve_layers(
     if not category:
         category = None
     if bbox:
-        bbox = json.loads(bbox)
-        # normalize bbox
-        if bbox[2] < bbox[0]:
-            temp = bbox[0]
-            bbox[0] = bbox[2]
-            bbox[2] = temp
-        if bbox[3] < bbox[1]:
-            temp = bbox[1]
-            bbox[1] = bbox[3]
-            bbox[3] = temp
-
-        bbox_poly = Polygon.from_bbox(tuple(bbox))
-        bbox_poly.set_srid(4326)
-
-        # Extract from string EPSG:code of field layer__srid
-        # We use length=10 for maximum length
-        # Starting from position 6
-        # EPSG:4326 will extract 4326 of string type
-        srid_extract = Substr(
-                F('layer__srid'), Value(6), Value(10),
-                output_field=IntegerField())
-
-        # Construct WKT representation of bounding box poly geom
-        poly_expression = Concat(
-            Value('SRID='),
-            srid_extract,
-            Value(';POLYGON(('),
-            F('layer__bbox_x0'), Value(' '), F('layer__bbox_y0'), Value(','),
-            F('layer__bbox_x1'), Value(' '), F('layer__bbox_y0'), Value(','),
-            F('layer__bbox_x1'), Value(' '), F('layer__bbox_y1'), Value(','),
-            F('layer__bbox_x0'), Value(' '), F('layer__bbox_y1'), Value(','),
-            F('layer__bbox_x0'), Value(' '), F('layer__bbox_y0'), Value('))'),
-            output_field=CharField()
-        )
-
-        # Convert WKT to Geom type
-        layer_poly = Func(
-            poly_expression,
-            function='ST_GEOMFROMTEXT',
-            output_field=GeometryField())
-
-        # Convert Geom of previous SRID to 4326
-        layer_poly_transform = Func(
-            layer_poly,
-            Value(4326),
-            function='ST_TRANSFORM',
-            output_field=GeometryField())
+        bbox_poly = parse_bbox(bbox)
 
         # Only filters layer where SRID is defined (excluding EPSG:None)
         metadatas_count_filter = Metadata.objects.filter(
             Q(layer_purpose=purpose) &
             ~Q(layer__srid__iexact='EPSG:None'))
 
-        # Create a queryset with extra field called bbox_poly
-        # From the previous constructed function
-        query_set = metadatas_count_filter.annotate(
-            bbox_poly=layer_poly_transform)
-
         # Filter metadata by intersections with a given bbox
-        metadatas = query_set.filter(bbox_poly__intersects=bbox_poly)
+        metadatas = filter_metadata_by_bbox(
+            metadatas_count_filter, bbox_poly)
 
         if category:
             metadatas = metadatas.filter(category=category)
@@ -154,13 +176,109 @@ def retrieve_layers(
     # Filter by permissions
     if not authorized_objects:
         # default to anonymous user permission
-        user = AnonymousUser()
-        authorized_objects = get_objects_for_user(
-            user, _VIEW_PERMS).values('id')
+        authorized_objects = default_authorized_objects()
     metadatas = metadatas.filter(layer__id__in=authorized_objects)
     return Layer.objects.filter(inasafe_metadata__in=metadatas), is_filtered
 
 
+class LayerGroups(object):
+    """InaSAFE layers grouped by layer purpose and category.
+
+    All the layers are fetched with a single query, together with their
+    metadata, then grouped in python. If bbox is given, one more aggregate
+    query is used to count the layers before bbox filter, to tell which
+    groups were filtered.
+    """
+
+    def __init__(self, purposes, bbox=None, authorized_objects=None):
+        """Retrieve layers of the given purposes.
+
+        :param purposes: InaSAFE layer purposes to retrieve
+        :type purposes: list[str]
+
+        :param bbox: Layer bbox to filter in json string [x0,y0,x1,y1]
+        :type bbox: str
+
+        :param authorized_objects: List of authorized objects
+            (list of dict of id)
+        :type authorized_objects: list
+        """
+        # Avoid evaluating authorized objects queryset, it will be used as
+        # a subquery
+        if authorized_objects is None:
+            # default to anonymous user permission
+            authorized_objects = default_authorized_objects()
+
+        metadatas = Metadata.objects.filter(
+            layer_purpose__in=purposes,
+            layer__id__in=authorized_objects)
+
+        unfiltered_counts = None
+        if bbox:
+            bbox_poly = parse_bbox(bbox)
+            # Only filters layer where SRID is defined (excluding EPSG:None)
+            metadatas = metadatas.exclude(layer__srid__iexact='EPSG:None')
+            unfiltered_counts = dict(
+                ((m['layer_purpose'], m['category'] or None), m['total'])
+                for m in metadatas.values(
+                    'layer_purpose', 'category').annotate(
+                    total=Count('pk')))
+            metadatas = filter_metadata_by_bbox(metadatas, bbox_poly)
+
+        layers = Layer.objects.filter(
+            inasafe_metadata__in=metadatas).select_related(
+            'inasafe_metadata').defer(
+            'inasafe_metadata__keywords_xml',
+            'inasafe_metadata__keywords_json')
+
+        self._groups = OrderedDict()
+        for layer in layers:
+            metadata = layer.inasafe_metadata
+            key = (metadata.layer_purpose, metadata.category or None)
+            self._groups.setdefault(key, []).append(layer)
+
+        self._filtered_groups = set()
+        if unfiltered_counts:
+            for key, total in unfiltered_counts.iteritems():
+                if len(self._groups.get(key, [])) != total:
+                    self._filtered_groups.add(key)
+
+    def layers(self, purpose, category=None):
+        """Layers of a given purpose and category.
+
+        :param purpose: InaSAFE layer purpose
+        :type purpose: str
+
+        :param category: InaSAFE layer category. If None, layers of every
+            category of this purpose are returned.
+        :type category: str
+
+        :returns: layers and a status for filtered.
+            Status will return True, if it is filtered.
+        :rtype: list[Layer], bool
+        """
+        layers = []
+        is_filtered = False
+        for key, group in self._groups.iteritems():
+            if key[0] == purpose and (not category or key[1] == category):
+                layers += group
+        for key in self._filtered_groups:
+            if key[0] == purpose and (not category or key[1] == category):
+                is_filtered = True
+        return layers, is_filtered
+
+    def queryset(self, purpose):
+        """Layer queryset of a given purpose, used in form choices.
+
+        :param purpose: InaSAFE layer purpose
+        :type purpose: str
+
+        :rtype: django.db.models.query.QuerySet
+        """
+        layers, __ = self.layers(purpose)
+        return Layer.objects.filter(id__in=[l.id for l in layers])
+
+
 def decorator_sections(f):
     """Decorator for AnalysisCreateView class
     """
@@ -186,12 +304,15 @@ def decorator_sections_panel(f):
     def _decorator(request, bbox=None, **kwargs):
         authorized_objects = get_objects_for_user(
             request.user, _VIEW_PERMS).values('id')
-        sections = AnalysisCreateView.options_panel_dict(
+        layer_groups = AnalysisCreateView.layer_groups(
             authorized_objects=authorized_objects,
             bbox=bbox)
+        sections = AnalysisCreateView.options_panel_dict(
+            layer_groups=layer_groups)
 
         kwargs['sections'] = sections
         kwargs['authorized_objects'] = authorized_objects
+        kwargs['layer_groups'] = layer_groups
 
         response = f(request, bbox, **kwargs)
         return response
@@ -206,12 +327,37 @@ class AnalysisCreateView(CreateView):
     context_object_name = 'analysis'
 
     @classmethod
-    def options_panel_dict(cls, authorized_objects=None, bbox=None):
+    def layer_groups(cls, authorized_objects=None, bbox=None):
+        """Retrieve every layer shown in the options panel at once.
+
+        :return: InaSAFE layers grouped by purpose and category
+        :rtype: LayerGroups
+        """
+        purposes = [
+            settings.HAZARD_DEFINITION['key'],
+            settings.EXPOSURE_DEFINITION['key'],
+            settings.AGGREGATION_DEFINITION['key'],
+            'impact_analysis'
+        ]
+        return LayerGroups(
+            purposes, bbox=bbox, authorized_objects=authorized_objects)
+
+    @classmethod
+    def options_panel_dict(
+            cls, authorized_objects=None, bbox=None, layer_groups=None):
         """Prepare a dictionary to be used in the template view
 
+        :param layer_groups: Layers already retrieved with layer_groups.
+            If None, layers will be retrieved using authorized_objects and
+            bbox.
+        :type layer_groups: LayerGroups
+
         :return: dict containing metadata for options panel
         :rtype: dict
         """
+        if not layer_groups:
+            layer_groups = cls.layer_groups(
+                authorized_objects=authorized_objects, bbox=bbox)
         purposes = [
             settings.HAZARD_DEFINITION,
             settings.EXPOSURE_DEFINITION,
@@ -221,11 +367,7 @@ class AnalysisCreateView(CreateView):
         for p in purposes:
             is_section_filtered = False
             if p['key'] == 'aggregation':
-                layers, is_filtered = retrieve_layers(
-                    p.get('key'),
-                    bbox=bbox,
-                    authorized_objects=authorized_objects
-                )
+                layers, is_filtered = layer_groups.layers(p.get('key'))
                 if is_filtered:
                     is_section_filtered = True
                 section = {
@@ -240,12 +382,8 @@ class AnalysisCreateView(CreateView):
             else:
                 categories = []
                 for idx, c in enumerate(p.get('categories')):
-                    layers, is_filtered = retrieve_layers(
-                        p.get('key'),
-                        c,
-                        bbox=bbox,
-                        authorized_objects=authorized_objects
-                    )
+                    layers, is_filtered = layer_groups.layers(
+                        p.get('key'), c)
                     if is_filtered:
                         is_section_filtered = True
                     category = {
@@ -268,11 +406,7 @@ class AnalysisCreateView(CreateView):
                 }
             sections.append(section)
 
-        impact_layers, is_filtered = retrieve_layers(
-            'impact_analysis',
-            bbox=bbox,
-            authorized_objects=authorized_objects
-        )
+        impact_layers, is_filtered = layer_groups.layers('impact_analysis')
         total_impact_layers = len(impact_layers)
         sections.append({
             'key': 'impact',
@@ -316,21 +450,18 @@ class AnalysisCreateView(CreateView):
         logger.error(kwargs)
         return form_class(**kwargs)
 
-    def post(self, request, *args, **kwargs):
-        super(AnalysisCreateView, self).post(request, *args, **kwargs)
-
-        form_class = self.get_form_class()
-        form = self.get_form(form_class)
-        if form.is_valid():
-            # return retval
-            return HttpResponse(json.dumps({
-                'success': True,
-                'redirect': self.get_success_url()
-            }), content_type='application/json')
-        else:
-            return HttpResponse(json.dumps({
-                'success': False
-            }), content_type='application/json')
+    def form_valid(self, form):
+        # Saving the analysis only enqueues it, see dispatch_analysis
+        self.object = form.save()
+        return HttpResponse(json.dumps({
+            'success': True,
+            'redirect': self.get_success_url()
+        }), content_type='application/json')
+
+    def form_invalid(self, form):
+        return HttpResponse(json.dumps({
+            'success': False
+        }), content_type='application/json')
 
     def get_success_url(self):
         kwargs = {
@@ -345,16 +476,64 @@ class AnalysisCreateView(CreateView):
         return kwargs
 
 
+def analysis_list_queryset(user=None, state=None):
+    """Analysis queryset for analysis list.
+
+    Related objects shown in the list are joined in the same query.
+
+    :param user: Filter by the author of analysis. Either user id or
+        username.
+    :type user: str
+
+    :param state: Filter by analysis task state
+    :type state: str
+
+    :return: Analysis queryset
+    :rtype: django.db.models.query.QuerySet
+    """
+    queryset = Analysis.objects.select_related(
+        'user',
+        'impact_layer',
+        'hazard_layer',
+        'exposure_layer',
+        'task_info').order_by('-impact_layer__date', '-id')
+    if user:
+        if user.isdigit():
+            queryset = queryset.filter(user_id=user)
+        else:
+            queryset = queryset.filter(user__username=user)
+    if state:
+        queryset = queryset.filter(task_state=state)
+    return queryset
+
+
 class AnalysisListView(ListView):
     model = Analysis
     template_name = 'geosafe/analysis/list.html'
     context_object_name = 'analysis_list'
-    queryset = Analysis.objects.all().order_by("-impact_layer__date")
+
+    def get_paginate_by(self, queryset):
+        return settings.ANALYSIS_LIST_PAGE_SIZE
+
+    def get_queryset(self):
+        return analysis_list_queryset(
+            user=self.kwargs.get('user') or self.request.GET.get('user'),
+            state=self.request.GET.get('state'))
 
     @decorator_sections
     def get_context_data(self, **kwargs):
         context = super(AnalysisListView, self).get_context_data(**kwargs)
-        context.update({'user': self.request.user})
+        if self.request.user.username:
+            current_user = self.request.user.username
+        else:
+            current_user = 'AnonymousUser'
+        context.update({
+            'user': self.request.user,
+            'current_user': current_user,
+            'filter_user': self.request.GET.get('user', ''),
+            'filter_state': self.request.GET.get('state', ''),
+            'task_states': ['PENDING', 'STARTED', 'SUCCESS', 'FAILURE'],
+        })
         return context
 
 
@@ -366,6 +545,7 @@ class AnalysisDetailView(DetailView):
     @decorator_sections
     def get_context_data(self, **kwargs):
         context = super(AnalysisDetailView, self).get_context_data(**kwargs)
+        context['stage_timings'] = self.object.stage_timings.all()
         return context
 
 
@@ -388,11 +568,15 @@ def layer_geojson(request):
             'OUTPUTFORMAT': 'GeoJSON'
         }
         qgis_server_url = qgis_server_endpoint(True)
-        response = requests.get(qgis_server_url, params=params)
-
-        return HttpResponse(
-            # json.dumps(response.content), content_type="application/json"
-            response.content, content_type=response.headers.get('content-type')
+        # Relay the features as they come, without holding the whole layer
+        # in memory. Large layers should use layer_vector_tile instead.
+        response = http_client.get(
+            qgis_server_url, params=params, stream=True,
+            endpoint=QGIS_SERVER_ENDPOINT)
+
+        return StreamingHttpResponse(
+            response.iter_content(chunk_size=CHUNK_SIZE),
+            content_type=response.headers.get('content-type')
         )
 
     except Exception as e:
@@ -426,6 +610,10 @@ def layer_tiles(request):
             'layer_name': layer.title,
             'legend_url': layer.get_legend_url()
         }
+        if layer.is_vector():
+            context['vector_tiles_url'] = vector_tiles_url(layer)
+            context['vector_tiles_min_zoom'] = settings.VECTOR_TILE_MIN_ZOOM
+            context['vector_tiles_max_zoom'] = settings.VECTOR_TILE_MAX_ZOOM
 
         return HttpResponse(
             json.dumps(context), content_type="application/json"
@@ -490,24 +678,79 @@ def layer_archive(request, layer_id):
 
     try:
         layer = Layer.objects.get(id=layer_id)
-        tmp = tempfile.mktemp()
-        with ZipFile(tmp, mode='w') as zf:
-            for layer_file in layer.upload_session.layerfile_set.all():
-                base_name = os.path.basename(layer_file.file.name)
-                zf.writestr(
-                    base_name,
-                    layer_file.file.read())
-
         base_file, __ = layer.get_base_file()
         base_file_name, __ = os.path.splitext(
             os.path.basename(base_file.file.path))
-        with open(tmp) as f:
-            response = HttpResponse(f.read(), content_type='application/zip')
+        filename = '{filename}.zip'.format(filename=base_file_name)
+
+        try:
+            archive_path, fingerprint = get_layer_archive(layer)
+        except (IOError, OSError) as e:
+            # Archive cache is not available, stream the archive directly
+            LOGGER.exception(e)
+            response = StreamingHttpResponse(
+                layer_zip_stream(layer), content_type='application/zip')
             response['Content-Disposition'] = (
-                'attachment; filename="{filename}.zip"'.format(
-                    filename=base_file_name))
+                'attachment; filename="{filename}"'.format(
+                    filename=filename))
             return response
 
+        return serve_cached_file(
+            request, archive_path, fingerprint, 'application/zip', filename)
+
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
+def vector_tiles_url(layer):
+    """Url template of vector tiles of a layer.
+
+    :param layer: geonode layer
+    :type layer: geonode.layers.models.Layer
+
+    :return: url with {z}, {x} and {y} placeholders
+    :rtype: str
+    """
+    url = reverse(
+        'geosafe:layer-vector-tile',
+        kwargs={'layer_id': layer.id, 'z': 0, 'x': 0, 'y': 0})
+    return url[:-len('0/0/0.pbf')] + '{z}/{x}/{y}.pbf'
+
+
+def layer_vector_tile(request, layer_id, z, x, y):
+    """request to get a Mapbox Vector Tile of a vector layer
+
+    Tiles below VECTOR_TILE_MIN_ZOOM are empty, with 204 status.
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+
+    z, x, y = int(z), int(x), int(y)
+    if not is_valid_tile(z, x, y):
+        return HttpResponseBadRequest()
+
+    layer = get_object_or_404(Layer, id=layer_id)
+    if not layer.is_vector():
+        return HttpResponseBadRequest()
+
+    if z < settings.VECTOR_TILE_MIN_ZOOM:
+        # Low zoom tiles of large layers are too expensive to generate
+        return HttpResponse(status=204)
+
+    try:
+        tile_path, fingerprint = get_vector_tile(layer, z, x, y)
+        etag = quote_etag(fingerprint)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            with open(tile_path, 'rb') as f:
+                response = HttpResponse(
+                    f.read(), content_type=VECTOR_TILE_CONTENT_TYPE)
+        response['ETag'] = etag
+        return response
+
     except Exception as e:
         LOGGER.exception(e)
         return HttpResponseServerError()
@@ -548,23 +791,14 @@ def layer_panel(request, bbox=None, **kwargs):
         return HttpResponseBadRequest()
 
     try:
-        # both authorized_objects and sections are obtained from decorator
-        authorized_objects = kwargs['authorized_objects']
+        # both layer_groups and sections are obtained from decorator
+        layer_groups = kwargs['layer_groups']
         sections = kwargs['sections']
         form = AnalysisCreationForm(
             user=request.user,
-            exposure_layer=retrieve_layers(
-                'exposure',
-                bbox=bbox,
-                authorized_objects=authorized_objects)[0],
-            hazard_layer=retrieve_layers(
-                'hazard',
-                bbox=bbox,
-                authorized_objects=authorized_objects)[0],
-            aggregation_layer=retrieve_layers(
-                'aggregation',
-                bbox=bbox,
-                authorized_objects=authorized_objects)[0])
+            exposure_layer=layer_groups.queryset('exposure'),
+            hazard_layer=layer_groups.queryset('hazard'),
+            aggregation_layer=layer_groups.queryset('aggregation'))
         context = {
             'sections': sections,
             'form': form,
@@ -701,7 +935,8 @@ def rerun_analysis(request, analysis_id=None):
         except BaseException:
             # in case result is an empty task id
             pass
-        analysis_post_save(None, analysis, True)
+        # The user asked to run it again, so don't reuse previous result
+        dispatch_analysis(analysis.id, use_cache=False)
         return HttpResponseRedirect(
             reverse('geosafe:analysis-list')
         )
@@ -763,6 +998,400 @@ def analysis_json(request, analysis_id):
         return HttpResponseServerError()
 
 
+def analysis_metrics(request):
+    """Export analysis stage timings as Prometheus metrics.
+
+    Counters of the HTTP client of all GeoSAFE processes are exported too.
+
+    :param request:
+    :return:
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+
+    try:
+        stages = AnalysisStageTiming.objects.values(
+            'stage', 'success').annotate(
+            count=Count('id'), duration=Sum('duration'),
+            bytes_written=Sum('bytes_written')).order_by(
+            'stage', 'success')
+        duration_lines = [
+            '# HELP geosafe_analysis_stage_duration_seconds Time spent in '
+            'each stage of analysis pipeline.',
+            '# TYPE geosafe_analysis_stage_duration_seconds summary',
+        ]
+        bytes_lines = [
+            '# HELP geosafe_analysis_stage_written_bytes_total Bytes written '
+            'to disk in each stage of analysis pipeline.',
+            '# TYPE geosafe_analysis_stage_written_bytes_total counter',
+        ]
+        for stage in stages:
+            labels = '{{stage="{stage}",success="{success}"}}'.format(
+                stage=stage['stage'],
+                success='true' if stage['success'] else 'false')
+            duration_lines.append(
+                'geosafe_analysis_stage_duration_seconds_count{0} {1}'.format(
+                    labels, stage['count']))
+            duration_lines.append(
+                'geosafe_analysis_stage_duration_seconds_sum{0} {1}'.format(
+                    labels, repr(float(stage['duration'] or 0))))
+            bytes_lines.append(
+                'geosafe_analysis_stage_written_bytes_total{0} {1}'.format(
+                    labels, stage['bytes_written'] or 0))
+        return HttpResponse(
+            '\n'.join(
+                duration_lines + bytes_lines + http_client_metrics()) + '\n',
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
+def http_client_metrics():
+    """Prometheus metrics of HTTP client counters of all processes.
+
+    Counters of this process are added to the shared counters first. Other
+    processes add theirs every HTTP_CLIENT_COUNTER_FLUSH_INTERVAL seconds
+    and after each Celery task.
+
+    :return: lines of metrics
+    :rtype: list
+    """
+    if settings.HTTP_CLIENT_COUNTER_FLUSH_INTERVAL is not None:
+        http_client.flush()
+
+    request_lines = [
+        '# HELP geosafe_http_client_requests_total HTTP requests sent by '
+        'GeoSAFE processes.',
+        '# TYPE geosafe_http_client_requests_total counter',
+    ]
+    duration_lines = [
+        '# HELP geosafe_http_client_response_seconds Time until response '
+        'headers of HTTP requests sent by GeoSAFE processes.',
+        '# TYPE geosafe_http_client_response_seconds summary',
+    ]
+    bytes_lines = [
+        '# HELP geosafe_http_client_received_bytes_total Bytes of HTTP '
+        'responses received by GeoSAFE processes.',
+        '# TYPE geosafe_http_client_received_bytes_total counter',
+    ]
+    counters = HTTPClientCounter.objects.order_by('endpoint', 'status')
+    for counter in counters:
+        request_lines.append(
+            'geosafe_http_client_requests_total'
+            '{{endpoint="{0}",status="{1}"}} {2}'.format(
+                counter.endpoint, counter.status, counter.requests))
+
+    endpoints = counters.values('endpoint').annotate(
+        count=Sum('requests'), seconds=Sum('seconds'),
+        bytes_received=Sum('bytes_received')).order_by('endpoint')
+    for endpoint in endpoints:
+        labels = '{{endpoint="{0}"}}'.format(endpoint['endpoint'])
+        duration_lines.append(
+            'geosafe_http_client_response_seconds_count{0} {1}'.format(
+                labels, endpoint['count']))
+        duration_lines.append(
+            'geosafe_http_client_response_seconds_sum{0} {1}'.format(
+                labels, repr(float(endpoint['seconds'] or 0))))
+        bytes_lines.append(
+            'geosafe_http_client_received_bytes_total{0} {1}'.format(
+                labels, endpoint['bytes_received']))
+    return request_lines + duration_lines + bytes_lines
+
+
+def parse_statistics_time(value):
+    """Parse time range parameter of analysis statistics.
+
+    :param value: ISO 8601 date or datetime
+    :type value: str
+
+    :return: parsed datetime, or None if it is empty
+    :rtype: datetime
+
+    :raises ValueError: if the value is not a valid date
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if not parsed:
+        parsed_date = parse_date(value)
+        if not parsed_date:
+            raise ValueError('Invalid date {0}'.format(value))
+        parsed = datetime.combine(parsed_date, time.min)
+    return parsed
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def analysis_statistics(request):
+    """Aggregate impact summaries of finished analyses.
+
+    Accepted GET parameters:
+    - group_by: comma separated fields, of hazard_type, exposure_type,
+      aggregation_area and period. Defaults to hazard_type,exposure_type
+    - period: time window of period group, of day, week, month and year.
+      Defaults to week
+    - since, until: range of analysis end time, as ISO 8601 date or datetime
+    - hazard_type, exposure_type, aggregation_area: only include these
+
+    :param request:
+    :return:
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+
+    group_by = [
+        f for f in request.GET.get(
+            'group_by', 'hazard_type,exposure_type').split(',') if f]
+    period = request.GET.get('period', 'week')
+    if not set(group_by).issubset(STATISTICS_GROUP_FIELDS) or (
+            period not in STATISTICS_PERIODS):
+        return HttpResponseBadRequest()
+    try:
+        since = parse_statistics_time(request.GET.get('since'))
+        until = parse_statistics_time(request.GET.get('until'))
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    try:
+        breakdowns = AnalysisSummaryBreakdown.objects.all()
+        for field in ['hazard_type', 'exposure_type', 'aggregation_area']:
+            if field in request.GET:
+                breakdowns = breakdowns.filter(**{field: request.GET[field]})
+        if since:
+            breakdowns = breakdowns.filter(finished__gte=since)
+        if until:
+            breakdowns = breakdowns.filter(finished__lt=until)
+        if 'period' in group_by:
+            breakdowns = breakdowns.extra(
+                select={'period': 'date_trunc(%s, finished)'},
+                select_params=[period])
+
+        rows = breakdowns.values(*group_by).annotate(
+            analysis_count=Count('summary', distinct=True),
+            sum_total=Sum('total'),
+            sum_total_affected=Sum('total_affected')).order_by(*group_by)
+        results = []
+        for row in rows:
+            result = OrderedDict((f, row[f]) for f in group_by)
+            result['analysis_count'] = row['analysis_count']
+            result['total'] = row['sum_total']
+            result['total_affected'] = row['sum_total_affected']
+            results.append(result)
+
+        retval = {
+            'group_by': group_by,
+            'period': period,
+            'results': results
+        }
+        return HttpResponse(
+            json.dumps(retval, cls=DjangoJSONEncoder),
+            content_type="application/json")
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
+def create_analysis_group(
+        request, form_class, dispatch, id_key, json_url_name):
+    """Create and dispatch analyses that run together.
+
+    :param form_class: form of the analysis group
+    :type form_class: geosafe.forms.AnalysisGroupCreationForm
+
+    :param dispatch: function dispatching the group, by its id
+    :type dispatch: callable
+
+    :param id_key: key of group id in the response and in json_url_name
+    :type id_key: str
+
+    :param json_url_name: url name of the group status
+    :type json_url_name: str
+
+    :return: json response with the created analyses, or form errors
+    :rtype: django.http.response.HttpResponse
+    """
+    if request.method != 'POST':
+        return HttpResponseBadRequest()
+
+    form = form_class(
+        request.POST,
+        user=request.user,
+        language_code=request.LANGUAGE_CODE)
+    if not form.is_valid():
+        return HttpResponseBadRequest(json.dumps({
+            'success': False,
+            'errors': json.loads(form.errors.as_json())
+        }), content_type='application/json')
+
+    try:
+        group = form.save()
+        dispatch(group.id)
+        return HttpResponse(json.dumps({
+            'success': True,
+            id_key: group.id,
+            'analyses': list(
+                group.analyses.order_by('id').values_list('id', flat=True)),
+            'redirect': reverse(json_url_name, kwargs={id_key: group.id})
+        }), content_type='application/json')
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
+def analysis_batch_create(request):
+    """Create analyses of one hazard against many exposures.
+
+    Analyses are run together as one multi exposure analysis. Accepted POST
+    parameters are the same as analysis create form, with exposure_layers
+    instead of exposure_layer.
+
+    :param request:
+    :return:
+    """
+    return create_analysis_group(
+        request, AnalysisBatchCreationForm, dispatch_analysis_batch,
+        'batch_id', 'geosafe:analysis-batch-json')
+
+
+def analysis_batch_json(request, batch_id):
+    """Return the status of an analysis batch
+
+    :param request:
+    :param batch_id:
+    :return:
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+
+    batch = get_object_or_404(AnalysisBatch, id=batch_id)
+    try:
+        analyses = batch.analyses.order_by('id')
+        retval = {
+            'batch_id': batch.id,
+            'task_state': batch.get_task_state(),
+            'analyses': [
+                {
+                    'analysis_id': analysis.id,
+                    'exposure_layer_id': analysis.exposure_layer_id,
+                    'impact_layer_id': analysis.impact_layer_id,
+                    'task_state': analysis.get_task_state(),
+                    'task_stage': analysis.task_stage,
+                } for analysis in analyses
+            ]
+        }
+        return HttpResponse(
+            json.dumps(retval), content_type="application/json")
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
+def analysis_sweep_create(request):
+    """Create analyses of many hazards against one exposure.
+
+    Hazard scenarios are analysed in parallel, limited by
+    ANALYSIS_SWEEP_CONCURRENCY. Accepted POST parameters are the same as
+    analysis create form, with hazard_layers instead of hazard_layer.
+
+    :param request:
+    :return:
+    """
+    return create_analysis_group(
+        request, AnalysisSweepCreationForm, dispatch_analysis_sweep,
+        'sweep_id', 'geosafe:analysis-sweep-json')
+
+
+def analysis_sweep_json(request, sweep_id):
+    """Return the status and combined summary of an analysis sweep
+
+    :param request:
+    :param sweep_id:
+    :return:
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+
+    sweep = get_object_or_404(AnalysisSweep, id=sweep_id)
+    try:
+        analyses = sweep.analyses.order_by('id')
+        retval = {
+            'sweep_id': sweep.id,
+            'task_state': sweep.get_task_state(),
+            'analyses': [
+                {
+                    'analysis_id': analysis.id,
+                    'hazard_layer_id': analysis.hazard_layer_id,
+                    'impact_layer_id': analysis.impact_layer_id,
+                    'task_state': analysis.get_task_state(),
+                    'task_stage': analysis.task_stage,
+                } for analysis in analyses
+            ],
+            'summary': sweep.summary
+        }
+        return HttpResponse(
+            json.dumps(retval), content_type="application/json")
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
+def analysis_list_json(request):
+    """Return a page of analysis list
+
+    Accepted GET parameters are user, state, and page, the same as analysis
+    list page.
+
+    :param request:
+    :return:
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+
+    queryset = analysis_list_queryset(
+        user=request.GET.get('user'),
+        state=request.GET.get('state'))
+    paginator = Paginator(queryset, settings.ANALYSIS_LIST_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except (PageNotAnInteger, EmptyPage):
+        return HttpResponseBadRequest()
+
+    try:
+        results = []
+        for analysis in page:
+            impact_layer = analysis.impact_layer
+            results.append({
+                'analysis_id': analysis.id,
+                'user': analysis.user.username if analysis.user else None,
+                'user_title': analysis.user_title,
+                'hazard_layer_id': analysis.hazard_layer_id,
+                'exposure_layer_id': analysis.exposure_layer_id,
+                'impact_layer_id': analysis.impact_layer_id,
+                'impact_layer_name': (
+                    impact_layer.alternate if impact_layer else None),
+                'impact_layer_date': (
+                    impact_layer.date.isoformat() if impact_layer else None),
+                'task_state': analysis.get_task_state(),
+                'task_stage': analysis.task_stage,
+                'start_time': analysis.start_time.isoformat(),
+                'keep': analysis.keep,
+                'has_report_map': bool(analysis.report_map),
+                'has_report_table': bool(analysis.report_table),
+            })
+        retval = {
+            'count': paginator.count,
+            'num_pages': paginator.num_pages,
+            'page': page.number,
+            'results': results
+        }
+        return HttpResponse(
+            json.dumps(retval), content_type="application/json")
+    except Exception as e:
+        LOGGER.exception(e)
+        return HttpResponseServerError()
+
+
 def impact_json(request, impact_id):
     """Return the detail of an impact layer
 
@@ -818,6 +1447,139 @@ def serve_files(file_stream, content_type, filename):
     return response
 
 
+def serve_cached_file(request, path, etag, content_type, filename):
+    """Serve a file that never changes under the same etag.
+
+    Supports conditional request and single byte range request. If
+    LAYER_ARCHIVE_X_ACCEL_REDIRECT is set, the file is sent by the web
+    server instead.
+
+    :param path: path of the file
+    :type path: str
+
+    :param etag: entity tag of the file
+    :type etag: str
+
+    :param content_type: content type of the file
+    :type content_type: str
+
+    :param filename: filename for content disposition
+    :type filename: str
+
+    :rtype: django.http.response.HttpResponseBase
+    """
+    file_stat = os.stat(path)
+    file_size = file_stat.st_size
+    etag = quote_etag(etag)
+    last_modified = http_date(file_stat.st_mtime)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        not_modified = (
+            if_none_match.strip() == '*' or
+            etag in parse_etags(if_none_match))
+    else:
+        not_modified = not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            file_stat.st_mtime, file_size)
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    elif settings.LAYER_ARCHIVE_X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = '{location}/{filename}'.format(
+            location=settings.LAYER_ARCHIVE_X_ACCEL_REDIRECT.rstrip('/'),
+            filename=os.path.basename(path))
+    else:
+        byte_range = parse_byte_range(
+            request.META.get('HTTP_RANGE'), file_size)
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range not in (etag, last_modified):
+            # Requested range is for another version of the file
+            byte_range = None
+
+        if byte_range == (None, None):
+            response = HttpResponse(
+                status=416, content_type=content_type)
+            response['Content-Range'] = 'bytes */{0}'.format(file_size)
+        elif byte_range:
+            start, end = byte_range
+            f = open(path, 'rb')
+            f.seek(start)
+            response = StreamingHttpResponse(
+                file_range_iterator(f, end - start + 1),
+                status=206,
+                content_type=content_type)
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end, file_size)
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(
+                open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = file_size
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Content-Disposition'] = (
+        'attachment; filename="{filename}"'.format(filename=filename))
+    return response
+
+
+def parse_byte_range(range_header, file_size):
+    """Parse Range header with a single byte range.
+
+    :param range_header: Range header value
+    :type range_header: str
+
+    :param file_size: Size of the requested file
+    :type file_size: int
+
+    :return: start and end position of the range (inclusive), (None, None)
+        if the range is not satisfiable, or None if the whole file should be
+        served.
+    :rtype: (int, int)
+    """
+    if not range_header:
+        return None
+    match = re.match(r'^bytes=(\d*)-(\d*)$', range_header.strip())
+    if not match or match.groups() == ('', ''):
+        # Unsupported range, including multiple ranges
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range, the last n bytes
+        start = max(file_size - int(end), 0)
+        end = file_size - 1
+    else:
+        start = int(start)
+        end = min(int(end), file_size - 1) if end else file_size - 1
+    if start >= file_size or start > end:
+        return None, None
+    return start, end
+
+
+def file_range_iterator(f, length, chunk_size=CHUNK_SIZE):
+    """Iterate a file from its current position, for a given length."""
+    try:
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def serve_zip_stream(zip_stream, filename):
+    response = StreamingHttpResponse(
+        zip_stream,
+        content_type='application/zip')
+    response['Content-Disposition'] = 'inline; filename="%s";' % filename
+    return response
+
+
 def download_report(request, analysis_id, data_type='map'):
     """Download the pdf files of the analysis
 
@@ -848,40 +1610,30 @@ def download_report(request, analysis_id, data_type='map'):
                 'application/pdf',
                 '%s_table.pdf' % layer_title)
         elif data_type == 'reports':
-            tmp = tempfile.mktemp()
-            with ZipFile(tmp, mode='w') as zf:
-                zf.writestr(
-                    '%s_map.pdf' % layer_title,
-                    analysis.report_map.read())
-                zf.writestr(
-                    '%s_table.pdf' % layer_title,
-                    analysis.report_table.read())
-
-            return serve_files(
-                open(tmp),
-                'application/zip',
-                '%s_reports.zip' % layer_title)
+            zip_stream = ZipStream()
+            zip_stream.write(
+                analysis.report_map.path, '%s_map.pdf' % layer_title)
+            zip_stream.write(
+                analysis.report_table.path, '%s_table.pdf' % layer_title)
+
+            return serve_zip_stream(
+                zip_stream, '%s_reports.zip' % layer_title)
         elif data_type == 'all':
-            tmp = tempfile.mktemp()
-            with ZipFile(tmp, mode='w') as zf:
-                zf.writestr(
-                    '%s_map.pdf' % layer_title,
-                    analysis.report_map.read())
-                zf.writestr(
-                    '%s_table.pdf' % layer_title,
-                    analysis.report_table.read())
-                layer = analysis.impact_layer
-
-                for layer_file in layer.upload_session.layerfile_set.all():
-                    base_name = os.path.basename(layer_file.file.name)
-                    zf.writestr(
-                        base_name.replace(layer.name, layer.title),
-                        layer_file.file.read())
+            zip_stream = ZipStream()
+            zip_stream.write(
+                analysis.report_map.path, '%s_map.pdf' % layer_title)
+            zip_stream.write(
+                analysis.report_table.path, '%s_table.pdf' % layer_title)
+            layer = analysis.impact_layer
 
-            return serve_files(
-                open(tmp),
-                'application/zip',
-                '%s_download.zip' % layer_title)
+            for layer_file in layer.upload_session.layerfile_set.all():
+                base_name = os.path.basename(layer_file.file.name)
+                zip_stream.write(
+                    layer_file.file.path,
+                    base_name.replace(layer.name, layer.title))
+
+            return serve_zip_stream(
+                zip_stream, '%s_download.zip' % layer_title)
 
         return HttpResponseServerError()
     except Exception as e:
@@ -896,14 +1648,17 @@ def analysis_summary(request, impact_id):
         return HttpResponseBadRequest()
 
     try:
-        analysis = Analysis.objects.get(impact_layer__id=impact_id)
-        summary = ImpactSummary(analysis.impact_layer)
+        analysis = Analysis.objects.select_related(
+            'impact_layer', 'impact_summary', 'hazard_layer__inasafe_metadata',
+            'exposure_layer__inasafe_metadata').get(
+            impact_layer__id=impact_id)
+        summary = get_analysis_summary(analysis)
 
         context = {
             'analysis': analysis,
-            'report_type': summary.exposure_type(),
+            'report_type': summary.exposure_type,
             'report_template': 'geosafe/analysis/summary/%s_report.html' % (
-                summary.exposure_type(), ),
+                summary.exposure_type, ),
             'summary': summary
         }
 
@@ -1,21 +1,35 @@
 # coding=utf-8
 import json
 import logging
+import os
+import shutil
+import tempfile
 import time
+import unittest
+from StringIO import StringIO
+from zipfile import ZipFile
 
 from django.contrib.auth.models import AnonymousUser
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from geonode.layers.models import Layer
 from geonode.layers.utils import file_upload
 from geonode.people.models import Profile
+from geosafe.app_settings import settings
 from geosafe.forms import AnalysisCreationForm
+from geosafe.helpers.impact_summary.summary_base import ImpactSummary
 from geosafe.helpers.inasafe_helper import InaSAFETestData
 from geosafe.helpers.utils import wait_metadata, \
     GeoSAFEIntegrationLiveServerTestCase
-from geosafe.models import Analysis
-from geosafe.views.analysis import retrieve_layers
+from geosafe.helpers.http_client import HTTPClient
+from geosafe.helpers.vector_tile import VECTOR_TILE_CONTENT_TYPE, ogr
+from geosafe.models import Analysis, AnalysisStageTiming, AnalysisSummary, \
+    FilteredAggregation
+from geosafe.views.analysis import retrieve_layers, AnalysisCreateView, \
+    default_authorized_objects
 
 LOGGER = logging.getLogger(__name__)
 
@@ -284,6 +298,224 @@ class ViewsTest(GeoSAFEIntegrationLiveServerTestCase):
 
         hazard.delete()
 
+    def test_options_panel_query_count(self):
+        """Test that options panel layers are retrieved in one query."""
+        data_helper = self.data_helper
+        hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+        exposure = file_upload(data_helper.exposure('buildings.geojson'))
+        aggregation = file_upload(
+            data_helper.aggregation('small_grid.geojson'))
+
+        wait_metadata(hazard)
+        wait_metadata(exposure)
+        wait_metadata(aggregation)
+
+        authorized_objects = default_authorized_objects()
+
+        # One query to fetch all layers, regardless of number of categories
+        with self.assertNumQueries(1):
+            sections = AnalysisCreateView.options_panel_dict(
+                authorized_objects=authorized_objects)
+
+        # Sections should have the same layers as retrieve_layers
+        hazard_section = sections[0]
+        flood_category = hazard_section['categories'][
+            settings.HAZARD_DEFINITION['categories'].index('flood')]
+        self.assertEqual(hazard_section['total_layers'], 1)
+        self.assertEqual(
+            [l.id for l in flood_category['layers']],
+            [l.id for l in retrieve_layers('hazard', 'flood')[0]])
+        self.assertEqual(sections[1]['total_layers'], 1)
+        self.assertEqual(
+            [l.id for l in sections[2]['layers']], [aggregation.id])
+
+        # Filtering by bbox adds only one aggregate query
+        bbox = [106.65, -6.34, 107.01, -6.09]
+        with self.assertNumQueries(2):
+            sections = AnalysisCreateView.options_panel_dict(
+                authorized_objects=authorized_objects,
+                bbox=json.dumps(bbox))
+
+        self.assertEqual(sections[0]['total_layers'], 1)
+
+        hazard.delete()
+        exposure.delete()
+        aggregation.delete()
+
+    @override_settings(ANALYSIS_LIST_PAGE_SIZE=20)
+    def test_analysis_list_query_count(self):
+        """Test that analysis list uses fixed number of queries."""
+        data_helper = self.data_helper
+        hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+        wait_metadata(hazard)
+
+        user = Profile.objects.get(username='norman')
+
+        def create_analysis(count):
+            # Use bulk_create so it doesn't trigger analysis post save
+            Analysis.objects.bulk_create([
+                Analysis(
+                    user=user,
+                    hazard_layer=hazard,
+                    exposure_layer=hazard,
+                    impact_layer=hazard,
+                    task_id='task-{0}'.format(i),
+                    task_state='SUCCESS')
+                for i in range(count)])
+
+        analysis_list_url = reverse('geosafe:analysis-list')
+
+        create_analysis(2)
+        with CaptureQueriesContext(connection) as few_queries:
+            response = self.client.get(analysis_list_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['analysis_list']), 2)
+
+        create_analysis(30)
+        with CaptureQueriesContext(connection) as many_queries:
+            response = self.client.get(analysis_list_url)
+        self.assertEqual(response.status_code, 200)
+        # Only the first page is shown
+        self.assertEqual(len(response.context['analysis_list']), 20)
+        self.assertEqual(len(few_queries), len(many_queries))
+
+        # Filter by user and state
+        response = self.client.get(
+            analysis_list_url, {'user': 'norman', 'state': 'SUCCESS'})
+        self.assertEqual(response.context['paginator'].count, 32)
+        response = self.client.get(
+            analysis_list_url, {'user': 'admin'})
+        self.assertEqual(response.context['paginator'].count, 0)
+        response = self.client.get(
+            analysis_list_url, {'state': 'FAILURE'})
+        self.assertEqual(response.context['paginator'].count, 0)
+
+        # JSON variant
+        response = self.client.get(
+            reverse('geosafe:analysis-list-json'), {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        retval = json.loads(response.content)
+        self.assertEqual(retval['count'], 32)
+        self.assertEqual(retval['num_pages'], 2)
+        self.assertEqual(len(retval['results']), 12)
+        self.assertEqual(retval['results'][0]['user'], 'norman')
+        self.assertEqual(retval['results'][0]['impact_layer_id'], hazard.id)
+
+        # Detach impact layer, so analysis deletion won't delete the layer
+        Analysis.objects.update(impact_layer=None)
+        Analysis.objects.all().delete()
+        hazard.delete()
+
+    def test_layer_archive_cache(self):
+        """Test that layer archive is cached and served conditionally."""
+        cache_dir = tempfile.mkdtemp()
+        with override_settings(LAYER_ARCHIVE_CACHE_DIRECTORY=cache_dir):
+            data_helper = self.data_helper
+            hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+            wait_metadata(hazard)
+
+            archive_url = reverse(
+                'geosafe:layer-archive', kwargs={'layer_id': hazard.id})
+            response = self.client.get(archive_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Accept-Ranges'], 'bytes')
+            content = ''.join(response.streaming_content)
+            etag = response['ETag']
+
+            # Archive is built only once
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            with ZipFile(StringIO(content)) as zf:
+                self.assertIsNone(zf.testzip())
+
+            # Conditional request
+            response = self.client.get(
+                archive_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            # Range request
+            response = self.client.get(archive_url, HTTP_RANGE='bytes=10-19')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(
+                response['Content-Range'],
+                'bytes 10-19/{0}'.format(len(content)))
+            self.assertEqual(
+                ''.join(response.streaming_content), content[10:20])
+
+            response = self.client.get(
+                archive_url, HTTP_RANGE='bytes={0}-'.format(len(content)))
+            self.assertEqual(response.status_code, 416)
+
+            # Layer save without file changes keeps the archive
+            hazard.save()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            response = self.client.get(
+                archive_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+            # Layer deletion invalidates the archive
+            hazard.delete()
+            self.assertEqual(len(os.listdir(cache_dir)), 0)
+        shutil.rmtree(cache_dir)
+
+    @unittest.skipUnless(ogr, 'OGR is not available')
+    def test_layer_vector_tile(self):
+        """Test that vector tiles are generated and cached."""
+        cache_dir = tempfile.mkdtemp()
+        with override_settings(VECTOR_TILE_CACHE_DIRECTORY=cache_dir):
+            data_helper = self.data_helper
+            hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+            wait_metadata(hazard)
+
+            # Tile over Jakarta
+            tile_url = reverse(
+                'geosafe:layer-vector-tile',
+                kwargs={'layer_id': hazard.id, 'z': 10, 'x': 815, 'y': 529})
+            response = self.client.get(tile_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response['Content-Type'], VECTOR_TILE_CONTENT_TYPE)
+            self.assertTrue(response.content)
+            # Features are encoded with their properties
+            self.assertIn('state', response.content)
+            tile_path = os.path.join(
+                cache_dir, str(hazard.id), response['ETag'].strip('"'),
+                '10', '815', '529.pbf')
+            self.assertTrue(os.path.exists(tile_path))
+
+            # Conditional request
+            response = self.client.get(
+                tile_url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+            # Tile outside of the layer
+            response = self.client.get(reverse(
+                'geosafe:layer-vector-tile',
+                kwargs={'layer_id': hazard.id, 'z': 10, 'x': 0, 'y': 0}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, '')
+
+            # Tile below the lowest zoom level is not generated
+            with override_settings(VECTOR_TILE_MIN_ZOOM=11):
+                response = self.client.get(tile_url)
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(response.content, '')
+
+            # Tile outside of the tile grid
+            response = self.client.get(reverse(
+                'geosafe:layer-vector-tile',
+                kwargs={'layer_id': hazard.id, 'z': 1, 'x': 2, 'y': 0}))
+            self.assertEqual(response.status_code, 400)
+
+            # Layer save without file changes keeps the tiles
+            hazard.save()
+            self.assertTrue(os.path.exists(tile_path))
+
+            # Layer deletion invalidates the tiles
+            layer_dir = os.path.join(cache_dir, str(hazard.id))
+            hazard.delete()
+            self.assertEqual(os.listdir(layer_dir), [])
+        shutil.rmtree(cache_dir)
+
     def test_layer_tiles_info(self):
         """Test that layer tiles info were returned."""
         data_helper = self.data_helper
@@ -309,6 +541,14 @@ class ViewsTest(GeoSAFEIntegrationLiveServerTestCase):
         self.assertTrue(
             data['legend_url'].endswith(
                 'qgis-server/legend/flood_data'))
+        self.assertTrue(
+            data['vector_tiles_url'].endswith(
+                '/layer-vector-tile/{0}/{{z}}/{{x}}/{{y}}.pbf'.format(
+                    layer.id)))
+        self.assertEqual(
+            data['vector_tiles_min_zoom'], settings.VECTOR_TILE_MIN_ZOOM)
+        self.assertEqual(
+            data['vector_tiles_max_zoom'], settings.VECTOR_TILE_MAX_ZOOM)
 
         self.assertAlmostEqual(data['layer_bbox_x0'], 106.691, 3)
         self.assertAlmostEqual(data['layer_bbox_x1'], 106.943, 3)
@@ -410,9 +650,9 @@ class AnalysisTest(GeoSAFEIntegrationLiveServerTestCase):
         self.assertEqual(
             impact_layer.inasafe_metadata.layer_purpose, 'impact_analysis')
 
-        # Check if reports are being generated or not
-        self.assertIsNotNone(analysis.report_map)
-        self.assertIsNotNone(analysis.report_table)
+        # Reports are assigned before the analysis succeeds
+        self.assertTrue(analysis.report_map)
+        self.assertTrue(analysis.report_table)
 
         if clean_up:
 
@@ -424,6 +664,153 @@ class AnalysisTest(GeoSAFEIntegrationLiveServerTestCase):
                 layer.delete()
             impact_layer.delete()
 
+        return analysis
+
+    def test_analysis_stage_timings(self):
+        """Test stage timings recorded for an analysis."""
+        data_helper = self.data_helper
+        analysis = self.process_analysis(
+            clean_up=False,
+            hazard_layer=data_helper.hazard('flood_data.geojson'),
+            exposure_layer=data_helper.exposure('buildings.geojson'),
+            user_title="Flood on Buildings with Stage Timings"
+        )
+
+        stages = set(analysis.stage_timings.values_list('stage', flat=True))
+        for stage in [
+                AnalysisStageTiming.STAGE_PREPARE,
+                AnalysisStageTiming.STAGE_IMPACT_DOWNLOAD,
+                AnalysisStageTiming.STAGE_FILE_UPLOAD,
+                AnalysisStageTiming.STAGE_REPORT_ASSIGNMENT]:
+            self.assertIn(stage, stages)
+        for timing in analysis.stage_timings.all():
+            self.assertTrue(timing.success)
+            self.assertGreaterEqual(timing.duration, 0)
+
+        response = self.client.get(reverse('geosafe:analysis-metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'geosafe_analysis_stage_duration_seconds_count{'
+            'stage="file_upload",success="true"}',
+            response.content)
+
+        # HTTP client counters of other processes are exported too
+        worker_client = HTTPClient()
+        worker_client.record('worker', 200, 0.5, bytes_received=10)
+        worker_client.flush()
+        response = self.client.get(reverse('geosafe:analysis-metrics'))
+        self.assertIn(
+            'geosafe_http_client_requests_total{'
+            'endpoint="worker",status="200"} 1',
+            response.content)
+        self.assertIn(
+            'geosafe_http_client_received_bytes_total{endpoint="worker"} 10',
+            response.content)
+
+        response = self.client.get(
+            reverse('geosafe:analysis-detail', kwargs={'pk': analysis.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(response.context['stage_timings']),
+            analysis.stage_timings.count())
+
+        analysis.impact_layer.delete()
+        for layer in [analysis.hazard_layer, analysis.exposure_layer]:
+            layer.delete()
+
+    def test_analysis_summary(self):
+        """Test impact summary stored at ingestion."""
+        data_helper = self.data_helper
+        analysis = self.process_analysis(
+            clean_up=False,
+            hazard_layer=data_helper.hazard('flood_data.geojson'),
+            exposure_layer=data_helper.exposure('buildings.geojson'),
+            user_title="Flood on Buildings with Summary"
+        )
+
+        summary = AnalysisSummary.objects.get(analysis=analysis)
+        self.assertEqual(summary.impact_layer, analysis.impact_layer)
+        self.assertEqual(summary.exposure_type, 'structure')
+        self.assertEqual(summary.hazard_type, 'flood')
+
+        impact_summary = ImpactSummary(analysis.impact_layer)
+        self.assertEqual(summary.total, impact_summary.total())
+        self.assertEqual(
+            summary.total_affected, impact_summary.total_affected())
+        self.assertEqual(
+            summary.breakdown_dict(), impact_summary.breakdown_dict())
+
+        response = self.client.get(reverse(
+            'geosafe:analysis-summary',
+            kwargs={'impact_id': analysis.impact_layer.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary'], summary)
+
+        analysis.impact_layer.delete()
+        for layer in [analysis.hazard_layer, analysis.exposure_layer]:
+            layer.delete()
+
+    def test_analysis_statistics(self):
+        """Test statistics of impact summaries across analyses."""
+        data_helper = self.data_helper
+        analysis = self.process_analysis(
+            clean_up=False,
+            hazard_layer=data_helper.hazard('flood_data.geojson'),
+            exposure_layer=data_helper.exposure('buildings.geojson'),
+            aggregation_layer=data_helper.aggregation('small_grid.geojson'),
+            user_title="Flood on Buildings with Statistics"
+        )
+        summary = analysis.impact_summary
+        areas = summary.breakdowns.exclude(aggregation_area='')
+        self.assertTrue(areas.exists())
+
+        statistics_url = reverse('geosafe:analysis-statistics')
+        # Only for staff
+        response = self.client.get(statistics_url)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(statistics_url)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['hazard_type'], 'flood')
+        self.assertEqual(results[0]['exposure_type'], 'structure')
+        self.assertEqual(results[0]['analysis_count'], 1)
+        self.assertEqual(
+            results[0]['total_affected'],
+            sum(a.total_affected or 0 for a in areas))
+
+        response = self.client.get(statistics_url, {
+            'group_by': 'aggregation_area,period',
+            'period': 'day',
+            'hazard_type': 'flood',
+            'since': analysis.end_time.date().isoformat()})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual(
+            sorted(r['aggregation_area'] for r in results),
+            sorted(a.aggregation_area for a in areas))
+
+        response = self.client.get(statistics_url, {'group_by': 'user'})
+        self.assertEqual(response.status_code, 400)
+
+        # Statistics are kept when the analysis is cleaned up
+        response = self.client.get(statistics_url)
+        statistics = json.loads(response.content)['results']
+        # Impact layer is deleted along with the analysis
+        layers = [
+            analysis.hazard_layer, analysis.exposure_layer,
+            analysis.aggregation_layer]
+        analysis.delete()
+        response = self.client.get(statistics_url)
+        self.assertEqual(
+            json.loads(response.content)['results'], statistics)
+        self.client.logout()
+
+        for layer in layers:
+            layer.delete()
+
     def test_run_analysis_no_aggregation(self):
         """Test running analysis without aggregation."""
         data_helper = self.data_helper
@@ -479,6 +866,177 @@ class AnalysisTest(GeoSAFEIntegrationLiveServerTestCase):
             user_title="Analysis with custom template settings"
         )
 
+    def test_analysis_result_cache(self):
+        """Test reusing the result of identical analysis."""
+        data_helper = self.data_helper
+        self.process_analysis(
+            hazard_layer=data_helper.hazard('flood_data.geojson'),
+            exposure_layer=data_helper.exposure('buildings.geojson'),
+            user_title="Flood on Buildings",
+            clean_up=False
+        )
+        analysis = Analysis.objects.first()
+        while not analysis.report_table:
+            time.sleep(1)
+            analysis.refresh_from_db()
+        self.assertTrue(analysis.fingerprint)
+
+        # Identical analysis
+        form = AnalysisCreationForm({
+            'hazard_layer': analysis.hazard_layer.id,
+            'exposure_layer': analysis.exposure_layer.id,
+            'aggregation_layer': '',
+            'user_title': 'Cached Flood on Buildings',
+            'keep': False,
+            'extent_option': Analysis.HAZARD_EXPOSURE_CODE
+        }, user=AnonymousUser())
+        self.assertTrue(form.is_valid())
+        cached_analysis = form.save()
+        while not (cached_analysis.task_state == 'SUCCESS' and
+                   cached_analysis.report_table):
+            time.sleep(1)
+            cached_analysis.refresh_from_db()
+
+        # Result is copied without running the analysis
+        self.assertEqual(cached_analysis.fingerprint, analysis.fingerprint)
+        self.assertEqual(cached_analysis.task_stage, 'clone_analysis_result')
+        self.assertNotEqual(
+            cached_analysis.impact_layer.id, analysis.impact_layer.id)
+        self.assertEqual(
+            cached_analysis.impact_layer.title, 'Cached Flood on Buildings')
+        self.assertTrue(cached_analysis.report_map)
+
+        layers = [analysis.hazard_layer, analysis.exposure_layer]
+        cached_analysis.delete()
+        analysis.delete()
+        for layer in layers:
+            layer.delete()
+
+    @override_settings(ANALYSIS_RESULT_CACHE_TTL=0)
+    def test_run_analysis_batch(self):
+        """Test running analysis of one hazard against many exposures."""
+        data_helper = self.data_helper
+        hazard = file_upload(data_helper.hazard('flood_data.geojson'))
+        exposures = [
+            file_upload(data_helper.exposure(f)) for f in [
+                'buildings.geojson', 'population_multi_fields.geojson']]
+        for layer in [hazard] + exposures:
+            wait_metadata(layer)
+
+        response = self.client.post(
+            reverse('geosafe:analysis-batch-create'),
+            {
+                'hazard_layer': hazard.id,
+                'exposure_layers': [l.id for l in exposures],
+                'user_title': 'Flood',
+            })
+        self.assertEqual(response.status_code, 200)
+        retval = json.loads(response.content)
+        self.assertTrue(retval['success'])
+        self.assertEqual(len(retval['analyses']), len(exposures))
+
+        batch_state = None
+        while batch_state not in ('SUCCESS', 'FAILURE'):
+            time.sleep(1)
+            response = self.client.get(retval['redirect'])
+            batch_state = json.loads(response.content)['task_state']
+        self.assertEqual(batch_state, 'SUCCESS')
+
+        # Each exposure has its own impact layer
+        analyses = Analysis.objects.filter(
+            id__in=retval['analyses']).order_by('id')
+        self.assertEqual(
+            [a.exposure_layer_id for a in analyses],
+            [l.id for l in exposures])
+        for analysis in analyses:
+            wait_metadata(analysis.impact_layer)
+            self.assertEqual(
+                analysis.impact_layer.inasafe_metadata.layer_purpose,
+                'impact_analysis')
+            self.assertTrue(analysis.user_title.startswith('Flood - '))
+            # Reports are assigned before the batch succeeds
+            self.assertTrue(analysis.report_map)
+
+        Analysis.objects.filter(id__in=retval['analyses']).delete()
+        for layer in [hazard] + exposures:
+            layer.delete()
+
+    def test_analysis_batch_invalid(self):
+        """Test that invalid analysis batch is rejected with errors."""
+        response = self.client.post(
+            reverse('geosafe:analysis-batch-create'),
+            {'user_title': 'Flood'})
+        self.assertEqual(response.status_code, 400)
+        retval = json.loads(response.content)
+        self.assertFalse(retval['success'])
+        self.assertIn('hazard_layer', retval['errors'])
+        self.assertIn('exposure_layers', retval['errors'])
+        self.assertEqual(
+            retval['errors']['hazard_layer'][0]['code'], 'required')
+
+    def test_run_analysis_sweep(self):
+        """Test running analysis of many hazards against one exposure."""
+        data_helper = self.data_helper
+        hazards = [
+            file_upload(data_helper.hazard(f)) for f in [
+                'flood_data.geojson', 'ash_fall.tif']]
+        exposure = file_upload(data_helper.exposure('buildings.geojson'))
+        aggregation = file_upload(
+            data_helper.aggregation('small_grid.geojson'))
+        for layer in hazards + [exposure, aggregation]:
+            wait_metadata(layer)
+
+        response = self.client.post(
+            reverse('geosafe:analysis-sweep-create'),
+            {
+                'hazard_layers': [l.id for l in hazards],
+                'exposure_layer': exposure.id,
+                'aggregation_layer': aggregation.id,
+                'aggregation_filter': json.dumps({
+                    'property_name': 'area_name',
+                    'values': ['area 1', 'area 2']
+                }),
+                'user_title': 'Scenario',
+            })
+        self.assertEqual(response.status_code, 200)
+        retval = json.loads(response.content)
+        self.assertTrue(retval['success'])
+        self.assertEqual(len(retval['analyses']), len(hazards))
+
+        summary = None
+        while not summary:
+            time.sleep(1)
+            response = self.client.get(retval['redirect'])
+            sweep_json = json.loads(response.content)
+            summary = sweep_json['summary']
+        self.assertEqual(sweep_json['task_state'], 'SUCCESS')
+
+        # One summary row for each hazard
+        self.assertEqual(
+            [row['hazard_layer_id'] for row in summary['rows']],
+            [l.id for l in hazards])
+        for row in summary['rows']:
+            self.assertEqual(row['task_state'], 'SUCCESS')
+            self.assertTrue(row['impact_layer_id'])
+
+        # Aggregation was filtered once for the whole sweep
+        self.assertEqual(FilteredAggregation.objects.count(), 1)
+
+        Analysis.objects.filter(id__in=retval['analyses']).delete()
+        for layer in hazards + [exposure, aggregation]:
+            layer.delete()
+
+    def test_analysis_sweep_invalid(self):
+        """Test that invalid analysis sweep is rejected with errors."""
+        response = self.client.post(
+            reverse('geosafe:analysis-sweep-create'),
+            {'hazard_layers': [0], 'user_title': 'Scenario'})
+        self.assertEqual(response.status_code, 400)
+        retval = json.loads(response.content)
+        self.assertFalse(retval['success'])
+        self.assertEqual(
+            sorted(retval['errors']), ['exposure_layer', 'hazard_layers'])
+
     def test_rerun_analysis(self):
         """Test rerunning analysis."""
         # Run the first analysis